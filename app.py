@@ -1,28 +1,122 @@
 import os
+import re
+import json
+import base64
+import csv
+import io
+import atexit
+import bisect
+import hashlib
+import hmac
+import mimetypes
+import posixpath
+import random
+import shutil
+import uuid
+import queue
 import sqlite3
-import requests
+import tempfile
+import threading
+import time
+import unicodedata
+import click
 from flask import Response
-from datetime import datetime
+from datetime import datetime, timezone
+from decimal import Decimal, ROUND_HALF_UP
+from collections import deque, namedtuple, OrderedDict
 from functools import wraps
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken
 
 from flask import (
     Flask, render_template, request, redirect,
-    url_for, session, flash
+    url_for, session, flash, g, jsonify, has_app_context, has_request_context,
+    send_from_directory
 )
-from argon2 import PasswordHasher
-from argon2.exceptions import VerifyMismatchError
-from werkzeug.utils import secure_filename
+from markupsafe import Markup, escape
+from jinja2 import meta
+from werkzeug.exceptions import HTTPException, NotFound
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+
+# requests, argon2, Pillow and multiprocessing are imported where they are
+# first used; together they were over a third of every worker's boot time.
+
+# Module setup from here on is timed by boot(); the imports above are
+# timed by whoever imports the app (gunicorn.conf.py, benchmarks/boot_time.py)
+_boot_started = time.perf_counter()
 
 load_dotenv()
 # ---------------- CONFIG ----------------
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-DB_PATH = os.path.join(BASE_DIR, "database.db")
-UPLOAD_FOLDER = os.path.join(BASE_DIR, "static", "uploads")
+DB_PATH = os.environ.get("DATABASE_PATH", os.path.join(BASE_DIR, "database.db"))
+STATIC_FOLDER = os.path.join(BASE_DIR, "static")
+UPLOAD_FOLDER = os.path.join(STATIC_FOLDER, "uploads")
 KEY_PATH = os.path.join(BASE_DIR, "secret.key")
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "mp4", "mov", "webm", "pdf"}
+IMAGE_EXTENSIONS = {"png", "jpg", "jpeg", "webp"}
+
+# Resized WebP/AVIF copies of uploaded images, served through srcset
+DERIVED_FOLDER = os.path.join(UPLOAD_FOLDER, "_derived")
+IMAGE_WIDTHS = (320, 640, 1280)
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 2))
+
+# Uploads are stored once per content digest under uploads/cas/
+CAS_FOLDER = os.path.join(UPLOAD_FOLDER, "cas")
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Admission documents are parsed straight off the request body
+DOCUMENT_FIELDS = ("birth_certificate", "parent_id_copy", "latest_report", "proof_of_residence")
+DOCUMENT_MAX_SIZE = int(os.environ.get("DOCUMENT_MAX_SIZE", 5 * 1024 * 1024))
+DOCUMENT_SIGNATURES = {
+    "pdf": b"%PDF-",
+    "png": b"\x89PNG\r\n\x1a\n",
+    "jpg": b"\xff\xd8\xff",
+    "jpeg": b"\xff\xd8\xff",
+}
+FORM_FIELD_MAX_SIZE = 64 * 1024
+
+# Fingerprinted, precompressed copies of the static files (see STATIC ASSETS)
+ASSET_FOLDER = os.path.join(STATIC_FOLDER, "_assets")
+ASSET_MANIFEST = os.path.join(ASSET_FOLDER, "manifest.json")
+ASSET_EXTENSIONS = {"css", "js", "png", "jpg", "jpeg", "gif", "svg", "webp", "avif", "ico", "woff", "woff2"}
+ASSET_COMPRESSIBLE = {"css", "js", "svg"}
+ASSET_MAX_AGE = 365 * 24 * 3600
+STATIC_FINGERPRINT = os.environ.get("STATIC_FINGERPRINT", "1") == "1"
+
+# Every process writes its metrics here; /admin/metrics adds them up
+METRICS_DIR = os.environ.get("METRICS_DIR") or os.path.join(
+    tempfile.gettempdir(),
+    "school-metrics-" + hashlib.sha256(DB_PATH.encode()).hexdigest()[:12]
+)
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 5))
+# Lets Prometheus scrape without an admin session
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+# SQLite calls the progress handler once per this many VM instructions
+SQLITE_PROGRESS_STEPS = 1000
+
+# Statements slower than this are logged with their query plan; an empty
+# SLOW_QUERY_LOG keeps them in memory only
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 100))
+SLOW_QUERY_BUFFER = int(os.environ.get("SLOW_QUERY_BUFFER", 200))
+SLOW_QUERY_LOG = os.environ.get(
+    "SLOW_QUERY_LOG", os.path.join(os.path.dirname(DB_PATH), "slow_queries.log")
+)
+SLOW_QUERY_LOG_MAX_BYTES = int(os.environ.get("SLOW_QUERY_LOG_MAX_BYTES", 1024 * 1024))
+SLOW_QUERY_LOG_BACKUPS = int(os.environ.get("SLOW_QUERY_LOG_BACKUPS", 3))
+
+# Profiles of sampled requests, one directory per endpoint; the oldest
+# beyond PROFILE_KEEP are deleted
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(os.path.dirname(DB_PATH), "profiles"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 200))
+# A request carrying a token from /admin/profiles in this header is
+# profiled whether or not sampling is on
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_TOKEN_TTL = 3600
+# How often a worker looks for the sampling switch having changed
+PROFILE_STATE_CHECK = 2.0
+FORM_MAX_PARTS = 32
 
 
 
@@ -32,6 +126,20 @@ app = Flask(__name__)
 
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config["MAX_CONTENT_LENGTH"] = 10 * 1024 * 1024  # 10MB max upload
+app.config["PAGE_SIZE"] = int(os.environ.get("PAGE_SIZE", 24))
+app.config["ADMIN_PAGE_SIZE"] = int(os.environ.get("ADMIN_PAGE_SIZE", 50))
+app.config["CATALOG_CACHE_SIZE"] = int(os.environ.get("CATALOG_CACHE_SIZE", 1024))
+app.config["CATALOG_CACHE_TTL"] = float(os.environ.get("CATALOG_CACHE_TTL", 300))
+app.config["PAGE_CACHE_MAX_AGE"] = int(os.environ.get("PAGE_CACHE_MAX_AGE", 300))
+app.config["PAGE_CACHE_SIZE"] = int(os.environ.get("PAGE_CACHE_SIZE", 256))
+app.config["PAGE_CACHE_TTL"] = float(os.environ.get("PAGE_CACHE_TTL", 3600))
+app.config["PII_CACHE_SIZE"] = int(os.environ.get("PII_CACHE_SIZE", 2000))
+app.config["PII_CACHE_TTL"] = float(os.environ.get("PII_CACHE_TTL", 300))
+app.config["CART_CACHE_SIZE"] = int(os.environ.get("CART_CACHE_SIZE", 4096))
+app.config["CART_CACHE_TTL"] = float(os.environ.get("CART_CACHE_TTL", 600))
+app.config["CART_MAX_AGE_DAYS"] = int(os.environ.get("CART_MAX_AGE_DAYS", 30))
+app.config["CART_MAX_QUANTITY"] = int(os.environ.get("CART_MAX_QUANTITY", 99))
+app.config["CART_MAX_LINES"] = int(os.environ.get("CART_MAX_LINES", 200))
 # ---------------- PAYFAST CONFIG ----------------
 app.secret_key = os.environ.get("FLASK_SECRET_KEY")
 MERCHANT_ID = os.environ.get("PAYFAST_MERCHANT_ID")
@@ -42,7 +150,30 @@ ADMIN_PASSWORD_HASH= os.environ.get("ADMIN_PASSWORD_HASH")
 
 
 
-PAYFAST_ITN_VALIDATION_URL = "https://sandbox.payfast.co.za/eng/query/validate"
+PAYFAST_ITN_VALIDATION_URL = os.environ.get(
+    "PAYFAST_ITN_VALIDATION_URL",
+    "https://sandbox.payfast.co.za/eng/query/validate"
+)
+
+# ITNs are acknowledged at once and validated by a background worker:
+# `flask --app app itn-worker`, the Procfile's worker process. With
+# ITN_INLINE_WORKER=1 every web process that receives one starts its own
+# polling thread instead, which is only meant for a single-process setup.
+ITN_INLINE_WORKER = os.environ.get("ITN_INLINE_WORKER", "0") == "1"
+ITN_POLL_INTERVAL = float(os.environ.get("ITN_POLL_INTERVAL", 5))
+ITN_MAX_ATTEMPTS = int(os.environ.get("ITN_MAX_ATTEMPTS", 8))
+ITN_RETRY_BASE = float(os.environ.get("ITN_RETRY_BASE", 5))
+ITN_RETRY_MAX = float(os.environ.get("ITN_RETRY_MAX", 3600))
+ITN_LEASE = float(os.environ.get("ITN_LEASE", 60))
+# A due ITN nobody has picked up for this long means no worker is running
+ITN_STUCK_AFTER = float(os.environ.get("ITN_STUCK_AFTER", 300))
+
+# Validation calls share one keep-alive session per worker
+PAYFAST_CONNECT_TIMEOUT = float(os.environ.get("PAYFAST_CONNECT_TIMEOUT", 3.05))
+PAYFAST_READ_TIMEOUT = float(os.environ.get("PAYFAST_READ_TIMEOUT", 10))
+PAYFAST_POOL_SIZE = int(os.environ.get("PAYFAST_POOL_SIZE", 4))
+PAYFAST_BREAKER_THRESHOLD = int(os.environ.get("PAYFAST_BREAKER_THRESHOLD", 5))
+PAYFAST_BREAKER_RESET = float(os.environ.get("PAYFAST_BREAKER_RESET", 30))
 
 PAYFAST_MODE = "sandbox"  # change to "live" later
 
@@ -63,7 +194,16 @@ NOTIFY_URL = os.environ.get("NOTIFY_URL", "http://127.0.0.1:5000/payment/itn")
 
 
 
-ph = PasswordHasher()
+_password_hasher = None
+
+
+def password_hasher():
+    global _password_hasher
+    if _password_hasher is None:
+        from argon2 import PasswordHasher
+        _password_hasher = PasswordHasher()
+    return _password_hasher
+
 
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -73,11 +213,22 @@ def load_or_create_key():
     if os.path.exists(KEY_PATH):
         with open(KEY_PATH, "rb") as f:
             return f.read()
-    else:
-        key = Fernet.generate_key()
-        with open(KEY_PATH, "wb") as f:
-            f.write(key)
-        return key
+    # Write the key aside, then link it into place: link() fails if another
+    # process got there first, so every worker ends up with the same key
+    key = Fernet.generate_key()
+    tmp = f"{KEY_PATH}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(key)
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        os.link(tmp, KEY_PATH)
+    except FileExistsError:
+        with open(KEY_PATH, "rb") as f:
+            key = f.read()
+    finally:
+        os.remove(tmp)
+    return key
 
 ENCRYPTION_KEY = load_or_create_key()
 cipher = Fernet(ENCRYPTION_KEY)
@@ -92,33 +243,1625 @@ def decrypt_text(text):
         return ""
     return cipher.decrypt(text.encode()).decode()
 
+# ---------------- ORDER BLIND INDEX ----------------
+# Customer names and phones are stored encrypted, so SQL cannot search
+# them. Instead each order gets keyed HMACs of the normalized values
+# (whole name, name-token prefixes, whole phone, last four digits) in
+# order_blind_index, and the admin filters look those up exactly.
+
+BLIND_INDEX_KEY = (
+    os.environ.get("BLIND_INDEX_KEY", "").encode()
+    or hmac.new(ENCRYPTION_KEY, b"order blind index", hashlib.sha256).digest()
+)
+NAME_PREFIX_MIN = 2
+NAME_PREFIX_MAX = 10
+
+
+def blind_index(kind, value):
+    return hmac.new(BLIND_INDEX_KEY, f"{kind}:{value}".encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def name_tokens(name):
+    """Casefolded words with accents stripped: "Zoë  O'Neil" -> zoe, o, neil."""
+    text = unicodedata.normalize("NFKD", name or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    return re.findall(r"\w+", text)
+
+
+def normalize_phone(phone):
+    """Digits only, with +27/27 numbers rewritten to the local 0 form."""
+    digits = re.sub(r"\D", "", phone or "")
+    if digits.startswith("27") and len(digits) == 11:
+        digits = "0" + digits[2:]
+    return digits
+
+
+def order_index_terms(name, phone):
+    terms = set()
+    tokens = name_tokens(name)
+    if tokens:
+        terms.add(("name", blind_index("name", " ".join(tokens))))
+    for token in tokens:
+        for length in range(NAME_PREFIX_MIN, min(len(token), NAME_PREFIX_MAX) + 1):
+            terms.add(("name_prefix", blind_index("name_prefix", token[:length])))
+    digits = normalize_phone(phone)
+    if digits:
+        terms.add(("phone", blind_index("phone", digits)))
+    if len(digits) >= 4:
+        terms.add(("phone_tail", blind_index("phone_tail", digits[-4:])))
+    return terms
+
+
+def index_order(conn, order_id, name, phone):
+    """Replace the blind-index rows of one order (inside the caller's transaction)."""
+    conn.execute("DELETE FROM order_blind_index WHERE order_id = ?", (order_id,))
+    conn.executemany(
+        "INSERT OR IGNORE INTO order_blind_index (kind, digest, order_id) VALUES (?, ?, ?)",
+        [(kind, digest, order_id) for kind, digest in order_index_terms(name, phone)]
+    )
+
+
+class OrderFilterRejected(Exception):
+    """The filter cannot be looked up in the blind index; the message is user-facing."""
+
+
+def order_filters(name="", phone=""):
+    """SQL conditions on orders.id for the admin name/phone filters.
+
+    Every name word must match the start of a word in the customer's
+    name (words shorter than NAME_PREFIX_MIN, like initials, are left
+    out); a phone matches on the whole number, or on its last four digits
+    when exactly four are given. Raises OrderFilterRejected for a filter
+    with nothing to look up, rather than leaving it out and matching
+    every order.
+    """
+    filters, params = [], []
+    lookup = "id IN (SELECT order_id FROM order_blind_index WHERE kind = ? AND digest = ?)"
+    tokens = [token for token in name_tokens(name) if len(token) >= NAME_PREFIX_MIN]
+    if name.strip() and not tokens:
+        raise OrderFilterRejected(
+            f"Type at least {NAME_PREFIX_MIN} letters of a name to filter by it."
+        )
+    for token in tokens:
+        token = token[:NAME_PREFIX_MAX]
+        filters.append(lookup)
+        params += ["name_prefix", blind_index("name_prefix", token)]
+    digits = normalize_phone(phone)
+    if phone.strip() and not digits:
+        raise OrderFilterRejected("Type the phone number, or its last 4 digits, to filter by it.")
+    if digits:
+        kind = "phone_tail" if len(digits) == 4 else "phone"
+        filters.append(lookup)
+        params += [kind, blind_index(kind, digits)]
+    return filters, params
+
+
+@app.cli.command("orders-reindex")
+@click.option("--all", "rebuild", is_flag=True, help="Re-index every order, e.g. after changing BLIND_INDEX_KEY.")
+@click.option("--batch-size", default=500, show_default=True)
+def orders_reindex_command(rebuild, batch_size):
+    """Backfill the blind index for orders placed before it existed."""
+    conn = open_connection()
+    select = "SELECT id, customer_name, customer_phone FROM orders WHERE id > ?"
+    if not rebuild:
+        select += " AND id NOT IN (SELECT order_id FROM order_blind_index)"
+    select += " ORDER BY id LIMIT ?"
+
+    indexed = skipped = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(select, (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            try:
+                name = decrypt_text(row["customer_name"])
+                phone = decrypt_text(row["customer_phone"])
+            except InvalidToken:
+                skipped += 1
+                continue
+            index_order(conn, row["id"], name, phone)
+            indexed += 1
+        conn.commit()
+        last_id = rows[-1]["id"]
+
+    conn.close()
+    click.echo(f"Indexed {indexed} order(s), skipped {skipped} that could not be decrypted.")
+
 # ---------------- ADMIN ----------------
 
 
 
+# ---------------- IMAGE DERIVATIVES ----------------
+
+def is_image(path):
+    return "." in path and path.rsplit(".", 1)[1].lower() in IMAGE_EXTENSIONS
+
+
+Image = ImageOps = pil_features = None
+_pil_checked = False
+
+
+def derivative_formats():
+    global Image, ImageOps, pil_features, _pil_checked
+    if not _pil_checked:
+        try:
+            from PIL import Image, ImageOps, features as pil_features
+        except ImportError:  # thumbnails are skipped without Pillow
+            pass
+        _pil_checked = True
+    if Image is None:
+        return []
+    return [fmt for fmt in ("avif", "webp") if pil_features.check(fmt)]
+
+
+def derivative_name(path, width, fmt):
+    """uploads/books.jpg -> uploads/_derived/books.jpg.320w.webp"""
+    return f"uploads/_derived/{os.path.basename(path)}.{width}w.{fmt}"
+
+
+def generate_derivatives(path):
+    """Write every resized variant of a static/ image that is missing."""
+    formats = derivative_formats()
+    source = os.path.join(STATIC_FOLDER, path)
+    if not formats or not is_image(path) or not os.path.exists(source):
+        return []
+
+    os.makedirs(DERIVED_FOLDER, exist_ok=True)
+    written = []
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        # Never upscale: widths past the original collapse into the original width
+        widths = sorted({min(w, image.width) for w in IMAGE_WIDTHS})
+        for width in widths:
+            height = max(1, round(image.height * width / image.width))
+            resized = None
+            for fmt in formats:
+                target = os.path.join(STATIC_FOLDER, derivative_name(path, width, fmt))
+                if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+                    continue
+                if resized is None:
+                    resized = image.resize((width, height), Image.LANCZOS)
+                tmp = f"{target}.{os.getpid()}.tmp"
+                if fmt == "avif":
+                    resized.save(tmp, "AVIF", quality=55, speed=6)
+                else:
+                    resized.save(tmp, "WEBP", quality=80, method=4)
+                os.replace(tmp, target)
+                written.append(target)
+    _derivative_index["built_at"] = 0
+    return written
+
+
+_image_pool = None
+_image_pool_pid = None
+
+
+def queue_derivatives(path):
+    """Generate derivatives for a freshly saved upload in the background."""
+    global _image_pool, _image_pool_pid
+    if not path or not is_image(path) or not derivative_formats():
+        return
+    if _image_pool is None or _image_pool_pid != os.getpid():
+        _image_pool = ThreadPoolExecutor(IMAGE_WORKERS, thread_name_prefix="images")
+        _image_pool_pid = os.getpid()
+    future = _image_pool.submit(generate_derivatives, path)
+
+    def log_failure(f):
+        if f.exception():
+            app.logger.error("Image derivatives for %s failed: %s", path, f.exception())
+
+    future.add_done_callback(log_failure)
+
+
+def remove_derivatives(path):
+    for formats in derivative_variants(path).values():
+        for _, name in formats:
+            try:
+                os.remove(os.path.join(STATIC_FOLDER, name))
+            except FileNotFoundError:
+                pass
+    _derivative_index["built_at"] = 0
+
+
+# One directory listing, refreshed every few seconds, answers every srcset
+# lookup instead of a stat() per image per width per render
+_derivative_index = {"built_at": 0, "variants": {}}
+_DERIVED_RE = re.compile(r"^(?P<name>.+)\.(?P<width>\d+)w\.(?P<fmt>avif|webp)$")
+
+
+def derivative_variants(path):
+    index = _derivative_index
+    if time.monotonic() - index["built_at"] > 30:
+        variants = {}
+        try:
+            entries = os.listdir(DERIVED_FOLDER)
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            match = _DERIVED_RE.match(entry)
+            if match:
+                formats = variants.setdefault(match["name"], {})
+                formats.setdefault(match["fmt"], []).append(
+                    (int(match["width"]), "uploads/_derived/" + entry)
+                )
+        for formats in variants.values():
+            for widths in formats.values():
+                widths.sort()
+        index["variants"] = variants
+        index["built_at"] = time.monotonic()
+    return index["variants"].get(os.path.basename(path or ""), {})
+
+
+@app.template_filter("srcset")
+def srcset_filter(path, fmt="webp"):
+    """srcset attribute value for a static/ image, "" until derivatives exist."""
+    return ", ".join(
+        f"{url_for('static', filename=name)} {width}w"
+        for width, name in derivative_variants(path).get(fmt, [])
+    )
+
+
+@app.cli.command("images-backfill")
+def images_backfill_command():
+    """Generate thumbnails and WebP/AVIF variants for existing uploads."""
+    if not derivative_formats():
+        click.echo("Pillow with WebP/AVIF support is not installed; nothing to do.")
+        return
+    # Uploads not yet folded into the store, then every stored image
+    paths = sorted(
+        "uploads/" + name for name in os.listdir(UPLOAD_FOLDER)
+        if os.path.isfile(os.path.join(UPLOAD_FOLDER, name)) and is_image(name)
+    )
+    conn = open_connection()
+    paths += [row[0] for row in conn.execute("SELECT path FROM blobs ORDER BY path") if is_image(row[0])]
+    conn.close()
+    with ThreadPoolExecutor(IMAGE_WORKERS) as pool:
+        for path, written in zip(paths, pool.map(generate_derivatives, paths)):
+            click.echo(f"{path}: {len(written)} new variants")
+
+
+# ---------------- UPLOAD STORE ----------------
+# Content-addressed: a file is hashed while it is written and kept once
+# under its SHA-256, however many times it is uploaded.
+
+def blob_path(digest, ext):
+    return f"uploads/cas/{digest[:2]}/{digest}.{ext}"
+
+
+def write_blob(conn, stream, ext):
+    """Stream an upload to disk and register (or re-reference) its blob.
+
+    Returns the static/-relative path the DB should store.
+    """
+    os.makedirs(CAS_FOLDER, exist_ok=True)
+    tmp = os.path.join(CAS_FOLDER, f".tmp-{uuid.uuid4().hex}")
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp, "wb") as out:
+            while True:
+                chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        return add_blob(conn, tmp, hasher.hexdigest(), size, ext)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def begin_blob_write(conn):
+    """Take the write lock for a blob store change.
+
+    The files are placed or deleted inside the transaction and cannot be
+    rolled back with it, so the caller must not have one open: committing
+    it here would end their transaction on their behalf.
+    """
+    if conn.in_transaction:
+        raise sqlite3.ProgrammingError(
+            "commit or roll back the open transaction before changing the blob store"
+        )
+    conn.execute("BEGIN IMMEDIATE")
+
+
+def add_blob(conn, source, digest, size, ext, refs=1, move=True):
+    """Put `source` in the store under `digest` and add `refs` references.
+
+    The write lock is held while the file is placed so a concurrent
+    release_blob() can never delete it underneath us.
+    """
+    begin_blob_write(conn)
+    try:
+        conn.execute("""
+            INSERT INTO blobs (digest, path, size, refcount) VALUES (?, ?, ?, ?)
+            ON CONFLICT(digest) DO UPDATE SET refcount = refcount + excluded.refcount
+        """, (digest, blob_path(digest, ext), size, refs))
+        path = conn.execute(
+            "SELECT path FROM blobs WHERE digest = ?", (digest,)
+        ).fetchone()[0]
+        target = os.path.join(STATIC_FOLDER, path)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if move:
+                os.replace(source, target)
+            else:
+                shutil.copyfile(source, target)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return path
+
+
+def release_blob(conn, path):
+    """Drop one reference; the file goes when nothing uses it any more.
+
+    Returns True if the file was deleted, False if it is still in use and
+    None if `path` is not in the store at all.
+    """
+    begin_blob_write(conn)
+    try:
+        row = conn.execute(
+            "SELECT digest, refcount FROM blobs WHERE path = ?", (path,)
+        ).fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+        if row["refcount"] > 1:
+            conn.execute("UPDATE blobs SET refcount = refcount - 1 WHERE digest = ?", (row["digest"],))
+            conn.commit()
+            return False
+        if conn.execute("SELECT 1 FROM blob_aliases WHERE digest = ?", (row["digest"],)).fetchone():
+            # Old links still point here; keep the file, just stop counting
+            conn.execute("UPDATE blobs SET refcount = 0 WHERE digest = ?", (row["digest"],))
+            conn.commit()
+            return False
+        conn.execute("DELETE FROM blobs WHERE digest = ?", (row["digest"],))
+        target = os.path.join(STATIC_FOLDER, path)
+        if os.path.exists(target):
+            os.remove(target)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    remove_derivatives(path)
+    return True
+
+
+def resolve_upload(conn, path):
+    """Current blob path for a pre-dedup upload path, or None."""
+    row = conn.execute("""
+        SELECT b.path FROM blob_aliases a
+        JOIN blobs b ON b.digest = a.digest
+        WHERE a.path = ?
+    """, (path,)).fetchone()
+    return row[0] if row else None
+
+
+def store_upload(file):
+    """Save an allowed upload into the store; "" when there is nothing to save."""
+    if file and file.filename and allowed_file(file.filename):
+        ext = file.filename.rsplit(".", 1)[1].lower()
+        path = write_blob(get_db(), file.stream, ext)
+        queue_derivatives(path)
+        return path
+    return ""
+
+
+# ---------------- STREAMED UPLOADS ----------------
+# Werkzeug's form parser spools every file before the view runs. The
+# admission forms instead read the multipart body in UPLOAD_CHUNK_SIZE
+# pieces, check each document's magic bytes as soon as they arrive and
+# hash/write as they go, stopping at the first bad byte.
+
+class UploadRejected(Exception):
+    """The upload broke a type or size rule; the message is user-facing."""
+
+
+class StreamedUpload:
+    """One document being written to a temp file while it is hashed."""
+
+    def __init__(self, field, filename):
+        self.field = field
+        self.filename = filename
+        self.ext = filename.rsplit(".", 1)[1].lower() if "." in filename else ""
+        if self.ext not in DOCUMENT_SIGNATURES:
+            raise UploadRejected(f"{filename}: only PDF, PNG and JPEG documents are accepted.")
+        os.makedirs(CAS_FOLDER, exist_ok=True)
+        self.tmp = os.path.join(CAS_FOLDER, f".tmp-{uuid.uuid4().hex}")
+        self._file = open(self.tmp, "wb")
+        self._hasher = hashlib.sha256()
+        self._head = b""
+        self.size = 0
+        self.checked = False
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > DOCUMENT_MAX_SIZE:
+            raise UploadRejected(
+                f"{self.filename} is larger than {DOCUMENT_MAX_SIZE / (1024 * 1024):.3g}MB."
+            )
+        if not self.checked:
+            self._head += chunk[:16]
+            self._check_signature(final=False)
+        self._hasher.update(chunk)
+        self._file.write(chunk)
+
+    def _check_signature(self, final):
+        signature = DOCUMENT_SIGNATURES[self.ext]
+        if len(self._head) >= len(signature) or final:
+            if not self._head.startswith(signature):
+                raise UploadRejected(f"{self.filename} is not really a .{self.ext} file.")
+            self.checked = True
+
+    def finish(self):
+        self._check_signature(final=True)
+        self._file.close()
+
+    def store(self, conn):
+        """Move the finished file into the blob store; returns its path."""
+        path = add_blob(conn, self.tmp, self._hasher.hexdigest(), self.size, self.ext)
+        self.discard()
+        queue_derivatives(path)
+        return path
+
+    def discard(self):
+        self._file.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+
+def release_docs(conn, *paths):
+    """Undo the blob references of documents whose admission was not saved."""
+    for path in paths:
+        if path:
+            release_blob(conn, path)
+
+
+def read_streamed_form(file_fields=DOCUMENT_FIELDS):
+    """Parse the multipart request body incrementally.
+
+    Returns (fields, uploads): text fields as a dict and a StreamedUpload
+    per non-empty file field in `file_fields`; other file parts are
+    drained and dropped. Raises UploadRejected, after deleting anything
+    already written, as soon as a rule is broken.
+    """
+    boundary = request.mimetype_params.get("boundary", "").encode()
+    if request.mimetype != "multipart/form-data" or not boundary:
+        raise UploadRejected("Please submit the form with its documents attached.")
+
+    # Field sizes are bounded below; the decoder only caps the part count
+    decoder = MultipartDecoder(boundary, max_parts=FORM_MAX_PARTS)
+    stream = request.stream
+    fields = {}
+    uploads = {}
+    part = None
+    buffer = []
+    try:
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK_SIZE)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, (Epilogue, NeedData)):
+                if isinstance(event, File):
+                    part = None
+                    if event.name in file_fields and event.filename:
+                        part = StreamedUpload(event.name, event.filename)
+                        uploads[event.name] = part
+                elif isinstance(event, Field):
+                    part = event
+                    buffer = []
+                elif isinstance(event, Data):
+                    if isinstance(part, StreamedUpload):
+                        part.write(event.data)
+                        if not event.more_data:
+                            if part.size == 0:
+                                # An empty file input: nothing was chosen
+                                part.discard()
+                                del uploads[part.field]
+                            else:
+                                part.finish()
+                    elif isinstance(part, Field):
+                        buffer.append(event.data)
+                        if sum(map(len, buffer)) > FORM_FIELD_MAX_SIZE:
+                            raise UploadRejected("The form is too large.")
+                        if not event.more_data:
+                            fields[part.name] = b"".join(buffer).decode("utf-8", "replace")
+                event = decoder.next_event()
+            if isinstance(event, Epilogue) or not chunk:
+                break
+    except Exception as e:
+        for upload in uploads.values():
+            upload.discard()
+        if isinstance(e, (UploadRejected, HTTPException)):
+            raise
+        raise UploadRejected("The upload could not be read. Please try again.") from e
+    return fields, uploads
+
+
+# ---------------- STATIC ASSETS ----------------
+# Every static file outside uploads/ gets a copy named after its content
+# hash under _assets/, plus .gz and .br versions of the text ones (.br
+# when the brotli package is installed). manifest.json maps the original
+# names to the hashed ones, and url_for("static") hands out the hashed
+# names, so they can be cached forever: a changed file is a new URL.
+# Stylesheets are rewritten to point at the hashed images they use.
+#
+# The build runs once per deploy, from `flask --app app assets-build` or
+# gunicorn's on_starting hook, before any worker starts. Workers only read
+# the manifest when they boot, and a gunicorn worker refuses to start
+# without one. `python app.py` builds it itself; plain `flask run` serves
+# the unhashed files until it is built. Files from the previous build are
+# kept for pages still cached with their names.
+
+asset_manifest = {}
+asset_encodings = {}
+# br first: it is the smaller of the two when the client takes both
+ASSET_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+_HASHED_ASSET = re.compile(r"^_assets/.+\.[0-9a-f]{12}\.\w+$")
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+brotli = None
+_brotli_checked = False
+
+
+def brotli_module():
+    global brotli, _brotli_checked
+    if not _brotli_checked:
+        try:
+            import brotli
+        except ImportError:  # .br copies are skipped without it
+            pass
+        _brotli_checked = True
+    return brotli
+
+
+def asset_sources():
+    """{static/-relative name: (size, mtime_ns)} of every file to fingerprint."""
+    sources = {}
+    for root, dirs, files in os.walk(STATIC_FOLDER):
+        if root == STATIC_FOLDER:
+            dirs[:] = [d for d in dirs if d not in ("uploads", "_assets")]
+        for name in files:
+            if name.rsplit(".", 1)[-1].lower() not in ASSET_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            sources[os.path.relpath(path, STATIC_FOLDER).replace(os.sep, "/")] = (
+                stat.st_size, stat.st_mtime_ns
+            )
+    return sources
+
+
+def rewrite_css(text, name, files):
+    """Point the url()s of stylesheet `name` at hashed files, absolutely,
+    since the hashed copy lives in another directory."""
+    prefix = app.static_url_path
+
+    def replace(match):
+        ref = match.group(2).strip()
+        if ref.startswith(("data:", "http:", "https:", "//", "#")):
+            return match.group(0)
+        target, suffix = re.match(r"([^?#]*)(.*)", ref).groups()
+        if target.startswith(prefix + "/"):
+            target = target[len(prefix) + 1:]
+        elif target.startswith("/"):
+            return match.group(0)
+        else:
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(name), target))
+        hashed = files.get(target, {}).get("path", target)
+        return f'url("{prefix}/{hashed}{suffix}")'
+
+    return _CSS_URL.sub(replace, text)
+
+
+def write_atomic(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def build_assets(force=False):
+    """Fingerprint and compress the static files; returns the manifest.
+    Unless forced, an up-to-date manifest is returned as it is."""
+    import fcntl
+    import gzip
+
+    os.makedirs(ASSET_FOLDER, exist_ok=True)
+    with open(os.path.join(ASSET_FOLDER, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        previous = read_asset_manifest()
+        sources = asset_sources()
+        if not force and previous and previous.get("sources") == {name: list(stat) for name, stat in sources.items()}:
+            return previous
+
+        files = {}
+        # Stylesheets last, so the images they reference are already hashed
+        for name in sorted(sources, key=lambda name: (name.endswith(".css"), name)):
+            with open(os.path.join(STATIC_FOLDER, name), "rb") as f:
+                data = f.read()
+            extension = name.rsplit(".", 1)[-1].lower()
+            if extension == "css":
+                data = rewrite_css(data.decode("utf-8"), name, files).encode("utf-8")
+            stem = name.rpartition(".")[0]
+            hashed = f"_assets/{stem}.{hashlib.sha256(data).hexdigest()[:12]}.{extension}"
+            target = os.path.join(STATIC_FOLDER, hashed)
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                write_atomic(target, data)
+
+            encodings = []
+            if extension in ASSET_COMPRESSIBLE:
+                for encoding, suffix in ASSET_ENCODINGS:
+                    if encoding == "br" and brotli_module() is None:
+                        continue
+                    if not os.path.exists(target + suffix):
+                        if encoding == "br":
+                            compressed = brotli.compress(data, quality=11)
+                        else:
+                            compressed = gzip.compress(data, 9, mtime=0)
+                        if len(compressed) >= len(data):
+                            continue
+                        write_atomic(target + suffix, compressed)
+                    encodings.append(encoding)
+            files[name] = {"path": hashed, "size": len(data), "encodings": encodings}
+
+        manifest = {
+            "built_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "sources": {name: list(stat) for name, stat in sources.items()},
+            "files": files,
+        }
+        prune_assets(manifest, previous)
+        write_atomic(ASSET_MANIFEST, json.dumps(manifest, indent=1, sort_keys=True).encode())
+        return manifest
+
+
+def prune_assets(manifest, previous):
+    """Delete hashed files that neither this build nor the last one uses."""
+    keep = set()
+    for built in (manifest, previous or {}):
+        for entry in built.get("files", {}).values():
+            keep.add(entry["path"])
+            keep.update(entry["path"] + suffix for _, suffix in ASSET_ENCODINGS)
+    for root, _, files in os.walk(ASSET_FOLDER):
+        for name in files:
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, STATIC_FOLDER).replace(os.sep, "/")
+            if path == ASSET_MANIFEST or name == ".lock" or relative in keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def read_asset_manifest():
+    try:
+        with open(ASSET_MANIFEST) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_assets():
+    """Use the built manifest for url_for without touching the files;
+    returns the number of fingerprinted files, or None when fingerprinting
+    is on but nothing has been built yet."""
+    asset_manifest.clear()
+    asset_encodings.clear()
+    if not STATIC_FINGERPRINT:
+        return 0
+    manifest = read_asset_manifest()
+    if manifest is None:
+        return None
+    for name, entry in manifest["files"].items():
+        asset_manifest[name] = entry["path"]
+        asset_encodings[entry["path"]] = tuple(entry["encodings"])
+    return len(asset_manifest)
+
+
+@app.url_defaults
+def fingerprint_static(endpoint, values):
+    if endpoint == "static" and asset_manifest:
+        hashed = asset_manifest.get(values.get("filename"))
+        if hashed:
+            values["filename"] = hashed
+
+
+def send_asset(filename):
+    """A hashed file, precompressed if the client accepts it, cached for good."""
+    if not _HASHED_ASSET.match(filename):
+        raise NotFound()
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    encodings = asset_encodings.get(filename, ())
+    chosen = None
+    for encoding, suffix in ASSET_ENCODINGS:
+        if encoding in encodings and request.accept_encodings[encoding]:
+            chosen = encoding, suffix
+            break
+    response = send_from_directory(
+        STATIC_FOLDER, filename + (chosen[1] if chosen else ""),
+        mimetype=mimetype, max_age=ASSET_MAX_AGE
+    )
+    if chosen:
+        response.headers["Content-Encoding"] = chosen[0]
+    if encodings:
+        response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@app.endpoint("static")
+def static_with_aliases(filename):
+    if filename.startswith("_assets/"):
+        return send_asset(filename)
+    # Links to uploads that were folded into the store still resolve
+    try:
+        return app.send_static_file(filename)
+    except NotFound:
+        if not filename.startswith("uploads/"):
+            raise
+        path = resolve_upload(get_db(), filename)
+        if path is None:
+            raise
+        return app.send_static_file(path)
+
+
+# Columns holding static/-relative upload paths; products.image is
+# relative to uploads/
+UPLOAD_REFERENCES = (
+    ("admissions", "birth_certificate", ""),
+    ("admissions", "parent_id_copy", ""),
+    ("admissions", "latest_report", ""),
+    ("admissions", "proof_of_residence", ""),
+    ("post_media", "file_path", ""),
+    ("products", "image", "uploads/"),
+)
+
+
+@app.cli.command("uploads-dedupe")
+@click.option("--dry-run", is_flag=True, help="Report savings without changing anything.")
+def uploads_dedupe_command(dry_run):
+    """Fold existing uploads into the content-addressed store."""
+    conn = open_connection()
+    names = sorted(
+        name for name in os.listdir(UPLOAD_FOLDER)
+        if os.path.isfile(os.path.join(UPLOAD_FOLDER, name)) and allowed_file(name)
+    )
+
+    by_digest = {}
+    for name in names:
+        hasher = hashlib.sha256()
+        with open(os.path.join(UPLOAD_FOLDER, name), "rb") as f:
+            for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+                hasher.update(chunk)
+        by_digest.setdefault(hasher.hexdigest(), []).append(name)
+
+    duplicate_bytes = sum(
+        os.path.getsize(os.path.join(UPLOAD_FOLDER, group[0])) * (len(group) - 1)
+        for group in by_digest.values()
+    )
+    click.echo(f"{len(names)} files, {len(by_digest)} distinct, "
+               f"{duplicate_bytes / 1024 / 1024:.1f}MB in duplicates")
+    if dry_run:
+        conn.close()
+        return
+
+    for digest, group in by_digest.items():
+        first = os.path.join(UPLOAD_FOLDER, group[0])
+        ext = group[0].rsplit(".", 1)[1].lower()
+        legacy = ["uploads/" + name for name in group]
+
+        refs = 0
+        for table, column, prefix in UPLOAD_REFERENCES:
+            for path in legacy:
+                stored = path[len(prefix):]
+                refs += conn.execute(
+                    f"SELECT COUNT(*) FROM {table} WHERE {column} = ?", (stored,)
+                ).fetchone()[0]
+
+        path = add_blob(conn, first, digest, os.path.getsize(first), ext, refs=refs, move=False)
+        for table, column, prefix in UPLOAD_REFERENCES:
+            conn.executemany(
+                f"UPDATE {table} SET {column} = ? WHERE {column} = ?",
+                [(path[len(prefix):], old[len(prefix):]) for old in legacy]
+            )
+        conn.executemany(
+            "INSERT OR REPLACE INTO blob_aliases (path, digest) VALUES (?, ?)",
+            [(old, digest) for old in legacy]
+        )
+        conn.commit()
+
+        for name in group:
+            os.remove(os.path.join(UPLOAD_FOLDER, name))
+            # Variants are named after the file, so the old names' are orphans
+            remove_derivatives("uploads/" + name)
+        click.echo(f"{path}: {len(group)} file(s), {refs} reference(s)")
+
+    conn.close()
+    click.echo("Done. Run 'flask --app app images-backfill' to rebuild image variants.")
+
+
 # ---------------- DATABASE ----------------
 def save_file(file):
     if file and file.filename != "":
-        filename = secure_filename(file.filename)
-        path = os.path.join("static/uploads", filename)
-        file.save(path)
-        return f"uploads/{filename}"
+        return store_upload(file) or None
     return None
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+# Applied once when a connection is opened; pooled connections keep them for
+# their whole life instead of paying for them on every request.
+SQLITE_PRAGMAS = (
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",       # ~16MB page cache
+    "PRAGMA mmap_size = 134217728",     # 128MB
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+)
+
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 4))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+
+
+class PooledConnection(sqlite3.Connection):
+    """Connection owned by ConnectionPool.
+
+    A stray close() while the connection is checked out only discards the
+    open transaction; the pool decides when the handle really goes away.
+
+    It also keeps the SQL cost of the request holding it: statements run
+    (trace hook), time to each statement's first row and VM instructions
+    (progress hook), picked up by record_request_metrics().
+    """
+
+    pooled = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reset_sql_stats()
+        self.set_trace_callback(self._traced)
+        self.set_progress_handler(self._progressed, SQLITE_PROGRESS_STEPS)
+
+    def reset_sql_stats(self):
+        self.statements = 0
+        self.statement_times = []
+        self.vm_steps = 0
+
+    def _traced(self, sql):
+        # Trigger bodies are reported as "-- TRIGGER name"; they are part
+        # of the statement that fired them. Plans fetched for the slow
+        # query log are not the request's own work.
+        if not sql.startswith(("--", "EXPLAIN QUERY PLAN")):
+            self.statements += 1
+
+    def _progressed(self):
+        self.vm_steps += SQLITE_PROGRESS_STEPS
+        return 0
+
+    def execute(self, sql, params=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            took = time.perf_counter() - started
+            self.statement_times.append(took)
+            if took * 1000 >= SLOW_QUERY_MS:
+                log_slow_query(self, took, sql, params)
+
+    def executemany(self, sql, rows):
+        if not isinstance(rows, (list, tuple)):
+            rows = list(rows)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, rows)
+        finally:
+            took = time.perf_counter() - started
+            self.statement_times.append(took)
+            if rows and took * 1000 >= SLOW_QUERY_MS:
+                log_slow_query(self, took, sql, rows[0], rows=len(rows))
+
+    def close(self):
+        if not self.pooled:
+            return super().close()
+        if self.in_transaction:
+            self.rollback()
+
+    def discard(self):
+        self.pooled = False
+        super().close()
+
+
+def open_connection(factory=sqlite3.Connection):
+    conn = sqlite3.connect(
+        DB_PATH,
+        factory=factory,
+        check_same_thread=False
+    )
     conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON")
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
+
+class ConnectionPool:
+    """Per-process pool of pre-configured SQLite connections."""
+
+    def __init__(self, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self.hits += 1
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+                self.misses += 1
+
+        if can_create:
+            try:
+                conn = open_connection(factory=PooledConnection)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+            conn.pooled = True
+            conn.reset_sql_stats()
+            return conn
+
+        # Pool exhausted: block until another request hands one back
+        started = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("database connection pool exhausted")
+        waited = time.perf_counter() - started
+        with self._lock:
+            self.waits += 1
+            self.wait_time += waited
+            self.max_wait = max(self.max_wait, waited)
+        return conn
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.discard()
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put(conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "open": self._created,
+                "idle": self._idle.qsize(),
+                "in_use": self._created - self._idle.qsize(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "waits": self.waits,
+                "wait_time": round(self.wait_time, 6),
+                "max_wait": round(self.max_wait, 6),
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return this worker's pool, rebuilding it after a fork."""
+    global _pool
+    pool = _pool
+    if pool is None or pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = ConnectionPool()
+            pool = _pool
+    return pool
+
+
+def get_db():
+    """Connection for the current request.
+
+    Inside a request every call returns the same pooled connection, which
+    goes back to the pool at teardown. Outside one (startup, CLI) a plain
+    connection is opened and the caller must close it.
+    """
+    if not has_app_context():
+        return open_connection()
+
+    if "db" not in g:
+        g.db = get_pool().acquire()
+    return g.db
+
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop("db", None)
+    if conn is not None:
+        get_pool().release(conn)
+
+
+# ---------------- METRICS ----------------
+# Request latency, SQL cost and PayFast calls, exported in the Prometheus
+# text format at /admin/metrics. Each process counts in memory and writes
+# a snapshot to METRICS_DIR at most every METRICS_FLUSH_INTERVAL seconds;
+# a scrape adds up the snapshots of every process, so the numbers cover
+# all gunicorn workers whichever one answers (the others' by up to one
+# interval late).
+
+class Metrics:
+    """Counters and histograms for one process, merged across processes."""
+
+    def __init__(self, directory, flush_interval):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.families = {}
+        self._values = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._path = None
+        self._flushed = 0.0
+
+    def counter(self, name, help_text):
+        self.families[name] = ("counter", help_text, None)
+
+    def histogram(self, name, help_text, buckets):
+        self.families[name] = ("histogram", help_text, tuple(buckets))
+
+    def _entry(self, name, labels, size):
+        # A forked worker starts counting from zero in its own file
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._path = os.path.join(self.directory, f"{self._pid}-{uuid.uuid4().hex[:8]}.json")
+            self._values = {}
+        key = (name, tuple(sorted(labels.items())))
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [0] * size
+        return entry
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            self._entry(name, labels, 1)[0] += amount
+
+    def observe(self, name, value, **labels):
+        """Add one observation; the entry is [count per bucket..., +Inf, sum]."""
+        buckets = self.families[name][2]
+        with self._lock:
+            entry = self._entry(name, labels, len(buckets) + 2)
+            entry[bisect.bisect_left(buckets, value)] += 1
+            entry[-1] += value
+
+    def flush(self, force=False):
+        """Write this process's snapshot if the interval has passed."""
+        now = time.monotonic()
+        if not force and now - self._flushed < self.flush_interval:
+            return
+        with self._lock:
+            self._flushed = now
+            if not self._values or self._pid != os.getpid():
+                return
+            snapshot = [[name, list(labels), entry] for (name, labels), entry in self._values.items()]
+            path = self._path
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _merge(totals, snapshot):
+        for name, labels, entry in snapshot:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            current = totals.get(key)
+            if current is None or len(current) != len(entry):
+                totals[key] = list(entry)
+            else:
+                for i, value in enumerate(entry):
+                    current[i] += value
+
+    def collect(self):
+        """Totals over every process that ever wrote a snapshot.
+
+        Snapshots of processes that have exited are folded into
+        archive.json, so counters never go backwards when a worker is
+        replaced.
+        """
+        import fcntl
+
+        self.flush(force=True)
+        os.makedirs(self.directory, exist_ok=True)
+        archive_path = os.path.join(self.directory, "archive.json")
+        with open(os.path.join(self.directory, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive = {}
+            if os.path.exists(archive_path):
+                with open(archive_path) as f:
+                    self._merge(archive, json.load(f))
+            totals = {key: list(entry) for key, entry in archive.items()}
+            folded = []
+            for filename in os.listdir(self.directory):
+                if not filename.endswith(".json") or filename == "archive.json":
+                    continue
+                path = os.path.join(self.directory, filename)
+                try:
+                    with open(path) as f:
+                        snapshot = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                self._merge(totals, snapshot)
+                if not process_alive(int(filename.split("-", 1)[0])):
+                    self._merge(archive, snapshot)
+                    folded.append(path)
+            if folded:
+                tmp = f"{archive_path}.tmp"
+                with open(tmp, "w") as f:
+                    json.dump([[name, list(labels), entry] for (name, labels), entry in archive.items()], f)
+                os.replace(tmp, archive_path)
+                for path in folded:
+                    os.remove(path)
+        return totals
+
+    def render(self):
+        """All families in the Prometheus text exposition format."""
+        totals = self.collect()
+        lines = []
+        for name, (kind, help_text, buckets) in self.families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            series = sorted((labels, entry) for (family, labels), entry in totals.items() if family == name)
+            for labels, entry in series:
+                if kind == "counter":
+                    lines.append(f"{name}{format_labels(labels)} {entry[0]:g}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + (float("inf"),), entry):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {entry[-1]:.6f}")
+                lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+metrics = Metrics(METRICS_DIR, METRICS_FLUSH_INTERVAL)
+metrics.histogram(
+    "http_request_duration_seconds", "Time to handle a request, by endpoint and status.",
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+metrics.histogram(
+    "sqlite_statements_per_request", "SQL statements a request ran on its pooled connection.",
+    (0, 1, 2, 5, 10, 20, 50, 100, 200)
+)
+metrics.histogram(
+    "sqlite_statement_duration_seconds", "Time from execute() to a statement's first row.",
+    (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+)
+metrics.counter(
+    "sqlite_vm_steps_total", "SQLite VM instructions run for requests, in steps of 1000."
+)
+metrics.histogram(
+    "payfast_request_duration_seconds", "ITN validation calls to PayFast, by outcome.",
+    (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+metrics.counter(
+    "payfast_short_circuited_total", "Validations refused while the circuit breaker was open."
+)
+atexit.register(metrics.flush, force=True)
+
+
+# ---------------- SLOW QUERY LOG ----------------
+# Statements on request connections that take SLOW_QUERY_MS or more to
+# produce their first row are recorded with their normalized SQL, the
+# types (never the values) of their parameters, the route that ran them
+# and their EXPLAIN QUERY PLAN. The last SLOW_QUERY_BUFFER stay in memory;
+# every worker also appends them as JSON lines to SLOW_QUERY_LOG, which is
+# rotated at SLOW_QUERY_LOG_MAX_BYTES. /admin/slow-queries shows them.
+
+slow_queries = deque(maxlen=SLOW_QUERY_BUFFER)
+# Plans are fetched once per distinct statement and worker
+query_plans = {}
+QUERY_PLANS_MAX = 256
+_slow_log_lock = threading.Lock()
+_SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def normalize_sql(sql):
+    """The statement with literals replaced by ? and whitespace collapsed."""
+    return " ".join(_SQL_LITERALS.sub("?", sql).split())
+
+
+def param_shape(params):
+    def shape(value):
+        if isinstance(value, (str, bytes)):
+            return f"{type(value).__name__}[{len(value)}]"
+        return type(value).__name__
+
+    if isinstance(params, dict):
+        return {name: shape(value) for name, value in params.items()}
+    return [shape(value) for value in params]
+
+
+def explain(conn, sql, params, normalized):
+    plan = query_plans.get(normalized)
+    if plan is None:
+        plan = []
+        if sql.lstrip().upper().startswith(_EXPLAINABLE):
+            try:
+                # Straight to sqlite3 so the plan is neither timed nor logged
+                plan = [row[3] for row in sqlite3.Connection.execute(
+                    conn, "EXPLAIN QUERY PLAN " + sql, params
+                )]
+            except sqlite3.Error as e:
+                plan = [f"(no plan: {e})"]
+        if len(query_plans) >= QUERY_PLANS_MAX:
+            query_plans.clear()
+        query_plans[normalized] = plan
+    return plan
+
+
+def log_slow_query(conn, seconds, sql, params=(), rows=None):
+    try:
+        normalized = normalize_sql(sql)
+        entry = {
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "ms": round(seconds * 1000, 1),
+            "sql": normalized,
+            "params": param_shape(params),
+            "endpoint": request.endpoint if has_request_context() else None,
+            "path": request.path if has_request_context() else None,
+            "pid": os.getpid(),
+            "plan": explain(conn, sql, params, normalized),
+        }
+        if rows is not None:
+            entry["rows"] = rows
+        slow_queries.append(entry)
+        write_slow_query(entry)
+    except Exception:
+        # Diagnostics must never fail the query they are watching
+        app.logger.exception("Could not record a slow query")
+
+
+def write_slow_query(entry):
+    """Append one entry to SLOW_QUERY_LOG, rotating it when it is full.
+
+    The rotation check and the append happen under a file lock, so the
+    workers never rotate the same file twice or write into a moved one.
+    """
+    if not SLOW_QUERY_LOG:
+        return
+    import fcntl
+
+    line = json.dumps(entry) + "\n"
+    with _slow_log_lock, open(SLOW_QUERY_LOG + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            size = os.path.getsize(SLOW_QUERY_LOG)
+        except OSError:
+            size = 0
+        if size and size + len(line) > SLOW_QUERY_LOG_MAX_BYTES:
+            for index in range(SLOW_QUERY_LOG_BACKUPS - 1, 0, -1):
+                older = f"{SLOW_QUERY_LOG}.{index}"
+                if os.path.exists(older):
+                    os.replace(older, f"{SLOW_QUERY_LOG}.{index + 1}")
+            if SLOW_QUERY_LOG_BACKUPS > 0:
+                os.replace(SLOW_QUERY_LOG, f"{SLOW_QUERY_LOG}.1")
+            else:
+                os.remove(SLOW_QUERY_LOG)
+        with open(SLOW_QUERY_LOG, "a") as f:
+            f.write(line)
+
+
+def recent_slow_queries(limit=SLOW_QUERY_BUFFER):
+    """Newest first: from the shared log (every worker) when there is one,
+    else from this worker's buffer."""
+    if SLOW_QUERY_LOG and os.path.exists(SLOW_QUERY_LOG):
+        entries = []
+        with open(SLOW_QUERY_LOG) as f:
+            for line in deque(f, maxlen=limit):
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+        return entries[::-1]
+    return list(slow_queries)[::-1][:limit]
+
+
+def summarize_slow_queries(entries):
+    """One row per distinct statement, the most expensive first."""
+    groups = {}
+    for entry in entries:
+        group = groups.setdefault(entry["sql"], {
+            "sql": entry["sql"], "count": 0, "total_ms": 0.0, "max_ms": 0.0,
+            "endpoints": set(), "plan": entry["plan"],
+        })
+        group["count"] += 1
+        group["total_ms"] += entry["ms"]
+        group["max_ms"] = max(group["max_ms"], entry["ms"])
+        group["endpoints"].add(entry["endpoint"] or "-")
+    return sorted(groups.values(), key=lambda group: group["total_ms"], reverse=True)
+
+
+# ---------------- PROFILER ----------------
+# An admin turns sampling on at /admin/profiles for a while: that fraction
+# of requests, and any request with a valid PROFILE_HEADER token, run under
+# cProfile. Each profile is saved as a pstats file under
+# PROFILE_DIR/<endpoint>/ (snakeviz or `python -m pstats` read them) and
+# its top functions are appended to PROFILE_DIR/index.jsonl for the page.
+#
+# The switch is a small JSON file every worker re-reads at most every
+# PROFILE_STATE_CHECK seconds; while it is off a request costs one clock
+# read and a header lookup, and cProfile is never imported. cProfile
+# serializes with any other profiler, so a worker profiles one request at
+# a time and skips the rest.
+
+PROFILE_STATE = os.path.join(PROFILE_DIR, "state.json")
+PROFILE_INDEX = os.path.join(PROFILE_DIR, "index.jsonl")
+PROFILE_TOP = 15
+PROFILE_ENVIRON_KEY = "HTTP_" + PROFILE_HEADER.upper().replace("-", "_")
+
+_profile_state = {"rate": 0.0, "until": 0.0, "checked": 0.0}
+_profile_lock = threading.Lock()
+
+
+def profiling_state(refresh=False):
+    """(sample rate, until) as last read from PROFILE_STATE."""
+    now = time.time()
+    if refresh or now - _profile_state["checked"] >= PROFILE_STATE_CHECK:
+        _profile_state["checked"] = now
+        try:
+            with open(PROFILE_STATE) as f:
+                saved = json.load(f)
+            _profile_state["rate"] = float(saved.get("rate", 0))
+            _profile_state["until"] = float(saved.get("until", 0))
+        except (OSError, ValueError, TypeError, AttributeError):
+            _profile_state["rate"] = _profile_state["until"] = 0.0
+    return _profile_state["rate"], _profile_state["until"]
+
+
+def set_profiling(rate, seconds):
+    """Sample `rate` of requests for `seconds` in every worker (0 stops)."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    state = {"rate": rate, "until": time.time() + seconds if rate > 0 else 0}
+    fd, tmp = tempfile.mkstemp(dir=PROFILE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, PROFILE_STATE)
+    profiling_state(refresh=True)
+
+
+def profile_token(expires=None):
+    expires = int(expires or time.time() + PROFILE_TOKEN_TTL)
+    signature = hmac.new(
+        app.secret_key.encode(), f"profile:{expires}".encode(), hashlib.sha256
+    ).hexdigest()
+    return f"{expires}.{signature}"
+
+
+def valid_profile_token(token):
+    expires, _, _ = token.partition(".")
+    if not app.secret_key or not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(token, profile_token(expires))
+
+
+def should_profile():
+    if request.endpoint == "static":
+        return False
+    token = request.environ.get(PROFILE_ENVIRON_KEY)
+    if token:
+        return valid_profile_token(token)
+    rate, until = profiling_state()
+    return rate > 0 and time.time() < until and random.random() < rate
+
+
+def top_functions(stats, limit=PROFILE_TOP):
+    """The functions with the most time of their own, from a pstats.Stats."""
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+        if filename.startswith(BASE_DIR):
+            filename = os.path.relpath(filename, BASE_DIR)
+        filename = filename.rpartition("site-packages" + os.sep)[2]
+        rows.append({
+            "function": f"{filename}:{line}({name})",
+            "calls": calls,
+            "own_ms": round(own * 1000, 2),
+            "cumulative_ms": round(cumulative * 1000, 2),
+        })
+    rows.sort(key=lambda row: row["own_ms"], reverse=True)
+    return rows[:limit]
+
+
+def save_profile(profiler, seconds):
+    import fcntl
+    import pstats
+
+    endpoint = request.endpoint or "unmatched"
+    stats = pstats.Stats(profiler)
+    now = datetime.now(timezone.utc)
+    name = f"{endpoint}/{now:%Y%m%dT%H%M%S}-{os.getpid()}-{uuid.uuid4().hex[:6]}.prof"
+    os.makedirs(os.path.join(PROFILE_DIR, endpoint), exist_ok=True)
+    stats.dump_stats(os.path.join(PROFILE_DIR, name))
+
+    entry = {
+        "at": now.isoformat(timespec="seconds"),
+        "file": name,
+        "endpoint": endpoint,
+        "method": request.method,
+        "path": request.path,
+        "ms": round(seconds * 1000, 1),
+        "calls": stats.total_calls,
+        "pid": os.getpid(),
+        "top": top_functions(stats),
+    }
+    with open(PROFILE_INDEX + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        with open(PROFILE_INDEX, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        prune_profiles()
+
+
+def read_profile_index():
+    entries = []
+    try:
+        with open(PROFILE_INDEX) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return entries
+
+
+def prune_profiles():
+    """Keep the newest PROFILE_KEEP profiles; the caller holds the index lock."""
+    entries = read_profile_index()
+    if len(entries) <= PROFILE_KEEP:
+        return
+    for entry in entries[:-PROFILE_KEEP]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, entry["file"]))
+        except OSError:
+            pass
+    tmp = PROFILE_INDEX + ".tmp"
+    with open(tmp, "w") as f:
+        for entry in entries[-PROFILE_KEEP:]:
+            f.write(json.dumps(entry) + "\n")
+    os.replace(tmp, PROFILE_INDEX)
+
+
+def profile_path(name):
+    """The file behind an index entry, or None when it is not one of ours."""
+    path = os.path.normpath(os.path.join(PROFILE_DIR, name))
+    if not path.startswith(os.path.normpath(PROFILE_DIR) + os.sep) or not path.endswith(".prof"):
+        return None
+    return path if os.path.isfile(path) else None
+
+
+@app.before_request
+def start_profiler():
+    if not should_profile() or not _profile_lock.acquire(blocking=False):
+        return
+    import cProfile
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler (a debugger, coverage) already owns the hook
+        _profile_lock.release()
+        return
+    g.profiler = (profiler, time.perf_counter())
+
+
+@app.teardown_request
+def stop_profiler(exc):
+    running = g.pop("profiler", None)
+    if running is None:
+        return
+    profiler, started = running
+    try:
+        profiler.disable()
+        save_profile(profiler, time.perf_counter() - started)
+    except Exception:
+        app.logger.exception("Could not save a request profile")
+    finally:
+        _profile_lock.release()
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def remember_status(response):
+    g.response_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def record_request_metrics(exc):
+    started = g.pop("request_started", None)
+    if started is None:
+        return
+    endpoint = request.endpoint or "unmatched"
+    status = 500 if exc is not None else g.get("response_status", 500)
+    metrics.observe(
+        "http_request_duration_seconds", time.perf_counter() - started,
+        endpoint=endpoint, method=request.method, status=str(status)
+    )
+
+    conn = g.get("db")
+    statements = 0
+    if conn is not None:
+        statements = conn.statements
+        for took in conn.statement_times:
+            metrics.observe("sqlite_statement_duration_seconds", took, endpoint=endpoint)
+        if conn.vm_steps:
+            metrics.inc("sqlite_vm_steps_total", conn.vm_steps, endpoint=endpoint)
+        conn.reset_sql_stats()
+    metrics.observe("sqlite_statements_per_request", statements, endpoint=endpoint)
+    metrics.flush()
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    # foreign_keys (VERY IMPORTANT for cascade delete) and WAL are set here
+    conn = open_connection()
     cursor = conn.cursor()
 
-    # VERY IMPORTANT for cascade delete
-    cursor.execute("PRAGMA foreign_keys = ON")
-
     # ---------------- POSTS ----------------
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS posts (
@@ -128,6 +1871,10 @@ def init_db():
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )
     """)
+    # Keyset pagination on the news feed walks (created_at, id)
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_posts_created_at ON posts(created_at, id)"
+    )
 
 
 
@@ -141,6 +1888,9 @@ def init_db():
         FOREIGN KEY (post_id) REFERENCES posts(id) ON DELETE CASCADE
     )
     """)
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_post_media_post_id ON post_media(post_id)"
+    )
 
     # ---------------- PRODUCTS ----------------
     cursor.execute("""
@@ -153,6 +1903,25 @@ def init_db():
         category TEXT
     )
     """)
+    create_product_search(cursor)
+
+    # ---------------- CATALOG VERSION ----------------
+    # Bumped by triggers on every product write so each worker's catalog
+    # cache can tell when another process changed the catalog
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS catalog_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS catalog_version_{event.lower()}
+        AFTER {event} ON products BEGIN
+            UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+        END
+        """)
 
     # ---------------- ORDERS ----------------
     cursor.execute("""
@@ -185,6 +1954,20 @@ def init_db():
     )
     """)
 
+    # ---------------- ORDER BLIND INDEX ----------------
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS order_blind_index (
+        kind TEXT NOT NULL,
+        digest TEXT NOT NULL,
+        order_id INTEGER NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+        PRIMARY KEY (kind, digest, order_id)
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_order_blind_index_order_id
+    ON order_blind_index(order_id)
+    """)
+
     # ---------------- ADMISSIONS ----------------
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS admissions (
@@ -211,16 +1994,303 @@ def init_db():
     )
     """)
 
+    # ---------------- UPLOAD BLOBS ----------------
+    # One row per stored file content; refcount counts the DB rows using it
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS blobs (
+        digest TEXT PRIMARY KEY,
+        path TEXT NOT NULL UNIQUE,
+        size INTEGER NOT NULL,
+        refcount INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    # Pre-dedup upload paths and the blob they were folded into
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS blob_aliases (
+        path TEXT PRIMARY KEY,
+        digest TEXT NOT NULL REFERENCES blobs(digest)
+    )
+    """)
+
+    # ---------------- ITN INBOX ----------------
+    # status: pending -> processing -> done | rejected | failed
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS itn_inbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        source TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL DEFAULT 0,
+        last_error TEXT,
+        received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        processed_at TIMESTAMP
+    )
+    """)
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_itn_inbox_due ON itn_inbox(status, next_attempt_at)"
+    )
+
+    create_dashboard_stats(cursor)
 
     conn.commit()
+    migrate(conn)
+    conn.close()
+
+
+def create_product_search(cursor):
+    """Full-text index over products, kept in sync by triggers.
+
+    Silently skipped on SQLite builds without FTS5; shop() then falls back
+    to LIKE matching.
+    """
+    try:
+        existed = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'products_fts'"
+        ).fetchone()
+        cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            name, description, category,
+            content='products',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+        """)
+    except sqlite3.OperationalError:
+        return False
+
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts (rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, name, description, category)
+        VALUES ('delete', old.id, old.name, old.description, old.category);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, name, description, category)
+        VALUES ('delete', old.id, old.name, old.description, old.category);
+        INSERT INTO products_fts (rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, new.category);
+    END
+    """)
+
+    # Index products that were there before the search table
+    if not existed:
+        cursor.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+    return True
+
+
+# The dashboard counters and how to compute each from scratch. Revenue is
+# kept in cents so repeated trigger arithmetic cannot drift like REAL sums.
+DASHBOARD_STATS = {
+    "orders": "SELECT COUNT(*) FROM orders",
+    "revenue_cents": """
+        SELECT COALESCE(SUM(CAST(ROUND(total_amount * 100) AS INTEGER)), 0)
+        FROM orders WHERE status = 'paid'
+    """,
+    "new_admissions": "SELECT COUNT(*) FROM admissions WHERE status = 'new'",
+    "products": "SELECT COUNT(*) FROM products",
+}
+
+_PAID_CENTS = "(CASE WHEN {row}.status = 'paid' THEN CAST(ROUND(COALESCE({row}.total_amount, 0) * 100) AS INTEGER) ELSE 0 END)"
+_IS_NEW = "({row}.status IS 'new')"
+
+# (trigger name, event, table, [(counter, delta expression), ...])
+DASHBOARD_TRIGGERS = [
+    ("stats_orders_insert", "INSERT", "orders", [
+        ("orders", "1"),
+        ("revenue_cents", _PAID_CENTS.format(row="new")),
+    ]),
+    ("stats_orders_delete", "DELETE", "orders", [
+        ("orders", "-1"),
+        ("revenue_cents", "-" + _PAID_CENTS.format(row="old")),
+    ]),
+    ("stats_orders_update", "UPDATE OF status, total_amount", "orders", [
+        ("revenue_cents", _PAID_CENTS.format(row="new") + " - " + _PAID_CENTS.format(row="old")),
+    ]),
+    ("stats_admissions_insert", "INSERT", "admissions", [
+        ("new_admissions", _IS_NEW.format(row="new")),
+    ]),
+    ("stats_admissions_delete", "DELETE", "admissions", [
+        ("new_admissions", "-" + _IS_NEW.format(row="old")),
+    ]),
+    ("stats_admissions_update", "UPDATE OF status", "admissions", [
+        ("new_admissions", _IS_NEW.format(row="new") + " - " + _IS_NEW.format(row="old")),
+    ]),
+    ("stats_products_insert", "INSERT", "products", [("products", "1")]),
+    ("stats_products_delete", "DELETE", "products", [("products", "-1")]),
+]
+
+
+def compute_dashboard_stats(conn):
+    return {name: conn.execute(sql).fetchone()[0] for name, sql in DASHBOARD_STATS.items()}
+
+
+def create_dashboard_stats(cursor):
+    """Counters for admin_dashboard(), kept current by triggers.
+
+    The dashboard reads four rows instead of scanning orders, admissions
+    and products on every load. Counters are filled from the tables the
+    first time the stats table is created.
+    """
+    existed = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'stats'"
+    ).fetchone()
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS stats (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """)
+    for trigger, event, table, deltas in DASHBOARD_TRIGGERS:
+        updates = "\n".join(
+            f"UPDATE stats SET value = value + {delta} WHERE name = '{name}';"
+            for name, delta in deltas
+        )
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {trigger} AFTER {event} ON {table} BEGIN
+            {updates}
+        END
+        """)
+
+    if not existed:
+        cursor.executemany(
+            "INSERT OR REPLACE INTO stats (name, value) VALUES (?, ?)",
+            compute_dashboard_stats(cursor).items()
+        )
+
+
+def read_dashboard_stats(conn):
+    return dict(conn.execute("SELECT name, value FROM stats").fetchall())
+
+
+@app.cli.command("stats-reconcile")
+@click.option("--check", is_flag=True, help="Only report drift; exit 1 if there is any.")
+def stats_reconcile_command(check):
+    """Recompute the dashboard counters from scratch and report drift."""
+    conn = open_connection()
+    # Hold the write lock so no trigger fires between counting and storing
+    conn.execute("BEGIN IMMEDIATE")
+    stored = read_dashboard_stats(conn)
+    actual = compute_dashboard_stats(conn)
+
+    drift = {}
+    for name, value in actual.items():
+        delta = value - stored.get(name, 0)
+        if delta or name not in stored:
+            drift[name] = delta
+        click.echo(f"{name:<16} stored {stored.get(name, '-'):>12} actual {value:>12} drift {delta:>+8}")
+
+    if drift and not check:
+        conn.executemany(
+            "INSERT OR REPLACE INTO stats (name, value) VALUES (?, ?)", actual.items()
+        )
+        conn.commit()
+        click.echo(f"Corrected {len(drift)} counter(s).")
+    else:
+        conn.rollback()
+        click.echo("No drift." if not drift else f"{len(drift)} counter(s) drifted.")
+    conn.close()
+    if check and drift:
+        raise SystemExit(1)
+
+
+# ---------------- MIGRATIONS ----------------
+# init_db() is the baseline schema. Every change after it is a numbered
+# migration; the number of the last one applied is kept in the database's
+# PRAGMA user_version. Append new migrations, never edit applied ones.
+
+MIGRATIONS = [
+    (1, "indexes for status filters and order item lookups", [
+        "CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)",
+        "CREATE INDEX IF NOT EXISTS idx_admissions_status ON admissions(status)",
+        "CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items(order_id)",
+    ]),
+    (2, "server-side cart store", [
+        """
+        CREATE TABLE IF NOT EXISTS carts (
+            id TEXT PRIMARY KEY,
+            revision INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_carts_updated_at ON carts(updated_at)",
+        """
+        CREATE TABLE IF NOT EXISTS cart_items (
+            cart_id TEXT NOT NULL REFERENCES carts(id) ON DELETE CASCADE,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL CHECK (quantity > 0),
+            PRIMARY KEY (cart_id, product_id)
+        ) WITHOUT ROWID
+        """,
+    ]),
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Apply pending migrations, each in its own transaction.
+
+    Every migration takes the write lock and re-reads the version first,
+    so processes starting together apply each one exactly once. Returns
+    the versions applied.
+    """
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version <= schema_version(conn):
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= schema_version(conn):
+                conn.rollback()
+                continue
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        app.logger.info("Applied migration %d: %s", version, description)
+        applied.append(version)
+    return applied
+
+
+@app.cli.command("db-migrate")
+def db_migrate_command():
+    """Apply pending schema migrations and list them all."""
+    conn = open_connection()
+    migrate(conn)
+    current = schema_version(conn)
     conn.close()
+    for version, description, _ in MIGRATIONS:
+        mark = "x" if version <= current else " "
+        click.echo(f"[{mark}] {version:>3}  {description}")
+    click.echo(f"Schema version {current}.")
 
 
 def seed_products():
-    conn = sqlite3.connect(DB_PATH)
+    conn = open_connection()
 
+    # Take the write lock before counting so racing workers seed only once
+    conn.execute("BEGIN IMMEDIATE")
     existing = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
     if existing > 0:
+        conn.rollback()
         conn.close()
         return
 
@@ -240,22 +2310,587 @@ def seed_products():
 
     conn.commit()
     conn.close()
+    invalidate_catalog()
+
+
+# ---------------- CATALOG CACHE ----------------
+
+MISSING = object()
+
+
+class LRUCache:
+    """Size-bounded, thread-safe LRU with a per-entry TTL.
+
+    `on_evict`, if given, is called with every value that leaves the
+    cache (expired, pushed out, replaced, discarded or cleared). Expired
+    entries are swept out by get() and set() every quarter TTL, and by
+    purge_expired(), not only when their own key is read again.
+    """
+
+    def __init__(self, maxsize, ttl, on_evict=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def _evicted(self, entry):
+        if self.on_evict is not None and entry is not None:
+            self.on_evict(entry[1])
+
+    def _sweep(self, now):
+        # The caller holds the lock
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + max(self.ttl / 4, 1.0)
+        expired = [key for key, entry in self._data.items() if entry[0] < now]
+        for key in expired:
+            self._evicted(self._data.pop(key))
+
+    def purge_expired(self):
+        with self._lock:
+            self._next_sweep = 0.0
+            self._sweep(time.monotonic())
+
+    def values(self):
+        with self._lock:
+            return [entry[1] for entry in self._data.values()]
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            entry = self._data.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._data[key]
+                    self._evicted(entry)
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            old = self._data.get(key)
+            if old is not None and old[1] is not value:
+                self._evicted(old)
+            self._data[key] = (now + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._evicted(self._data.popitem(last=False)[1])
+
+    def discard(self, key):
+        with self._lock:
+            self._evicted(self._data.pop(key, None))
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._data.values())
+            self._data.clear()
+            for entry in entries:
+                self._evicted(entry)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+catalog_cache = LRUCache(app.config["CATALOG_CACHE_SIZE"], app.config["CATALOG_CACHE_TTL"])
+catalog_cache.version = None
+
+
+def invalidate_catalog():
+    """Drop this worker's cached catalog; other workers notice the version bump."""
+    catalog_cache.clear()
+    catalog_cache.version = None
+
+
+def get_catalog_cache(conn):
+    """The catalog cache, emptied first if products changed in any process.
+
+    The version row is read at most once per request.
+    """
+    version = g.get("catalog_version") if has_app_context() else None
+    if version is None:
+        version = conn.execute(
+            "SELECT version FROM catalog_version WHERE id = 1"
+        ).fetchone()[0]
+        if has_app_context():
+            g.catalog_version = version
+    if catalog_cache.version != version:
+        catalog_cache.clear()
+        catalog_cache.version = version
+    return catalog_cache
+
+
+def cached_catalog(conn, key, loader):
+    cache = get_catalog_cache(conn)
+    value = cache.get(key)
+    if value is MISSING:
+        value = loader()
+        cache.set(key, value)
+    return value
+
+
+def get_product(conn, product_id):
+    return cached_catalog(
+        conn,
+        ("product", product_id),
+        lambda: conn.execute(
+            "SELECT * FROM products WHERE id = ?",
+            (product_id,)
+        ).fetchone()
+    )
+
+
+# ---------------- ORDER PII ----------------
+# Admin order pages need customer names and phones in plaintext. They are
+# decrypted a page at a time in one batch (spread over a few threads for
+# big exports) and kept in a small per-admin-session cache. The cache
+# holds only bytearrays, which are overwritten with zeros when they are
+# pushed out, the admin logs out, or they expire: a sweeper thread purges
+# expired entries every PII_SWEEP_INTERVAL seconds, so an idle session's
+# plaintexts do not outlive PII_CACHE_TTL. The str copies a page renders
+# from belong to that request and are dropped with it; Python offers no
+# way to zero them.
 
+UNREADABLE = "[unreadable]"
+PII_SWEEP_INTERVAL = 10.0
+
+
+def zero_plaintext(buffer):
+    buffer[:] = bytes(len(buffer))
+
+
+pii_caches = LRUCache(
+    32, app.config["PII_CACHE_TTL"], on_evict=lambda cache: cache.clear()
+)
+
+
+def admin_pii_cache():
+    """This admin session's plaintext cache, or None outside an admin request."""
+    if not has_app_context() or not session.get("admin_logged_in"):
+        return None
+    cache_id = session.get("pii_cache_id")
+    if cache_id is None:
+        cache_id = session["pii_cache_id"] = uuid.uuid4().hex
+    cache = pii_caches.get(cache_id)
+    if cache is MISSING:
+        cache = LRUCache(
+            app.config["PII_CACHE_SIZE"], app.config["PII_CACHE_TTL"], on_evict=zero_plaintext
+        )
+        pii_caches.set(cache_id, cache)
+        start_pii_sweeper()
+    return cache
+
+
+_pii_sweeper_pid = None
+_pii_sweeper_lock = threading.Lock()
+
+
+def start_pii_sweeper():
+    """Start (once per process) the thread that zeros expired plaintexts."""
+    global _pii_sweeper_pid
+    if _pii_sweeper_pid == os.getpid():
+        return
+    with _pii_sweeper_lock:
+        if _pii_sweeper_pid != os.getpid():
+            threading.Thread(target=sweep_pii_caches, name="pii-sweeper", daemon=True).start()
+            _pii_sweeper_pid = os.getpid()
+
+
+def sweep_pii_caches():
+    while True:
+        time.sleep(PII_SWEEP_INTERVAL)
+        pii_caches.purge_expired()
+        for cache in pii_caches.values():
+            cache.purge_expired()
+
+
+def drop_pii_cache():
+    """Zero and forget the current admin session's plaintexts."""
+    cache_id = session.pop("pii_cache_id", None)
+    if cache_id is not None:
+        pii_caches.discard(cache_id)
+
+
+def decrypt_batch(tokens):
+    """Map each Fernet token to its plaintext, decrypting each one once.
+
+    Cached plaintexts are reused and the rest are decrypted in this
+    thread: a token is too small for the GIL-free part of Fernet to pay
+    for handing it to another one. Tokens that fail to decrypt map to
+    UNREADABLE.
+    """
+    cache = admin_pii_cache()
+    plaintexts = {"": "", None: ""}
+    pending = []
+    for token in set(tokens) - plaintexts.keys():
+        hit = cache.get(token) if cache is not None else MISSING
+        if hit is MISSING:
+            pending.append(token)
+        else:
+            plaintexts[token] = hit.decode()
+
+    for token in pending:
+        try:
+            # Keep the zeroable copy only; the bytes Fernet returned go now
+            buffer = bytearray(cipher.decrypt(token.encode()))
+        except InvalidToken:
+            plaintexts[token] = UNREADABLE
+            continue
+        plaintexts[token] = buffer.decode()
+        if cache is not None:
+            cache.set(token, buffer)
+        else:
+            zero_plaintext(buffer)
+    return plaintexts
+
+
+def decrypt_orders(orders, fields=("customer_name", "customer_phone")):
+    """Order rows as dicts with `fields` decrypted, one batch for all rows."""
+    plaintexts = decrypt_batch([order[field] for order in orders for field in fields])
+    decrypted = []
+    for order in orders:
+        order = dict(order)
+        for field in fields:
+            order[field] = plaintexts[order[field]]
+        decrypted.append(order)
+    return decrypted
+
+# ---------------- CART STORE ----------------
+# The session cookie only carries an opaque cart id and the revision of the
+# cart it last saw. Lines live in SQLite as (product_id, quantity); every
+# worker keeps recently used carts in memory and trusts its copy only while
+# the revision matches the session's, so a change made through another
+# worker is always picked up.
+
+CartState = namedtuple("CartState", "revision lines count")
+EMPTY_CART = CartState(0, {}, 0)
+
+cart_cache = LRUCache(app.config["CART_CACHE_SIZE"], app.config["CART_CACHE_TTL"])
+
+
+def load_cart(conn, cart_id):
+    """CartState of a stored cart, or None if there is no such cart."""
+    rows = conn.execute("""
+        SELECT c.revision, i.product_id, i.quantity
+        FROM carts c
+        LEFT JOIN cart_items i ON i.cart_id = c.id
+        WHERE c.id = ?
+    """, (cart_id,)).fetchall()
+    if not rows:
+        return None
+    lines = {row[1]: row[2] for row in rows if row[1] is not None}
+    state = CartState(rows[0][0], lines, sum(lines.values()))
+    cart_cache.set(cart_id, state)
+    return state
+
+
+def write_cart(conn, cart_id, changes):
+    """Apply {product_id: quantity} to a stored cart, creating it if needed.
+
+    A quantity of 0 removes the line. Runs in its own transaction and
+    returns the new CartState.
+    """
+    removed = [(cart_id, pid) for pid, qty in changes.items() if qty <= 0]
+    kept = [(cart_id, pid, qty) for pid, qty in changes.items() if qty > 0]
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("""
+            INSERT INTO carts (id, revision, updated_at) VALUES (?, 1, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                revision = revision + 1,
+                updated_at = excluded.updated_at
+        """, (cart_id, int(time.time())))
+        conn.executemany(
+            "DELETE FROM cart_items WHERE cart_id = ? AND product_id = ?",
+            removed
+        )
+        conn.executemany("""
+            INSERT INTO cart_items (cart_id, product_id, quantity) VALUES (?, ?, ?)
+            ON CONFLICT(cart_id, product_id) DO UPDATE SET quantity = excluded.quantity
+        """, kept)
+        state = load_cart(conn, cart_id)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        cart_cache.discard(cart_id)
+        raise
+    return state
+
+
+def current_cart():
+    """CartState of this session's cart; empty when it has none.
+
+    Never touches the session unless it is out of date, so read-only
+    pages do not re-send the cookie.
+    """
+    cart_id = session.get("cart_id")
+    if cart_id is None:
+        legacy = session.get("cart")
+        if legacy is not None:
+            return import_session_cart(legacy)
+        return EMPTY_CART
+
+    state = cart_cache.get(cart_id)
+    if state is MISSING or state.revision != session.get("cart_rev"):
+        state = load_cart(get_db(), cart_id)
+        if state is None:
+            # Pruned while the browser kept the cookie
+            forget_cart()
+            return EMPTY_CART
+        if state.revision != session.get("cart_rev"):
+            session["cart_rev"] = state.revision
+    return state
+
+
+def update_cart(changes):
+    """Set {product_id: quantity} on this session's cart (0 removes).
+
+    Changes that leave a line as it is are dropped; when nothing is left
+    neither the database nor the session is written.
+    """
+    state = current_cart()
+    changes = {
+        pid: max(0, qty) for pid, qty in changes.items()
+        if max(0, qty) != state.lines.get(pid, 0)
+    }
+    if not changes:
+        return state
+
+    cart_id = session.get("cart_id") or uuid.uuid4().hex
+    state = write_cart(get_db(), cart_id, changes)
+    session["cart_id"] = cart_id
+    session["cart_rev"] = state.revision
+    return state
+
+
+def forget_cart():
+    cart_id = session.pop("cart_id", None)
+    session.pop("cart_rev", None)
+    if cart_id is not None:
+        cart_cache.discard(cart_id)
+    return cart_id
+
+
+def empty_cart():
+    """Delete this session's cart."""
+    cart_id = forget_cart()
+    if cart_id is not None:
+        conn = get_db()
+        conn.execute("DELETE FROM carts WHERE id = ?", (cart_id,))
+        conn.commit()
+
+
+def import_session_cart(legacy):
+    """Move a cart kept in the cookie by older versions into the store."""
+    session.pop("cart", None)
+    changes = {}
+    for item in legacy if isinstance(legacy, list) else []:
+        try:
+            changes[int(item["id"])] = int(item.get("quantity", 1))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            continue
+    return update_cart(changes)
 
-init_db()
-seed_products()
-# ---------------- CART SAFE HELPER ----------------
 
 def get_cart():
-    cart = session.get("cart", [])
-    fixed_cart = []
+    """This session's cart as [{"id": ..., "quantity": ...}] lines."""
+    return [
+        {"id": pid, "quantity": qty}
+        for pid, qty in current_cart().lines.items()
+    ]
+
 
+def cart_details(conn, cart):
+    """Display rows (name, price, image, quantity) for cart lines, from one
+    product lookup. Products that no longer exist are left out."""
+    if not cart:
+        return []
+    products = {
+        row["id"]: row for row in conn.execute(
+            "SELECT id, name, price, image FROM products "
+            "WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps([item["id"] for item in cart]),)
+        ).fetchall()
+    }
+    items = []
     for item in cart:
-        if isinstance(item, dict):
-            fixed_cart.append(item)
+        product = products.get(item["id"])
+        if product is None:
+            continue
+        items.append({
+            "id": product["id"],
+            "name": product["name"],
+            "price": to_money(product["price"]),
+            "image": product["image"],
+            "quantity": item["quantity"]
+        })
+    return items
+
+
+@app.cli.command("carts-prune")
+@click.option("--days", type=int, default=None,
+              help="Age in days after which an untouched cart is deleted.")
+def carts_prune_command(days):
+    """Delete carts nobody has touched for CART_MAX_AGE_DAYS."""
+    days = app.config["CART_MAX_AGE_DAYS"] if days is None else days
+    cutoff = int(time.time()) - days * 86400
+    conn = open_connection()
+    deleted = conn.execute("DELETE FROM carts WHERE updated_at < ?", (cutoff,)).rowcount
+    conn.commit()
+    conn.close()
+    click.echo(f"Deleted {deleted} cart(s) older than {days} day(s).")
+
+
+# ---------------- CART PRICING ----------------
+
+CENT = Decimal("0.01")
+# School and supplier shares; the courier gets what is left (10%), so the
+# three always add up to the subtotal exactly
+SCHOOL_SHARE = Decimal("0.20")
+SUPPLIER_SHARE = Decimal("0.70")
+
+
+def to_money(value):
+    return Decimal(str(value)).quantize(CENT, ROUND_HALF_UP)
+
+
+def price_cart(conn, cart):
+    """Validated cart lines and their subtotal, from one product lookup.
+
+    Returns ([(product_id, quantity, unit_price), ...], subtotal) with
+    prices as Decimal. Lines for products that no longer exist are
+    dropped, quantities below 1 count as 1 and repeated lines for one
+    product are merged.
+    """
+    quantities = {}
+    for item in cart:
+        if not isinstance(item, dict):
+            continue
+        try:
+            product_id = int(item["id"])
+            quantity = max(1, int(item.get("quantity", 1)))
+        except (KeyError, TypeError, ValueError):
+            continue
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+
+    if not quantities:
+        return [], Decimal("0.00")
+
+    prices = dict(conn.execute(
+        "SELECT id, price FROM products WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(quantities)),)
+    ).fetchall())
+
+    lines = []
+    subtotal = Decimal("0.00")
+    for product_id, quantity in quantities.items():
+        if product_id not in prices:
+            continue
+        price = to_money(prices[product_id])
+        lines.append((product_id, quantity, price))
+        subtotal += price * quantity
+    return lines, subtotal
+
+
+def revenue_split(subtotal):
+    """(school, supplier, courier) shares of `subtotal`, rounded to cents."""
+    school = (subtotal * SCHOOL_SHARE).quantize(CENT, ROUND_HALF_UP)
+    supplier = (subtotal * SUPPLIER_SHARE).quantize(CENT, ROUND_HALF_UP)
+    return school, supplier, subtotal - school - supplier
+
+# ---------------- PAGE CACHE ----------------
+# Static-content pages are rendered once per worker and then served from
+# memory with validators, so browsers and proxies can revalidate cheaply.
+
+page_cache = LRUCache(app.config["PAGE_CACHE_SIZE"], app.config["PAGE_CACHE_TTL"])
+_page_templates = {}
+
+
+def page_template_info(name):
+    """Which context a template (and the templates it extends) reads, and
+    when any of them last changed on disk."""
+    info = _page_templates.get(name)
+    if info is None:
+        env = app.jinja_env
+        seen = set()
+        pending = [name]
+        variables = set()
+        mtime = 0
+        while pending:
+            current = pending.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            source, filename, _ = env.loader.get_source(env, current)
+            ast = env.parse(source)
+            variables |= meta.find_undeclared_variables(ast)
+            pending.extend(t for t in meta.find_referenced_templates(ast) if t)
+            if filename:
+                mtime = max(mtime, os.path.getmtime(filename))
+        info = {
+            "uses_cart": "cart_count" in variables,
+            "last_modified": datetime.fromtimestamp(int(mtime), timezone.utc)
+        }
+        _page_templates[name] = info
+    return info
+
+
+def render_cached_page(template):
+    """render_template() for pages whose only dynamic input is the cart badge.
+
+    The rendered body is kept in page_cache per (template, cart count) -
+    or just per template when it never shows the badge - and answered with
+    a strong ETag and Last-Modified, returning 304 without rendering when
+    the client already has it. Pages without the badge never read the
+    session, so their public responses are the same for every visitor.
+    """
+    if app.debug:
+        return render_template(template)
+
+    info = page_template_info(template)
+    key = template
+    if info["uses_cart"]:
+        key = (template, inject_cart_count()["cart_count"])
+
+    entry = page_cache.get(key)
+    if entry is MISSING:
+        if info["uses_cart"]:
+            body = render_template(template)
+        else:
+            # Not render_template(): inject_cart_count reads the session,
+            # which would add Vary: Cookie (and maybe a Set-Cookie) to a
+            # public response, and only when it missed the cache
+            body = app.jinja_env.get_template(template).render()
+        body = body.encode()
+        entry = (body, hashlib.sha256(body).hexdigest()[:32])
+        page_cache.set(key, entry)
+
+    body, etag = entry
+    response = Response(body, mimetype="text/html")
+    response.set_etag(etag)
+    response.last_modified = info["last_modified"]
+    if info["uses_cart"]:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    response.cache_control.max_age = app.config["PAGE_CACHE_MAX_AGE"]
+    return response.make_conditional(request)
 
-    session["cart"] = fixed_cart
-    return fixed_cart
 
 # ---------------- AUTH ----------------
 
@@ -267,46 +2902,376 @@ def admin_required(f):
         return f(*args, **kwargs)
     return wrapper
 
-# ---------------- ROUTES ----------------
-@app.route("/admin/dashboard")
-@admin_required
-def admin_dashboard():
-    conn = get_db()
-    cursor = conn.cursor()
+# ---------------- PAGINATION ----------------
+
+Page = namedtuple("Page", "rows next_cursor prev_cursor")
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, size):
+    """The `size` key values in a cursor, or None unless it holds exactly
+    that many plain strings and numbers (anything else cannot be bound)."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    if not all(isinstance(v, (str, int, float)) and not isinstance(v, bool) for v in values):
+        return None
+    return values
+
+
+def fetch_page(conn, select, keys=("id",), where=(), params=(),
+               after=None, before=None, page_size=None):
+    """One page of `select`, newest first, using keyset pagination.
+
+    `keys` is the (unique) sort key, e.g. ("created_at", "id"). Cursors are
+    opaque tokens holding the key of the last/first row on a page, so pages
+    stay stable while rows are inserted and never need OFFSET scans.
+    `params` bind the placeholders of `select` and then `where`, in order.
+    """
+    page_size = page_size or app.config["PAGE_SIZE"]
+    where = list(where)
+    params = list(params)
+    key_list = ", ".join(keys)
+
+    after_key = decode_cursor(after, len(keys))
+    before_key = None if after_key else decode_cursor(before, len(keys))
+
+    # Walking backwards scans ascending from the cursor and flips the result
+    backwards = before_key is not None
+    if after_key is not None:
+        where.append(f"({key_list}) < ({', '.join('?' * len(keys))})")
+        params.extend(after_key)
+    elif backwards:
+        where.append(f"({key_list}) > ({', '.join('?' * len(keys))})")
+        params.extend(before_key)
+
+    sql = select
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    direction = "ASC" if backwards else "DESC"
+    sql += " ORDER BY " + ", ".join(f"{k} {direction}" for k in keys)
+    sql += " LIMIT ?"
+    params.append(page_size + 1)
+
+    rows = conn.execute(sql, params).fetchall()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    if not rows:
+        return Page(rows, None, None)
+
+    first = encode_cursor(rows[0][k] for k in keys)
+    last = encode_cursor(rows[-1][k] for k in keys)
+    if backwards:
+        return Page(rows, last, first if has_more else None)
+    return Page(rows, last if has_more else None, first if after_key else None)
+
+
+# ---------------- PRODUCT SEARCH ----------------
+
+# Column weights for bm25(): a hit in the name beats the category, which
+# beats the description
+SEARCH_WEIGHTS = (10.0, 2.0, 5.0)
+_HL_OPEN, _HL_CLOSE = "\x02", "\x03"
+
+_fts_enabled = None
+
+
+def fts_enabled(conn):
+    global _fts_enabled
+    if _fts_enabled is None:
+        _fts_enabled = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'products_fts'"
+        ).fetchone() is not None
+    return _fts_enabled
+
+
+def fts_query(q):
+    """Turn free text into an FTS5 query: every word, prefix-matched."""
+    words = re.findall(r"\w+", q)
+    return " ".join(f'"{w}"*' for w in words)
+
+
+def highlight_markup(text):
+    """Escape FTS5 output, then turn our sentinels into <mark> tags."""
+    if not text:
+        return Markup("")
+    return Markup(
+        str(escape(text))
+        .replace(_HL_OPEN, "<mark>")
+        .replace(_HL_CLOSE, "</mark>")
+    )
+
+
+def search_products(conn, q, after=None, before=None):
+    """Ranked page of products matching q, plus highlights keyed by id."""
+    match = fts_query(q)
+    if not match or not fts_enabled(conn):
+        like = f"%{q}%"
+        page = fetch_page(
+            conn,
+            "SELECT * FROM products",
+            where=["(name LIKE ? OR description LIKE ? OR category LIKE ?)"],
+            params=[like, like, like],
+            after=after,
+            before=before
+        )
+        return page, {}
+
+    # Best match first; id breaks ties so the cursor stays unique
+    page = fetch_page(
+        conn,
+        f"""
+        SELECT * FROM (
+            SELECT p.*,
+                   -bm25(products_fts, {", ".join(map(str, SEARCH_WEIGHTS))}) AS score,
+                   highlight(products_fts, 0, '{_HL_OPEN}', '{_HL_CLOSE}') AS name_hl,
+                   snippet(products_fts, 1, '{_HL_OPEN}', '{_HL_CLOSE}', '…', 12) AS snippet
+            FROM products_fts
+            JOIN products p ON p.id = products_fts.rowid
+            WHERE products_fts MATCH ?
+        )""",
+        keys=("score", "id"),
+        params=[match],
+        after=after,
+        before=before
+    )
+    highlights = {
+        row["id"]: {
+            "name": highlight_markup(row["name_hl"]),
+            "snippet": highlight_markup(row["snippet"])
+        }
+        for row in page.rows
+    }
+    return page, highlights
 
-    # Total orders
-    total_orders = cursor.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
 
-    # Total revenue
-    total_revenue = cursor.execute(
-        "SELECT SUM(total_amount) FROM orders WHERE status='paid'"
-    ).fetchone()[0] or 0
+# ---------------- NEWS FEED ----------------
 
-    # New admissions
-    new_admissions = cursor.execute(
-        "SELECT COUNT(*) FROM admissions WHERE status='new'"
-    ).fetchone()[0]
+def load_post_feed(conn, posts_db=None):
+    """Posts (newest first) with their media attached.
 
-    # Total products
-    total_products = cursor.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+    Two queries no matter how many posts there are: one for the posts
+    (unless a page of them is passed in) and one for all of their media,
+    grouped here instead of one query per post.
+    """
+    if posts_db is None:
+        posts_db = conn.execute("""
+            SELECT id, title, description, created_at
+            FROM posts
+            ORDER BY created_at DESC, id DESC
+        """).fetchall()
 
-    # Posts for the dashboard (existing news posts)
-    posts_db = cursor.execute("SELECT * FROM posts ORDER BY created_at DESC").fetchall()
     posts = []
+    by_id = {}
     for p in posts_db:
-        media = cursor.execute(
-            "SELECT file_path, media_type FROM post_media WHERE post_id=?",
-            (p["id"],)
-        ).fetchall()
-        posts.append({
+        post = {
             "id": p["id"],
             "title": p["title"],
             "description": p["description"],
-            "date": p["created_at"],
-            "media": [dict(m) for m in media]
-        })
+            "date": p["created_at"],  # you can format in template
+            "media": [],
+            "images": []
+        }
+        posts.append(post)
+        by_id[p["id"]] = post
+
+    if not by_id:
+        return posts
+
+    # json_each keeps this a single bound parameter however long the list is
+    media = conn.execute("""
+        SELECT post_id, file_path, media_type
+        FROM post_media
+        WHERE post_id IN (SELECT value FROM json_each(?))
+        ORDER BY post_id, id
+    """, (json.dumps(list(by_id)),)).fetchall()
+
+    for m in media:
+        post = by_id[m["post_id"]]
+        post["media"].append({"file_path": m["file_path"], "media_type": m["media_type"]})
+        if m["media_type"] == "image":
+            post["images"].append(m["file_path"])
+
+    return posts
 
-    conn.close()
+
+# ---------------- ORDER LISTING ----------------
+
+def load_order_items(conn, orders):
+    """Pair each order with its books, using one joined query for all of them."""
+    listing = []
+    by_id = {}
+    for order in orders:
+        entry = {"order": order, "items": []}
+        listing.append(entry)
+        by_id[order["id"]] = entry
+
+    if not by_id:
+        return listing
+
+    items = conn.execute("""
+        SELECT oi.order_id, p.name AS book_name, oi.quantity, oi.price
+        FROM order_items oi
+        JOIN products p ON oi.product_id = p.id
+        WHERE oi.order_id IN (SELECT value FROM json_each(?))
+        ORDER BY oi.order_id, oi.id
+    """, (json.dumps(list(by_id)),)).fetchall()
+
+    for item in items:
+        by_id[item["order_id"]]["items"].append(item)
+
+    return listing
+
+
+# ---------------- EXPORT ----------------
+# Exports walk their table in id order EXPORT_BATCH_SIZE rows at a time on
+# a connection of their own, so a year of orders streams out in bounded
+# memory and no read transaction is held open between batches.
+
+EXPORT_BATCH_SIZE = 1000
+
+EXPORTS = {
+    "orders": (
+        """
+        SELECT id, created_at, status, customer_name, customer_phone,
+               subtotal, delivery_fee, school_amount, supplier_amount,
+               courier_amount, total_amount
+        FROM orders
+        """,
+        "id",
+        "created_at",
+    ),
+    "items": (
+        """
+        SELECT oi.id, oi.order_id, o.created_at, o.status, oi.product_id,
+               p.name AS book_name, oi.quantity, oi.price,
+               oi.quantity * oi.price AS line_total
+        FROM order_items oi
+        JOIN orders o ON o.id = oi.order_id
+        LEFT JOIN products p ON p.id = oi.product_id
+        """,
+        "oi.id",
+        "o.created_at",
+    ),
+    "admissions": (
+        """
+        SELECT id, created_at, status, payment_status, payment_id,
+               learner_name, parent_name, phone, email, grade, amount_paid,
+               birth_certificate, parent_id_copy, latest_report,
+               proof_of_residence, message
+        FROM admissions
+        """,
+        "id",
+        "created_at",
+    ),
+}
+
+
+def export_batches(dataset, since=None, until=None):
+    """Yield lists of row dicts for `dataset`, optionally by created_at date."""
+    select, key, created = EXPORTS[dataset]
+    where, params = [], []
+    if since:
+        where.append(f"{created} >= ?")
+        params.append(since)
+    if until:
+        where.append(f"{created} < date(?, '+1 day')")
+        params.append(until)
+
+    conn = open_connection()
+    try:
+        last_id = 0
+        while True:
+            sql = select + " WHERE " + " AND ".join(where + [f"{key} > ?"])
+            sql += f" ORDER BY {key} LIMIT ?"
+            rows = conn.execute(sql, params + [last_id, EXPORT_BATCH_SIZE]).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+            if dataset == "orders":
+                yield decrypt_orders(rows)
+            else:
+                yield [dict(row) for row in rows]
+    finally:
+        conn.close()
+
+
+def csv_cell(value):
+    # Keep spreadsheets from running cell text such as "=HYPERLINK(...)"
+    if isinstance(value, str) and value[:1] in ("=", "+", "-", "@", "\t", "\r"):
+        return "'" + value
+    return value
+
+
+def export_columns(conn, dataset):
+    """Column names of an export, known even when it has no rows."""
+    cursor = conn.execute(EXPORTS[dataset][0] + " LIMIT 0")
+    return [column[0] for column in cursor.description]
+
+
+def export_csv(batches, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # The header goes out first, so an empty export is still a valid CSV
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for rows in batches:
+        writer.writerows([csv_cell(v) for v in row.values()] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def export_ndjson(batches, columns):
+    for rows in batches:
+        yield "".join(json.dumps(row, default=str) + "\n" for row in rows)
+
+
+EXPORT_FORMATS = {
+    "csv": (export_csv, "text/csv"),
+    "ndjson": (export_ndjson, "application/x-ndjson"),
+}
+
+
+# ---------------- ROUTES ----------------
+@app.route("/admin/dashboard")
+@admin_required
+def admin_dashboard():
+    conn = get_db()
+
+    # Trigger-maintained counters; see create_dashboard_stats()
+    stats = read_dashboard_stats(conn)
+    total_orders = stats.get("orders", 0)
+    total_revenue = stats.get("revenue_cents", 0) / 100
+    new_admissions = stats.get("new_admissions", 0)
+    total_products = stats.get("products", 0)
+    itn = itn_health(conn)
+
+    # Posts for the dashboard (existing news posts), a page at a time
+    page = fetch_page(
+        conn,
+        "SELECT id, title, description, created_at FROM posts",
+        keys=("created_at", "id"),
+        after=request.args.get("after"),
+        before=request.args.get("before"),
+        page_size=app.config["ADMIN_PAGE_SIZE"]
+    )
+    posts = load_post_feed(conn, page.rows)
 
     return render_template(
         "admin_dashboard.html",
@@ -314,58 +3279,44 @@ def admin_dashboard():
         total_revenue=total_revenue,
         new_admissions=new_admissions,
         total_products=total_products,
-        posts=posts
+        itn=itn,
+        posts=posts,
+        page=page
     )
 
 
 
 @app.route("/")
 def home():
-    return render_template("home.html")
+    return render_cached_page("home.html")
 
 
 @app.route("/history")
 def history():
-    return render_template("history.html")
+    return render_cached_page("history.html")
 
 
 @app.route("/news")
 def news():
     conn = get_db()
-    cursor = conn.cursor()
-
-    posts_db = cursor.execute("""
-        SELECT * FROM posts
-        ORDER BY created_at DESC
-    """).fetchall()
 
-    posts = []
-
-    for p in posts_db:
-        media = cursor.execute("""
-            SELECT file_path, media_type
-            FROM post_media
-            WHERE post_id = ?
-        """, (p["id"],)).fetchall()
-
-        posts.append({
-            "id": p["id"],
-            "title": p["title"],
-            "description": p["description"],
-            "date": p["created_at"],  # you can format in template
-            "media": [dict(m) for m in media]
-        })
-
-    conn.close()
+    page = fetch_page(
+        conn,
+        "SELECT id, title, description, created_at FROM posts",
+        keys=("created_at", "id"),
+        after=request.args.get("after"),
+        before=request.args.get("before")
+    )
+    posts = load_post_feed(conn, page.rows)
 
-    return render_template("news.html", posts=posts)
+    return render_template("news.html", posts=posts, page=page)
 
 
 # ---------------- CONTACT ----------------
 
 @app.route("/contact")
 def contact():
-    return render_template("contact.html")
+    return render_cached_page("contact.html")
 
 
 # ---------------- SHOP ----------------
@@ -374,34 +3325,28 @@ def contact():
 def shop():
     q = request.args.get("q", "").strip()
     conn = get_db()
+    after = request.args.get("after")
+    before = request.args.get("before")
 
-    try:
+    def load_listing():
         if q:
-            products = conn.execute("""
-                SELECT * FROM products
-                WHERE name LIKE ? OR description LIKE ? OR category LIKE ?
-                ORDER BY id DESC
-            """, (f"%{q}%", f"%{q}%", f"%{q}%")).fetchall()
-        else:
-            products = conn.execute(
-                "SELECT * FROM products ORDER BY id DESC"
-            ).fetchall()
-    finally:
-        conn.close()
+            return search_products(conn, q, after, before)
+        return fetch_page(conn, "SELECT * FROM products", after=after, before=before), {}
+
+    page, highlights = cached_catalog(conn, ("shop", q, after, before), load_listing)
 
-    return render_template("shop.html", products=products, query=q)
+    return render_template(
+        "shop.html",
+        products=page.rows,
+        query=q,
+        page=page,
+        highlights=highlights
+    )
 
 
 @app.route("/product/<int:product_id>")
 def product_detail(product_id):
-    conn = get_db()
-    try:
-        product = conn.execute(
-            "SELECT * FROM products WHERE id = ?",
-            (product_id,)
-        ).fetchone()
-    finally:
-        conn.close()
+    product = get_product(get_db(), product_id)
 
     if not product:
         return render_template("404.html"), 404
@@ -413,59 +3358,37 @@ def product_detail(product_id):
 
 @app.route("/cart")
 def cart():
-    cart_items = get_cart()
-
-    subtotal = 0
-    for item in cart_items:
-        try:
-            subtotal += float(item["price"]) * int(item["quantity"])
-        except (KeyError, ValueError, TypeError):
-            continue
+    cart_items = cart_details(get_db(), get_cart())
 
-    total = round(subtotal, 2)
+    subtotal = sum(
+        (item["price"] * item["quantity"] for item in cart_items),
+        Decimal("0.00")
+    )
 
     return render_template(
         "cart.html",
         cart_items=cart_items,
-        subtotal=round(subtotal, 2),
-        total=total
+        subtotal=subtotal,
+        total=subtotal
     )
 
 
-# ---------------- ADD TO CART ----------------
-@app.route("/add-to-cart/<int:product_id>", methods=["GET", "POST"])
-def add_to_cart(product_id):
-    conn = get_db()
-    try:
-        product = conn.execute(
-            "SELECT * FROM products WHERE id = ?",
-            (product_id,)
-        ).fetchone()
-    finally:
-        conn.close()
-
-    if not product:
-        flash("Product not found", "danger")
-        return redirect(url_for("shop"))
-
-    cart = get_cart()
-
-    for item in cart:
-        if item["id"] == product["id"]:
-            item["quantity"] += 1
-            break
-    else:
-        cart.append({
-            "id": product["id"],
-            "name": product["name"],
-            "price": float(product["price"]),
-            "image": product["image"],
-            "quantity": 1
-        })
-
-    session["cart"] = cart
-    session.modified = True
-
+# ---------------- ADD TO CART ----------------
+@app.route("/add-to-cart/<int:product_id>", methods=["GET", "POST"])
+def add_to_cart(product_id):
+    product = get_product(get_db(), product_id)
+
+    if not product:
+        flash("Product not found", "danger")
+        return redirect(url_for("shop"))
+
+    try:
+        quantity = parse_quantity(request.form.get("quantity", 1), minimum=1)
+    except CartRequestError:
+        quantity = 1
+    lines = current_cart().lines
+    update_cart({product["id"]: cap_quantity(lines.get(product["id"], 0) + quantity)})
+
     flash("Product added to cart", "success")
     return redirect(url_for("cart"))
 
@@ -474,20 +3397,28 @@ def add_to_cart(product_id):
 @app.route("/remove-from-cart/<int:product_id>", methods=["POST"])
 def remove_from_cart(product_id):
 
-    cart = get_cart()
-    updated_cart = []
+    update_cart({product_id: 0})
+
+    flash("Cart updated", "info")
+    return redirect(url_for("cart"))
 
-    for item in cart:
-        if item["id"] == product_id:
-            if item["quantity"] > 1:
-                item["quantity"] -= 1
-                updated_cart.append(item)
-        else:
-            updated_cart.append(item)
 
-    session["cart"] = updated_cart
-    session.modified = True
+# ---------------- UPDATE CART ----------------
+@app.route("/cart/update", methods=["POST"])
+def update_cart_form():
+    # The cart page's quantity form when JavaScript is off; same rules
+    # as the batch API
+    try:
+        changes = parse_cart_changes({
+            key[len("qty-"):]: value
+            for key, value in request.form.items() if key.startswith("qty-")
+        })
+        check_products(get_db(), changes)
+    except CartRequestError as e:
+        flash(str(e), "danger")
+        return redirect(url_for("cart"))
 
+    update_cart(changes)
     flash("Cart updated", "info")
     return redirect(url_for("cart"))
 
@@ -495,58 +3426,164 @@ def remove_from_cart(product_id):
 # ---------------- CLEAR CART ----------------
 @app.route("/clear-cart", methods=["POST"])
 def clear_cart():
-    session.pop("cart", None)
-    session.modified = True
+    empty_cart()
     flash("Cart cleared", "warning")
     return redirect(url_for("cart"))
 
-# ---------------- CHECKOUT ----------------
-@app.route("/checkout", methods=["GET", "POST"])
-def checkout():
 
-    cart = get_cart()
+# ---------------- CART API ----------------
+# JSON twins of the cart forms for the shop and cart pages: each answers
+# with the lines it touched and the new totals, so the page updates in
+# place instead of redirecting to /cart and re-rendering it. Money is sent
+# as strings to keep it exact.
+
+class CartRequestError(Exception):
+    """A cart change was malformed; the message is user-facing."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def cap_quantity(quantity):
+    return min(quantity, app.config["CART_MAX_QUANTITY"])
+
+
+def parse_quantity(value, minimum=0):
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        raise CartRequestError("Quantity must be a whole number.")
+    if not minimum <= quantity <= app.config["CART_MAX_QUANTITY"]:
+        raise CartRequestError(
+            f"Quantity must be between {minimum} and {app.config['CART_MAX_QUANTITY']}."
+        )
+    return quantity
+
+
+def parse_cart_changes(raw):
+    """{product_id: quantity} from {"<id>": quantity} or [{"id", "quantity"}]."""
+    if isinstance(raw, list):
+        try:
+            raw = {item["id"]: item["quantity"] for item in raw}
+        except (KeyError, TypeError):
+            raise CartRequestError('Each line needs an "id" and a "quantity".')
+    if not isinstance(raw, dict) or not raw:
+        raise CartRequestError("Nothing to update.")
+    if len(raw) > app.config["CART_MAX_LINES"]:
+        raise CartRequestError("Too many lines in one update.")
+
+    changes = {}
+    for product_id, quantity in raw.items():
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            raise CartRequestError("Unknown product.", 404)
+        changes[product_id] = parse_quantity(quantity)
+    return changes
+
+
+def check_products(conn, changes):
+    """Reject changes that add products missing from the catalog; lines
+    being removed may name products that are already gone."""
+    wanted = [pid for pid, qty in changes.items() if qty > 0]
+    if not wanted:
+        return
+    found = {row[0] for row in conn.execute(
+        "SELECT id FROM products WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps(wanted),)
+    )}
+    if len(found) < len(wanted):
+        raise CartRequestError("Unknown product.", 404)
+
+
+def cart_response(conn, state, product_ids):
+    lines, subtotal = price_cart(conn, [
+        {"id": pid, "quantity": qty} for pid, qty in state.lines.items()
+    ])
+    prices = {pid: price for pid, _, price in lines}
+
+    def line(pid):
+        quantity = state.lines.get(pid, 0)
+        price = prices.get(pid)
+        return {
+            "id": pid,
+            "quantity": quantity,
+            "price": None if price is None else str(price),
+            "line_total": str(price * quantity if price is not None else Decimal("0.00"))
+        }
+
+    return jsonify(
+        lines=[line(pid) for pid in product_ids],
+        count=state.count,
+        subtotal=str(subtotal),
+        total=str(subtotal)
+    )
+
+
+def cart_request_json():
+    body = request.get_json(silent=True)
+    return body if isinstance(body, dict) else {}
+
+
+@app.errorhandler(CartRequestError)
+def cart_request_error(e):
+    return jsonify(error=str(e)), e.status
+
+
+@app.route("/api/cart")
+def api_cart():
+    state = current_cart()
+    return cart_response(get_db(), state, list(state.lines))
 
-    if not cart:
-        flash("Your cart is empty", "warning")
-        return redirect(url_for("shop"))
 
+@app.route("/api/cart/add/<int:product_id>", methods=["POST"])
+def api_cart_add(product_id):
+    quantity = parse_quantity(cart_request_json().get("quantity", 1), minimum=1)
     conn = get_db()
-    cursor = conn.cursor()
+    check_products(conn, {product_id: quantity})
+    lines = current_cart().lines
+    state = update_cart({product_id: cap_quantity(lines.get(product_id, 0) + quantity)})
+    return cart_response(conn, state, [product_id])
 
-    # ---------------- SAFE TOTAL CALCULATION ----------------
-    subtotal = 0
-    validated_items = []
 
-    for item in cart:
-        if not isinstance(item, dict):
-            continue
+@app.route("/api/cart/remove/<int:product_id>", methods=["POST"])
+def api_cart_remove(product_id):
+    state = update_cart({product_id: 0})
+    return cart_response(get_db(), state, [product_id])
 
-        product = cursor.execute(
-            "SELECT id, name, price FROM products WHERE id = ?",
-            (item["id"],)
-        ).fetchone()
 
-        if not product:
-            continue
+@app.route("/api/cart/set/<int:product_id>", methods=["POST"])
+def api_cart_set(product_id):
+    quantity = parse_quantity(cart_request_json().get("quantity"))
+    conn = get_db()
+    check_products(conn, {product_id: quantity})
+    state = update_cart({product_id: quantity})
+    return cart_response(conn, state, [product_id])
 
-        quantity = max(1, int(item.get("quantity", 1)))
-        price = float(product["price"])
 
-        subtotal += price * quantity
+@app.route("/api/cart/update", methods=["POST"])
+def api_cart_update():
+    """Set several quantities at once: {"lines": {"<id>": quantity, ...}}
+    or {"lines": [{"id": ..., "quantity": ...}, ...]}; 0 removes."""
+    changes = parse_cart_changes(cart_request_json().get("lines"))
+    conn = get_db()
+    check_products(conn, changes)
+    state = update_cart(changes)
+    return cart_response(conn, state, list(changes))
 
-        validated_items.append({
-            "id": product["id"],
-            "quantity": quantity,
-            "price": price
-        })
+# ---------------- CHECKOUT ----------------
+@app.route("/checkout", methods=["GET", "POST"])
+def checkout():
 
-    if subtotal <= 0:
-        conn.close()
-        flash("Invalid cart data", "danger")
-        return redirect(url_for("cart"))
+    cart = get_cart()
+
+    if not cart:
+        flash("Your cart is empty", "warning")
+        return redirect(url_for("shop"))
 
-    delivery_fee = 0  # Not used anymore
-    total = round(subtotal + delivery_fee, 2)
+    conn = get_db()
+    delivery_fee = Decimal("0.00")  # Not used anymore
 
     # ---------------- POST: CREATE ORDER ----------------
     if request.method == "POST":
@@ -555,22 +3592,29 @@ def checkout():
         phone = request.form.get("phone", "").strip()
 
         if not name or not phone:
-            conn.close()
             flash("Please fill all required fields", "danger")
             return redirect(url_for("checkout"))
 
+        # Encrypt sensitive info
+        enc_name = encrypt_text(name)
+        enc_phone = encrypt_text(phone)
+
         try:
-            # Encrypt sensitive info
-            enc_name = encrypt_text(name)
-            enc_phone = encrypt_text(phone)
+            # Prices are read under the write lock, so the order is charged
+            # exactly what the catalog says at the moment it is stored
+            conn.execute("BEGIN IMMEDIATE")
+            lines, subtotal = price_cart(conn, cart)
 
-            # Revenue split
-            school_cut = round(subtotal * 0.20, 2)
-            supplier_cut = round(subtotal * 0.70, 2)
-            courier_cut = round(subtotal * 0.10, 2)
+            if subtotal <= 0:
+                conn.rollback()
+                flash("Invalid cart data", "danger")
+                return redirect(url_for("cart"))
+
+            total = subtotal + delivery_fee
+            school_cut, supplier_cut, courier_cut = revenue_split(subtotal)
 
             # Create order without delivery
-            cursor.execute("""
+            order_id = conn.execute("""
                 INSERT INTO orders (
                     customer_name,
                     customer_phone,
@@ -585,52 +3629,52 @@ def checkout():
             """, (
                 enc_name,
                 enc_phone,
-                subtotal,
-                delivery_fee,
-                school_cut,
-                supplier_cut,
-                courier_cut,
-                total,
+                float(subtotal),
+                float(delivery_fee),
+                float(school_cut),
+                float(supplier_cut),
+                float(courier_cut),
+                float(total),
                 "pending"
-            ))
+            )).lastrowid
 
-            order_id = cursor.lastrowid
+            # Searchable without decrypting
+            index_order(conn, order_id, name, phone)
 
             # Insert order items (validated only)
-            for item in validated_items:
-                cursor.execute("""
-                    INSERT INTO order_items (
-                        order_id,
-                        product_id,
-                        quantity,
-                        price
-                    ) VALUES (?, ?, ?, ?)
-                """, (
+            conn.executemany("""
+                INSERT INTO order_items (
                     order_id,
-                    item["id"],
-                    item["quantity"],
-                    item["price"]
-                ))
+                    product_id,
+                    quantity,
+                    price
+                ) VALUES (?, ?, ?, ?)
+            """, [
+                (order_id, product_id, quantity, float(price))
+                for product_id, quantity, price in lines
+            ])
 
             conn.commit()
 
         except Exception:
             conn.rollback()
-            conn.close()
             flash("Checkout failed. Try again.", "danger")
             return redirect(url_for("cart"))
 
-        conn.close()
-
         return redirect(url_for("payfast_checkout", order_id=order_id))
 
-    conn.close()
+    # ---------------- GET: SHOW TOTALS ----------------
+    _, subtotal = price_cart(conn, cart)
+
+    if subtotal <= 0:
+        flash("Invalid cart data", "danger")
+        return redirect(url_for("cart"))
 
     return render_template(
         "checkout.html",
-        subtotal=round(subtotal, 2),
+        subtotal=subtotal,
         delivery_fee=delivery_fee,
-        total=total
+        total=subtotal + delivery_fee
     )
 
 
@@ -644,7 +3688,6 @@ def payfast_checkout(order_id):
         "SELECT * FROM orders WHERE id = ? AND status = 'pending'",
         (order_id,)
     ).fetchone()
-    conn.close()
 
     if not order:
         return render_template("404.html"), 404
@@ -678,14 +3721,13 @@ def payment_success():
 
     conn = get_db()
     order = conn.execute("SELECT * FROM orders WHERE id=? AND status='paid'", (order_id,)).fetchone()
-    conn.close()
 
     if not order:
         flash("Payment not verified.", "danger")
         return redirect(url_for("shop"))
 
     # Clear cart and show success page
-    session.pop("cart", None)
+    empty_cart()
     return render_template("payment_success.html", order_id=order_id)
 
 
@@ -699,49 +3741,203 @@ def payment_cancel():
     return redirect(url_for("cart"))
 
 
-# ---------------- PAYFAST ITN (SECURE) ----------------
+# ---------------- PAYFAST ITN INBOX ----------------
+# ITN handlers only persist the notification and answer PayFast straight
+# away; validating it with PayFast and applying it happens here, off the
+# request thread, with retries and backoff.
 
-@app.route("/payment/itn", methods=["POST"])
-def payment_itn():
+class ITNRejected(Exception):
+    """The ITN is invalid for good; retrying will not change that."""
 
-    data = request.form.to_dict()
 
-    # Step 1: Validate with PayFast
-    try:
-        validate_url = PAYFAST_ITN_VALIDATION_URL
-        response = requests.post(validate_url, data=data, timeout=10)
-        if response.text != "VALID":
-            return "Invalid ITN", 400
-    except Exception:
-        return "Validation failed", 400
+def enqueue_itn(source, data):
+    conn = get_db()
+    conn.execute(
+        "INSERT INTO itn_inbox (source, payload) VALUES (?, ?)",
+        (source, json.dumps(data))
+    )
+    conn.commit()
+    if ITN_INLINE_WORKER:
+        start_itn_worker()
+
+
+class PayFastUnavailable(Exception):
+    """PayFast could not be asked; the ITN itself may well be fine."""
+
+
+class CircuitOpen(PayFastUnavailable):
+    """PayFast validation is failing; calls are refused until it cools down."""
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures, then lets a single
+    trial call through every `reset_timeout` seconds until one succeeds."""
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "half_open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.state == "half_open" or self.failures >= self.threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class PayFastClient:
+    """Keep-alive HTTP client for ITN validation, guarded by a breaker."""
+
+    def __init__(self, url, pool_size, timeout, breaker):
+        self.url = url
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.breaker = breaker
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    @property
+    def session(self):
+        # Sockets must not be shared across a fork, so each worker builds its own
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    import requests
+
+                    adapter = requests.adapters.HTTPAdapter(
+                        pool_connections=1,
+                        pool_maxsize=self.pool_size,
+                        max_retries=0
+                    )
+                    session = requests.Session()
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    def validate(self, data):
+        """True if PayFast confirms the ITN.
+
+        Raises CircuitOpen without calling out while the breaker is open,
+        and PayFastUnavailable for transport errors and 5xx responses,
+        which count as breaker failures.
+        """
+        if not self.breaker.allow():
+            with self._lock:
+                self.rejected += 1
+            metrics.inc("payfast_short_circuited_total")
+            raise CircuitOpen("PayFast validation circuit is open")
+
+        started = time.perf_counter()
+        try:
+            response = self.session.post(self.url, data=data, timeout=self.timeout)
+            response.raise_for_status()
+        except Exception as e:
+            self.breaker.record_failure()
+            self._record(started, "error")
+            raise PayFastUnavailable(f"{type(e).__name__}: {e}") from e
+        self.breaker.record_success()
+        valid = response.text.strip() == "VALID"
+        self._record(started, "valid" if valid else "invalid")
+        return valid
+
+    def _record(self, started, outcome):
+        elapsed = time.perf_counter() - started
+        error = outcome == "error"
+        metrics.observe("payfast_request_duration_seconds", elapsed, outcome=outcome)
+        with self._lock:
+            self.calls += 1
+            self.errors += error
+            self.latency_total += elapsed
+            self.latency_max = max(self.latency_max, elapsed)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "breaker": self.breaker.state,
+                "consecutive_failures": self.breaker.failures,
+                "calls": self.calls,
+                "errors": self.errors,
+                "short_circuited": self.rejected,
+                "latency_avg": round(self.latency_total / self.calls, 6) if self.calls else 0,
+                "latency_max": round(self.latency_max, 6),
+            }
+
+
+payfast_client = PayFastClient(
+    PAYFAST_ITN_VALIDATION_URL,
+    pool_size=PAYFAST_POOL_SIZE,
+    timeout=(PAYFAST_CONNECT_TIMEOUT, PAYFAST_READ_TIMEOUT),
+    breaker=CircuitBreaker(PAYFAST_BREAKER_THRESHOLD, PAYFAST_BREAKER_RESET)
+)
+
+
+def validate_itn(data):
+    """True if PayFast confirms the ITN; raises PayFastUnavailable when
+    PayFast cannot be asked."""
+    return payfast_client.validate(data)
 
-    # Step 2: Verify merchant
+
+def apply_order_itn(conn, data, complete_only=False):
+    # Verify merchant
     if data.get("merchant_id") != MERCHANT_ID:
-        return "Invalid merchant", 400
+        raise ITNRejected("Invalid merchant")
 
     order_id = data.get("m_payment_id")
     payment_status = data.get("payment_status")
-    amount_gross = float(data.get("amount_gross", 0))
+    try:
+        amount_gross = float(data.get("amount_gross", 0))
+    except ValueError:
+        raise ITNRejected("Invalid amount")
 
     if not order_id:
-        return "No order id", 400
+        raise ITNRejected("No order id")
+    if complete_only and payment_status != "COMPLETE":
+        raise ITNRejected("Payment not complete")
 
-    conn = get_db()
     order = conn.execute(
         "SELECT * FROM orders WHERE id = ?",
         (order_id,)
     ).fetchone()
 
     if not order:
-        conn.close()
-        return "Order not found", 404
+        raise ITNRejected("Order not found")
 
-    # Step 3: Verify amount matches database
+    # Verify amount matches database
     if float(order["total_amount"]) != amount_gross:
-        conn.close()
-        return "Amount mismatch", 400
+        raise ITNRejected("Amount mismatch")
 
-    # Step 4: Update order securely
+    # Update order securely
     if payment_status == "COMPLETE":
         conn.execute(
             "UPDATE orders SET status = 'paid' WHERE id = ?",
@@ -753,64 +3949,234 @@ def payment_itn():
             (order_id,)
         )
 
-    conn.commit()
-    conn.close()
 
-    return "OK", 200
+def apply_admission_itn(conn, data):
+    # The applicant has no admissions row yet, so the validated inbox row
+    # itself is the record of the fee being paid
+    if data.get("merchant_id") != MERCHANT_ID:
+        raise ITNRejected("Invalid merchant")
+    try:
+        amount = float(data.get("amount_gross", 0))
+    except ValueError:
+        raise ITNRejected("Invalid amount")
+    if data.get("payment_status") != "COMPLETE" or amount != 150.00:
+        raise ITNRejected("Payment not complete")
 
 
-# ---------------- PAYFAST ITN (ADMISSIONS) ----------------
+ITN_HANDLERS = {
+    "payment_itn": apply_order_itn,
+    "payfast_itn": lambda conn, data: apply_order_itn(conn, data, complete_only=True),
+    "admission_payment_itn": apply_admission_itn,
+}
 
-@app.route("/payfast/itn", methods=["POST"])
-def payfast_itn():
 
-    data = request.form.to_dict()
+def itn_retry_delay(attempts):
+    delay = min(ITN_RETRY_BASE * 2 ** (attempts - 1), ITN_RETRY_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_itns(conn, limit):
+    """Lease due ITNs to this worker so no other process picks them up.
 
-    # Validate with PayFast server
+    Claiming counts as an attempt, so an ITN that kills its worker still
+    runs out of them: a lease that runs out (the worker died mid-way)
+    makes the row due again, or failed once ITN_MAX_ATTEMPTS were used.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
     try:
-        response = requests.post(
-            PAYFAST_ITN_VALIDATION_URL,
-            data=data,
-            timeout=10
-        )
-        if response.text != "VALID":
-            return "Invalid ITN", 400
+        abandoned = conn.execute("""
+            UPDATE itn_inbox
+            SET status = 'failed', next_attempt_at = 0, processed_at = CURRENT_TIMESTAMP,
+                last_error = 'Lease ran out on the last attempt; the worker died processing it'
+            WHERE status = 'processing' AND next_attempt_at <= ? AND attempts >= ?
+            RETURNING id
+        """, (now, ITN_MAX_ATTEMPTS)).fetchall()
+        rows = conn.execute("""
+            UPDATE itn_inbox
+            SET status = 'processing', attempts = attempts + 1, next_attempt_at = ?
+            WHERE id IN (
+                SELECT id FROM itn_inbox
+                WHERE status IN ('pending', 'processing') AND next_attempt_at <= ?
+                ORDER BY id
+                LIMIT ?
+            )
+            RETURNING *
+        """, (now + ITN_LEASE, now, limit)).fetchall()
+        conn.commit()
     except Exception:
-        return "Validation failed", 400
+        conn.rollback()
+        raise
+    for row in abandoned:
+        app.logger.error("ITN %s failed: its worker died on the last attempt", row["id"])
+    return sorted(rows, key=lambda row: row["id"])
 
-    if data.get("merchant_id") != MERCHANT_ID:
-        return "Invalid merchant", 400
 
-    payment_status = data.get("payment_status")
-    payment_id = data.get("pf_payment_id")
-    order_id = data.get("m_payment_id")
-    amount = float(data.get("amount_gross", 0))
+def process_itn(conn, row):
+    """Validate and apply one claimed ITN; `row` already counts this attempt."""
+    data = json.loads(row["payload"])
+    attempts = row["attempts"]
+    try:
+        if not validate_itn(data):
+            raise ITNRejected("Invalid ITN")
+        ITN_HANDLERS[row["source"]](conn, data)
+    except ITNRejected as e:
+        status, error, next_attempt = "rejected", str(e), 0
+    except PayFastUnavailable as e:
+        # Not the ITN's fault and PayFast will not resend it, so an outage
+        # of any length never uses up its attempts; try again once the
+        # breaker lets a call through
+        conn.rollback()
+        attempts -= 1
+        status, error = "pending", str(e)
+        next_attempt = time.time() + PAYFAST_BREAKER_RESET * random.uniform(1.0, 1.5)
+        app.logger.warning("ITN %s deferred, PayFast unavailable: %s", row["id"], error)
+    except Exception as e:
+        conn.rollback()
+        error = f"{type(e).__name__}: {e}"
+        if attempts >= ITN_MAX_ATTEMPTS:
+            status, next_attempt = "failed", 0
+        else:
+            status, next_attempt = "pending", time.time() + itn_retry_delay(attempts)
+        app.logger.warning("ITN %s attempt %s failed: %s", row["id"], attempts, error)
+    else:
+        status, error, next_attempt = "done", None, 0
 
-    if payment_status != "COMPLETE" or not order_id:
-        return "Payment not complete", 400
+    # The status update and the inbox bookkeeping commit together
+    conn.execute("""
+        UPDATE itn_inbox
+        SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ?,
+            processed_at = CASE WHEN ? = 'pending' THEN NULL ELSE CURRENT_TIMESTAMP END
+        WHERE id = ?
+    """, (status, attempts, error, next_attempt, status, row["id"]))
+    conn.commit()
+    return status
 
-    conn = get_db()
-    order = conn.execute(
-        "SELECT * FROM orders WHERE id=?",
-        (order_id,)
-    ).fetchone()
 
-    if not order:
+def process_itn_inbox(limit=20):
+    """Process every ITN that is due; returns how many were handled."""
+    conn = open_connection()
+    handled = 0
+    try:
+        while True:
+            rows = claim_itns(conn, limit)
+            if not rows:
+                return handled
+            for row in rows:
+                process_itn(conn, row)
+                handled += 1
+    finally:
         conn.close()
-        return "Order not found", 404
 
-    if float(order["total_amount"]) != amount:
-        conn.close()
-        return "Amount mismatch", 400
 
-    conn.execute("""
-        UPDATE orders
-        SET status='paid'
-        WHERE id=?
-    """, (order_id,))
+_itn_wakeup = threading.Event()
+_itn_worker = None
+_itn_worker_lock = threading.Lock()
+
+
+def run_itn_worker(stop=None):
+    while not (stop and stop.is_set()):
+        try:
+            process_itn_inbox()
+        except Exception:
+            app.logger.exception("ITN worker batch failed")
+        # Outside any request, so this is where its PayFast timings get out
+        metrics.flush()
+        _itn_wakeup.wait(ITN_POLL_INTERVAL)
+        _itn_wakeup.clear()
+
+
+def start_itn_worker():
+    """Start (once per process) the background ITN thread and wake it up."""
+    global _itn_worker
+    worker = _itn_worker
+    if worker is None or not worker.is_alive() or worker.pid != os.getpid():
+        with _itn_worker_lock:
+            if _itn_worker is None or not _itn_worker.is_alive() or _itn_worker.pid != os.getpid():
+                _itn_worker = threading.Thread(
+                    target=run_itn_worker, name="itn-worker", daemon=True
+                )
+                _itn_worker.pid = os.getpid()
+                _itn_worker.start()
+    _itn_wakeup.set()
+
+
+@app.cli.command("itn-worker")
+def itn_worker_command():
+    """Validate and apply queued PayFast ITNs until interrupted."""
+    run_itn_worker()
+
+
+def itn_health(conn):
+    """Counts of ITNs that need a person: failed or rejected for good, and
+    stuck (due for ITN_STUCK_AFTER seconds without being processed)."""
+    health = {"failed": 0, "rejected": 0}
+    health.update(conn.execute("""
+        SELECT status, COUNT(*) FROM itn_inbox
+        WHERE status IN ('failed', 'rejected')
+        GROUP BY status
+    """).fetchall())
+    health["stuck"] = conn.execute("""
+        SELECT COUNT(*) FROM itn_inbox
+        WHERE status IN ('pending', 'processing') AND next_attempt_at < ?
+    """, (time.time() - ITN_STUCK_AFTER,)).fetchone()[0]
+    return health
+
+
+def requeue_itns(conn, ids=(), statuses=()):
+    """Put failed or rejected ITNs back in the queue with fresh attempts;
+    returns how many were requeued. Other rows are left alone."""
+    cursor = conn.execute("""
+        UPDATE itn_inbox
+        SET status = 'pending', attempts = 0, next_attempt_at = 0, processed_at = NULL
+        WHERE status IN ('failed', 'rejected')
+          AND (id IN (SELECT value FROM json_each(?)) OR status IN (SELECT value FROM json_each(?)))
+    """, (json.dumps(list(ids)), json.dumps(list(statuses))))
     conn.commit()
+    return cursor.rowcount
+
+
+@app.cli.command("itn-requeue")
+@click.argument("ids", nargs=-1, type=int)
+@click.option("--failed", is_flag=True, help="Requeue every ITN that ran out of attempts.")
+@click.option("--rejected", is_flag=True, help="Requeue every ITN PayFast or the checks rejected.")
+def itn_requeue_command(ids, failed, rejected):
+    """Retry the given failed or rejected ITNs from scratch."""
+    statuses = [status for status, wanted in (("failed", failed), ("rejected", rejected)) if wanted]
+    if not ids and not statuses:
+        raise click.UsageError("Give ITN ids, --failed or --rejected.")
+    conn = open_connection()
+    requeued = requeue_itns(conn, ids, statuses)
+    health = itn_health(conn)
     conn.close()
+    click.echo(f"Requeued {requeued} ITN(s); a running worker picks them up within "
+               f"{ITN_POLL_INTERVAL:g}s. Still failed: {health['failed']}, "
+               f"rejected: {health['rejected']}.")
+
+
+# ---------------- PAYFAST ITN (SECURE) ----------------
+
+@app.route("/payment/itn", methods=["POST"])
+def payment_itn():
+
+    data = request.form.to_dict()
+    if not data:
+        return "No data", 400
+
+    enqueue_itn("payment_itn", data)
+    return "OK", 200
+
+
+# ---------------- PAYFAST ITN (ADMISSIONS) ----------------
+
+@app.route("/payfast/itn", methods=["POST"])
+def payfast_itn():
+
+    data = request.form.to_dict()
+    if not data:
+        return "No data", 400
 
+    enqueue_itn("payfast_itn", data)
     return "OK", 200
 
 
@@ -818,7 +4184,7 @@ def payfast_itn():
 # This is the info page
 @app.route("/admissions")
 def admissions():
-    return render_template("admissions.html")
+    return render_cached_page("admissions.html")
 
 # This is the route that handles the actual payment process
 @app.route("/admission-payment", methods=["GET", "POST"])
@@ -830,34 +4196,37 @@ def start_admission_payment():
 
     # Step 2: Handle POST submission
     if request.method == "POST":
-        learner = request.form.get("learner_name", "").strip()
-        parent = request.form.get("parent_name", "").strip()
-        phone = request.form.get("phone", "").strip()
-        email = request.form.get("email", "").strip()
-        grade = request.form.get("grade", "").strip()
+        try:
+            form, uploads = read_streamed_form()
+        except UploadRejected as e:
+            flash(str(e), "danger")
+            return redirect(url_for("admissions"))
+
+        learner = form.get("learner_name", "").strip()
+        parent = form.get("parent_name", "").strip()
+        phone = form.get("phone", "").strip()
+        email = form.get("email", "").strip()
+        grade = form.get("grade", "").strip()
 
         if not learner or not parent or not phone or not grade:
+            for upload in uploads.values():
+                upload.discard()
             flash("Please complete all required fields.", "danger")
             return redirect(url_for("admissions"))
 
+        conn = get_db()
+
         # Helper to save documents
-        def save_doc(file):
-            if file and file.filename and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                unique_name = f"{datetime.now().timestamp()}_{filename}"
-                path = os.path.join(app.config["UPLOAD_FOLDER"], unique_name)
-                file.save(path)
-                return "uploads/" + unique_name
-            return ""
+        def save_doc(upload):
+            return upload.store(conn) if upload else ""
 
         # Match these to your form input names
-        birth_path = save_doc(request.files.get("birth_certificate"))
-        parent_id_path = save_doc(request.files.get("parent_id_copy"))
-        report_path = save_doc(request.files.get("latest_report"))
-        residence_path = save_doc(request.files.get("proof_of_residence"))
+        birth_path = save_doc(uploads.get("birth_certificate"))
+        parent_id_path = save_doc(uploads.get("parent_id_copy"))
+        report_path = save_doc(uploads.get("latest_report"))
+        residence_path = save_doc(uploads.get("proof_of_residence"))
 
         try:
-            conn = get_db()
             conn.execute("""
                 INSERT INTO admissions (
                     learner_name, parent_name, phone, email, grade,
@@ -871,8 +4240,9 @@ def start_admission_payment():
                 "paid", "150"
             ))
             conn.commit()
-            conn.close()
         except Exception as e:
+            conn.rollback()
+            release_docs(conn, birth_path, parent_id_path, report_path, residence_path)
             flash(f"Submission failed. Try again. Error: {str(e)}", "danger")
             return redirect(url_for("admissions"))
 
@@ -888,14 +4258,12 @@ def start_admission_payment():
 # ---------------- CONTEXT PROCESSOR ----------------
 @app.context_processor
 def inject_cart_count():
-    cart = session.get("cart", [])
-    count = sum(item.get("quantity", 0) for item in cart if isinstance(item, dict))
-    return dict(cart_count=count)
+    return dict(cart_count=current_cart().count)
 
 
 @app.route("/admission-sent")
 def admission_sent():
-    return render_template("admission_sent.html")
+    return render_cached_page("admissions_sent.html")
 
 # ---------------- ADMIN ADMISSIONS ----------------
 
@@ -903,13 +4271,15 @@ def admission_sent():
 @admin_required
 def admin_admissions():
 
-    conn = get_db()
-    admissions = conn.execute(
-        "SELECT * FROM admissions ORDER BY id DESC"
-    ).fetchall()
-    conn.close()
+    page = fetch_page(
+        get_db(),
+        "SELECT * FROM admissions",
+        after=request.args.get("after"),
+        before=request.args.get("before"),
+        page_size=app.config["ADMIN_PAGE_SIZE"]
+    )
 
-    return render_template("admin_admissions.html", admissions=admissions)
+    return render_template("admin_admissions.html", admissions=page.rows, page=page)
 
 
 @app.route("/admin/mark_paid/<int:admission_id>", methods=["POST"])
@@ -924,7 +4294,6 @@ def mark_paid(admission_id):
         WHERE id=?
     """, (admission_id,))
     conn.commit()
-    conn.close()
 
     flash("Admission marked as paid.", "success")
     return redirect(url_for("admin_admissions"))
@@ -945,18 +4314,20 @@ def delete_post(post_id):
     """, (post_id,)).fetchall()
 
     for m in media:
-        file_path = os.path.join("static", m["file_path"])
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        if release_blob(conn, m["file_path"]) is None:
+            # Uploaded before the blob store existed
+            file_path = os.path.join("static", m["file_path"])
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            remove_derivatives(m["file_path"])
 
     cursor.execute("DELETE FROM post_media WHERE post_id=?", (post_id,))
     cursor.execute("DELETE FROM posts WHERE id=?", (post_id,))
 
     conn.commit()
-    conn.close()
 
     flash("Post deleted successfully.", "info")
-    return redirect(url_for("admin_news"))
+    return redirect(url_for("admin_dashboard"))
 
 
 # ---------------- SAVE POST MEDIA ----------------
@@ -969,7 +4340,9 @@ def save_post_media(post_id, file_path, media_type):
         VALUES (?, ?, ?)
     """, (post_id, file_path, media_type))
     conn.commit()
-    conn.close()
+
+    if media_type == "image":
+        queue_derivatives(file_path)
 
 
 # ---------------- SUBMIT ADMISSION ----------------
@@ -983,32 +4356,35 @@ def submit_admission():
         flash("Admission fee not confirmed.", "danger")
         return redirect(url_for("admissions"))
 
-    learner = request.form.get("learner_name", "").strip()
-    parent = request.form.get("parent_name", "").strip()
-    phone = request.form.get("phone", "").strip()
-    email = request.form.get("email", "").strip()
-    grade = request.form.get("grade", "").strip()
+    try:
+        form, uploads = read_streamed_form()
+    except UploadRejected as e:
+        flash(str(e), "danger")
+        return redirect(url_for("admissions"))
+
+    learner = form.get("learner_name", "").strip()
+    parent = form.get("parent_name", "").strip()
+    phone = form.get("phone", "").strip()
+    email = form.get("email", "").strip()
+    grade = form.get("grade", "").strip()
 
     if not learner or not parent or not phone or not grade:
+        for upload in uploads.values():
+            upload.discard()
         flash("Please complete all required fields.", "danger")
         return redirect(url_for("admissions"))
 
-    def save_doc(file):
-        if file and file.filename and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            unique_name = f"{datetime.now().timestamp()}_{filename}"
-            path = os.path.join(app.config["UPLOAD_FOLDER"], unique_name)
-            file.save(path)
-            return "uploads/" + unique_name
-        return ""
+    conn = get_db()
+
+    def save_doc(upload):
+        return upload.store(conn) if upload else ""
 
-    birth_path = save_doc(request.files.get("birth_certificate"))
-    parent_id_path = save_doc(request.files.get("parent_id_copy"))
-    report_path = save_doc(request.files.get("latest_report"))
-    residence_path = save_doc(request.files.get("proof_of_residence"))
+    birth_path = save_doc(uploads.get("birth_certificate"))
+    parent_id_path = save_doc(uploads.get("parent_id_copy"))
+    report_path = save_doc(uploads.get("latest_report"))
+    residence_path = save_doc(uploads.get("proof_of_residence"))
 
     try:
-        conn = get_db()
         conn.execute("""
             INSERT INTO admissions (
                 learner_name, parent_name, phone, email, grade,
@@ -1022,8 +4398,9 @@ def submit_admission():
             "paid", "150"
         ))
         conn.commit()
-        conn.close()
     except Exception:
+        conn.rollback()
+        release_docs(conn, birth_path, parent_id_path, report_path, residence_path)
         flash("Submission failed. Try again.", "danger")
         return redirect(url_for("admissions"))
 
@@ -1047,31 +4424,11 @@ def admission_payment_success():
 def admission_payment_itn():
 
     data = request.form.to_dict()
+    if not data:
+        return "No data", 400
 
-    # Step 1: Validate with PayFast
-    try:
-        response = requests.post(
-            PAYFAST_ITN_VALIDATION_URL,
-            data=data,
-            timeout=10
-        )
-        if response.text != "VALID":
-            return "Invalid ITN", 400
-    except Exception:
-        return "Validation failed", 400
-
-    if data.get("merchant_id") != MERCHANT_ID:
-        return "Invalid merchant", 400
-
-    payment_status = data.get("payment_status")
-    amount = float(data.get("amount_gross", 0))
-
-    if payment_status == "COMPLETE" and amount == 150.00:
-        # Mark session as paid only after ITN validation
-        session["admission_paid"] = True
-        return "OK", 200
-
-    return "Payment not complete", 400
+    enqueue_itn("admission_payment_itn", data)
+    return "OK", 200
 
 # ---------------- ADMIN LOGIN ----------------
 @app.route("/admin/login", methods=["GET", "POST"])
@@ -1092,7 +4449,7 @@ def admin_login():
         else:
             try:
                 # Verify password using argon2
-                ph.verify(ADMIN_PASSWORD_HASH, password)
+                password_hasher().verify(ADMIN_PASSWORD_HASH, password)
                 # Login success
                 session["admin_logged_in"] = True
                 flash("Logged in successfully!", "success")
@@ -1103,10 +4460,142 @@ def admin_login():
     return render_template("admin_login.html", error=error)
 
 
+# ---------------- ADMIN METRICS ----------------
+@app.route("/admin/metrics")
+def admin_metrics():
+    """Prometheus scrape target: an admin session or METRICS_TOKEN as a
+    bearer token."""
+    authorization = request.headers.get("Authorization", "")
+    token_ok = (
+        METRICS_TOKEN is not None
+        and authorization.startswith("Bearer ")
+        and hmac.compare_digest(authorization[len("Bearer "):], METRICS_TOKEN)
+    )
+    if not token_ok and not session.get("admin_logged_in"):
+        if authorization:
+            return Response("Unauthorized\n", status=401, mimetype="text/plain")
+        return redirect(url_for("admin_login"))
+
+    response = Response(metrics.render(), mimetype="text/plain")
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    response.cache_control.no_store = True
+    return response
+
+
+# ---------------- ADMIN SLOW QUERIES ----------------
+@app.route("/admin/slow-queries")
+@admin_required
+def admin_slow_queries():
+    entries = recent_slow_queries()
+    return render_template(
+        "admin_slow_queries.html",
+        entries=entries,
+        summary=summarize_slow_queries(entries),
+        threshold=SLOW_QUERY_MS,
+        log_path=SLOW_QUERY_LOG
+    )
+
+
+# ---------------- ADMIN PROFILES ----------------
+@app.route("/admin/profiles", methods=["GET", "POST"])
+@admin_required
+def admin_profiles():
+    if request.method == "POST":
+        if request.form.get("action") == "start":
+            try:
+                percent = float(request.form.get("percent", 1))
+                minutes = float(request.form.get("minutes", 10))
+            except ValueError:
+                percent = minutes = 0
+            if not (0 < percent <= 100 and 0 < minutes <= 24 * 60):
+                flash("Enter a percentage up to 100 and at most a day of minutes.", "error")
+            else:
+                set_profiling(percent / 100, minutes * 60)
+                flash(f"Profiling {percent:g}% of requests for {minutes:g} minutes.", "success")
+        else:
+            set_profiling(0, 0)
+            flash("Profiling stopped.", "success")
+        return redirect(url_for("admin_profiles"))
+
+    rate, until = profiling_state(refresh=True)
+    entries = read_profile_index()[::-1]
+    endpoints = {}
+    for entry in entries:
+        group = endpoints.setdefault(entry["endpoint"], {"count": 0, "total_ms": 0.0})
+        group["count"] += 1
+        group["total_ms"] += entry["ms"]
+    return render_template(
+        "admin_profiles.html",
+        entries=entries,
+        endpoints=sorted(endpoints.items(), key=lambda item: item[1]["total_ms"], reverse=True),
+        active=rate > 0 and until > time.time(),
+        percent=rate * 100,
+        until=datetime.fromtimestamp(until, timezone.utc).strftime("%Y-%m-%d %H:%M:%S") if until else None,
+        header=PROFILE_HEADER,
+        token=profile_token(),
+        profile_dir=PROFILE_DIR
+    )
+
+
+@app.route("/admin/profiles/file/<path:name>")
+@admin_required
+def admin_profile_file(name):
+    path = profile_path(name)
+    if path is None:
+        raise NotFound()
+    with open(path, "rb") as f:
+        data = f.read()
+    return Response(data, mimetype="application/octet-stream", headers={
+        "Content-Disposition": f'attachment; filename="{name.replace("/", "-")}"'
+    })
+
+
+@app.route("/admin/profiles/route/<route>.prof")
+@admin_required
+def admin_profile_route(route):
+    """Every kept profile of one endpoint merged into a single pstats file."""
+    import marshal
+    import pstats
+
+    paths = [
+        path for path in (
+            profile_path(entry["file"]) for entry in read_profile_index()
+            if entry["endpoint"] == route
+        ) if path
+    ]
+    if not paths:
+        raise NotFound()
+    stats = pstats.Stats(*paths)
+    return Response(marshal.dumps(stats.stats), mimetype="application/octet-stream", headers={
+        "Content-Disposition": f'attachment; filename="{route}.prof"'
+    })
+
+
+# ---------------- ADMIN DB STATS ----------------
+@app.route("/admin/db-stats")
+@admin_required
+def admin_db_stats():
+    conn = get_db()
+    itn = dict(conn.execute(
+        "SELECT status, COUNT(*) FROM itn_inbox GROUP BY status"
+    ).fetchall())
+    itn.update(stuck=itn_health(conn)["stuck"])
+    return jsonify(
+        pool=get_pool().stats(),
+        catalog=catalog_cache.stats(),
+        pii_sessions=pii_caches.stats(),
+        carts=cart_cache.stats(),
+        itn=itn,
+        payfast=payfast_client.stats(),
+        boot=BOOT_REPORT
+    )
+
+
 # ---------------- ADMIN LOGOUT ----------------
 @app.route("/admin/logout")
 @admin_required
 def admin_logout():
+    drop_pii_cache()
     session.pop("admin_logged_in", None)
     flash("Logged out successfully.", "info")
     return redirect(url_for("admin_login"))
@@ -1120,60 +4609,157 @@ def admin_bookorders():
         return redirect(url_for("admin_login"))
 
     conn = get_db()
-    cursor = conn.cursor()
-
-    # Filter inputs from the form
-    name_filter = ""
-    phone_filter = ""
-    if request.method == "POST":
-        name_filter = request.form.get("name", "").strip()
-        phone_filter = request.form.get("phone", "").strip()
-
-    # Build query for orders
-    query = "SELECT * FROM orders"
-    params = []
-    filters = []
 
-    if name_filter:
-        filters.append("customer_name LIKE ?")
-        params.append(f"%{name_filter}%")
-    if phone_filter:
-        filters.append("customer_phone LIKE ?")
-        params.append(f"%{phone_filter}%")
+    # Filter inputs from the form (or carried along by the page links)
+    name_filter = request.values.get("name", "").strip()
+    phone_filter = request.values.get("phone", "").strip()
 
-    if filters:
-        query += " WHERE " + " AND ".join(filters)
-
-    query += " ORDER BY id DESC"  # latest orders first
-
-    orders = cursor.execute(query, params).fetchall()
+    # Names and phones are encrypted; match them through the blind index
+    try:
+        filters, params = order_filters(name_filter, phone_filter)
+    except OrderFilterRejected as e:
+        return render_template(
+            "admin_bookorders.html",
+            orders_with_items=[],
+            name_filter=name_filter,
+            phone_filter=phone_filter,
+            page=Page([], None, None),
+            filter_error=str(e)
+        )
 
-    # Fetch ordered books for each order
-    orders_with_items = []
-    for order in orders:
-        items = cursor.execute("""
-            SELECT p.name AS book_name, oi.quantity, oi.price
-            FROM order_items oi
-            JOIN products p ON oi.product_id = p.id
-            WHERE oi.order_id = ?
-        """, (order["id"],)).fetchall()
-
-        orders_with_items.append({
-            "order": order,
-            "items": items
-        })
+    # latest orders first, one page at a time
+    page = fetch_page(
+        conn,
+        "SELECT * FROM orders",
+        where=filters,
+        params=params,
+        after=request.args.get("after"),
+        before=request.args.get("before"),
+        page_size=app.config["ADMIN_PAGE_SIZE"]
+    )
+    # Only this page's names and phones are decrypted
+    orders = decrypt_orders(page.rows)
 
-    conn.close()
+    # Books for every order on the page in one query
+    orders_with_items = load_order_items(conn, orders)
 
     return render_template(
         "admin_bookorders.html",
         orders_with_items=orders_with_items,
         name_filter=name_filter,
-        phone_filter=phone_filter
+        phone_filter=phone_filter,
+        page=page
     )
 
+# ---------------- ADMIN EXPORT ----------------
+@app.route("/admin/export/<dataset>.<fmt>")
+@admin_required
+def admin_export(dataset, fmt):
+    """Stream orders, order items or admissions as CSV or NDJSON.
+
+    ?since=YYYY-MM-DD and ?until=YYYY-MM-DD (inclusive) limit the rows by
+    creation date.
+    """
+    if dataset not in EXPORTS or fmt not in EXPORT_FORMATS:
+        return "Unknown export", 404
+
+    dates = {}
+    for param in ("since", "until"):
+        value = request.args.get(param, "").strip()
+        if value:
+            try:
+                dates[param] = datetime.strptime(value, "%Y-%m-%d").date().isoformat()
+            except ValueError:
+                return f"Invalid {param} date, use YYYY-MM-DD", 400
+
+    write, mimetype = EXPORT_FORMATS[fmt]
+    filename = f"{dataset}-{datetime.now(timezone.utc):%Y%m%d}.{fmt}"
+    return Response(
+        write(export_batches(dataset, **dates), export_columns(get_db(), dataset)),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+# ---------------- STARTUP ----------------
+# Schema setup and seeding run once per deploy: from `flask --app app
+# init-db` or gunicorn's on_starting hook (gunicorn.conf.py). Workers then
+# only open the database read-only to confirm it is at the current schema
+# version, and fall back to preparing it themselves (plain `flask run`,
+# `python app.py`) when it is not.
+
+LATEST_SCHEMA = max(version for version, _, _ in MIGRATIONS)
+
+
+def prepare_database():
+    init_db()
+    seed_products()
+
+
+def database_ready():
+    try:
+        conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+    except sqlite3.OperationalError:
+        return False
+    try:
+        return schema_version(conn) >= LATEST_SCHEMA
+    except sqlite3.DatabaseError:
+        return False
+    finally:
+        conn.close()
+
+
+@app.cli.command("init-db")
+def init_db_command():
+    """Create or migrate the schema and seed the catalog."""
+    prepare_database()
+    conn = open_connection()
+    click.echo(f"Database ready at schema version {schema_version(conn)}: {DB_PATH}")
+    conn.close()
+
+
+@app.cli.command("assets-build")
+def assets_build_command():
+    """Fingerprint and precompress the static files."""
+    manifest = build_assets(force=True)
+    count = len(manifest["files"])
+    for name, entry in sorted(manifest["files"].items()):
+        click.echo(f"{name} -> {entry['path']} {' '.join(entry['encodings'])}".rstrip())
+    if brotli_module() is None:
+        click.echo("brotli is not installed; only .gz copies were written.")
+    click.echo(f"{count} static file(s) fingerprinted in {ASSET_FOLDER}")
+
+
+def boot():
+    set_up = time.perf_counter()
+    prepared = not database_ready()
+    if prepared:
+        prepare_database()
+    checked = time.perf_counter()
+    assets = load_assets()
+    finished = time.perf_counter()
+    return {
+        "pid": os.getpid(),
+        "setup_ms": round((set_up - _boot_started) * 1000, 1),
+        "database_ms": round((checked - set_up) * 1000, 1),
+        "assets_ms": round((finished - checked) * 1000, 1),
+        "total_ms": round((finished - _boot_started) * 1000, 1),
+        "prepared_database": prepared,
+        "assets": assets,
+    }
+
+
+BOOT_REPORT = boot()
+
+
 # ---------------- RUN ----------------
 
 if __name__ == "__main__":
+    if STATIC_FINGERPRINT:
+        build_assets()
+        load_assets()
     app.run(host="0.0.0.0", debug=True)
 
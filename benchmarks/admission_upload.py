@@ -0,0 +1,132 @@
+"""Peak memory and time of an admission submission carrying large documents.
+
+    python benchmarks/admission_upload.py [--size-mb 20] [--docs 4]
+
+Each mode runs in its own process so ru_maxrss is not shared:
+"buffered" is the old request.form/request.files + FileStorage.save()
+handling, "streamed" is the real /submit-admission view and "rejected"
+posts the same body with a mislabelled first document, which the
+streamed view refuses after its first chunk. Runs against a throwaway
+database and upload folder, never the real ones.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BOUNDARY = "----admission-bench"
+
+
+def build_body(path, size, docs, magic=b"%PDF-1.7\n"):
+    """Write a multipart body with `docs` PDFs of `size` bytes to `path`."""
+    fields = {"learner_name": "Bench", "parent_name": "Mark", "phone": "0820000000", "grade": "7"}
+    names = ("birth_certificate", "parent_id_copy", "latest_report", "proof_of_residence")
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as out:
+        for name, value in fields.items():
+            out.write(
+                f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+            )
+        for n, name in enumerate(names[:docs]):
+            out.write(
+                f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"; '
+                f'filename="doc{n}.pdf"\r\nContent-Type: application/pdf\r\n\r\n'.encode()
+            )
+            out.write(magic if n == 0 else b"%PDF-1.7\n")
+            remaining = size - 9
+            while remaining > 0:
+                # Vary every document so the blob store keeps them all
+                chunk = bytes([n]) + block[: min(len(block), remaining) - 1]
+                out.write(chunk)
+                remaining -= len(chunk)
+            out.write(b"\r\n")
+        out.write(f"--{BOUNDARY}--\r\n".encode())
+
+
+def run_mode(mode, body_path):
+    tmp = tempfile.mkdtemp()
+    os.environ["DATABASE_PATH"] = os.path.join(tmp, "bench.db")
+    os.environ.setdefault("FLASK_SECRET_KEY", "bench")
+    import app as shop_app
+
+    upload_dir = os.path.join(tmp, "uploads")
+    os.makedirs(upload_dir)
+    shop_app.STATIC_FOLDER = tmp
+    shop_app.CAS_FOLDER = os.path.join(upload_dir, "cas")
+    shop_app.queue_derivatives = lambda path: None
+    shop_app.app.config["MAX_CONTENT_LENGTH"] = None
+
+    @shop_app.app.route("/bench-buffered", methods=["POST"])
+    def buffered():
+        form = shop_app.request.form
+        assert form.get("learner_name")
+        for name, file in shop_app.request.files.items():
+            file.save(os.path.join(upload_dir, f"{name}.pdf"))
+        return "OK"
+
+    client = shop_app.app.test_client()
+    with client.session_transaction() as s:
+        s["admission_paid"] = True
+    url = "/bench-buffered" if mode == "buffered" else "/submit-admission"
+    expected = 302 if mode == "rejected" else 200
+
+    size = os.path.getsize(body_path)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    started = time.perf_counter()
+    with open(body_path, "rb") as body:
+        response = client.post(
+            url,
+            input_stream=body,
+            content_length=size,
+            content_type=f"multipart/form-data; boundary={BOUNDARY}",
+        )
+    elapsed = time.perf_counter() - started
+    _, traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    assert response.status_code == expected, response.status_code
+    # ru_maxrss is in KB on Linux
+    print(f"{mode:>9} {size / 2**20:>9.1f} {(peak - baseline) / 1024:>10.1f} "
+          f"{traced / 2**20:>11.1f} {elapsed * 1000:>9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=float, default=20)
+    parser.add_argument("--docs", type=int, default=4)
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    parser.add_argument("--body", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.body)
+        return
+
+    size = int(args.size_mb * 1024 * 1024)
+    env = dict(os.environ, DOCUMENT_MAX_SIZE=str(size + 1))
+    with tempfile.TemporaryDirectory() as tmp:
+        bodies = {
+            "buffered": os.path.join(tmp, "body.bin"),
+            "streamed": os.path.join(tmp, "body.bin"),
+            "rejected": os.path.join(tmp, "bad.bin"),
+        }
+        build_body(bodies["streamed"], size, args.docs)
+        build_body(bodies["rejected"], size, args.docs, magic=b"MZ\x90\x00\x03\x00\x00\x00\x04")
+        print(f"{'mode':>9} {'body MB':>9} {'+RSS MB':>10} {'traced MB':>11} {'ms':>9}")
+        for mode, body_path in bodies.items():
+            subprocess.run(
+                [sys.executable, __file__, "--mode", mode, "--body", body_path],
+                env=env, check=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
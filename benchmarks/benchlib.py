@@ -0,0 +1,129 @@
+"""Shared helpers for the route suite and the load driver.
+
+Latency summaries, process RSS and baseline files. Imports nothing from
+the app, so the load driver can use it without booting a copy of it.
+"""
+import json
+import math
+import os
+import platform
+import resource
+import sqlite3
+import sys
+from datetime import datetime, timezone
+
+# Lower is better for these; throughput is the one where higher is better
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(latencies, elapsed, queries=None, errors=0):
+    """One result row from per-request latencies in seconds."""
+    ordered = sorted(latencies)
+    row = {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else 0.0,
+    }
+    for key, fraction in zip(LATENCY_KEYS, (0.50, 0.95, 0.99)):
+        row[key] = round(percentile(ordered, fraction) * 1000, 2)
+    if queries is not None:
+        row["queries"] = round(queries / len(ordered), 1) if ordered else 0.0
+    return row
+
+
+def rss_mb(pid="self"):
+    """Resident set size of a process in MB (peak RSS where /proc is missing)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if pid != "self":
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def environment():
+    return {
+        "recorded_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def print_table(results, columns):
+    """results: {name: row}; columns: [(key, header, width)]."""
+    header = f"{'scenario':<24}" + "".join(f"{title:>{width}}" for _, title, width in columns)
+    print(header)
+    print("-" * len(header))
+    for name, row in results.items():
+        cells = []
+        for key, _, width in columns:
+            value = row.get(key)
+            cells.append(f"{'-' if value is None else value:>{width}}")
+        print(f"{name:<24}" + "".join(cells))
+
+
+def save_baseline(path, meta, results):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(results, path, tolerance, meta=None):
+    """Print each metric against the baseline at `path`; returns the
+    regressions (latency or throughput worse by more than `tolerance`,
+    or any increase in queries per request)."""
+    with open(path) as f:
+        baseline = json.load(f)
+    before_meta, before = baseline["meta"], baseline["results"]
+    print(f"\nAgainst baseline {path} ({before_meta.get('recorded_at', '?')}, "
+          f"scale {before_meta.get('scale', '?')}):")
+
+    regressions = []
+    for name, row in results.items():
+        old = before.get(name)
+        if old is None:
+            print(f"  {name:<24} new scenario")
+            continue
+        changes = []
+        for key in LATENCY_KEYS + ("throughput", "queries"):
+            if key not in row or key not in old:
+                continue
+            new_value, old_value = row[key], old[key]
+            change = (new_value - old_value) / old_value if old_value else 0.0
+            if key == "throughput":
+                worse = change < -tolerance
+            elif key == "queries":
+                worse = new_value > old_value
+            else:
+                worse = change > tolerance
+            changes.append(f"{key} {old_value}->{new_value} ({change:+.0%}){' !' if worse else ''}")
+            if worse:
+                regressions.append((name, key, old_value, new_value))
+        print(f"  {name:<24} " + ", ".join(changes))
+
+    for name in before:
+        if name not in results:
+            print(f"  {name:<24} not run")
+    if meta and before_meta.get("scale") != meta.get("scale"):
+        print(f"Note: the baseline was recorded at scale {before_meta.get('scale')}, "
+              f"this run used {meta.get('scale')}.")
+    print(f"{len(regressions)} regression(s) beyond {tolerance:.0%}.")
+    return regressions
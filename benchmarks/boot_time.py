@@ -0,0 +1,98 @@
+"""How long a fresh process takes to import the app, as a gunicorn worker does.
+
+    python benchmarks/boot_time.py [--runs 10] [--top 12] [--json]
+
+Each run is a new interpreter importing app against an already prepared
+throwaway database. import_ms is the whole `import app`; the app's own
+BOOT_REPORT splits out its setup, database check and total after the
+imports. The slowest imports (python -X importtime, cumulative) are
+listed after.
+--json prints one summary line instead, for tracking over time.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The app times its own setup; the imports it makes are timed around it
+REPORT = (
+    "import json, time; started = time.perf_counter(); import app; "
+    "print(json.dumps(dict(app.BOOT_REPORT, import_ms=round((time.perf_counter() - started) * 1000, 1))))"
+)
+PHASES = ("import_ms", "setup_ms", "database_ms", "total_ms")
+
+
+def run(env, *flags):
+    return subprocess.run(
+        [sys.executable, *flags, "-c", REPORT],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+
+
+def slowest_imports(stderr, top):
+    """Modules imported directly by app, by cumulative microseconds."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        if depth == 0:
+            # Children are listed before their parent; keep only app's
+            if name.strip() == "app":
+                break
+            rows = []
+        elif depth == 1:
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=12)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_PATH=os.path.join(tmp, "bench.db"))
+        env.setdefault("FLASK_SECRET_KEY", "bench")
+        for command in ("init-db", "assets-build"):
+            subprocess.run(
+                [sys.executable, "-m", "flask", "--app", "app", command],
+                cwd=ROOT, env=env, capture_output=True, check=True,
+            )
+
+        reports = [json.loads(run(env).stdout.splitlines()[-1]) for _ in range(args.runs)]
+        assert not any(r["prepared_database"] for r in reports)
+
+        summary = {"runs": args.runs}
+        for phase in PHASES:
+            values = sorted(r[phase] for r in reports)
+            summary[phase] = {
+                "min": values[0],
+                "median": round(statistics.median(values), 1),
+                "max": values[-1],
+            }
+
+        if args.json:
+            print(json.dumps(summary))
+            return
+
+        print(f"{'phase':<12} {'min':>8} {'median':>8} {'max':>8}   ({args.runs} runs, ms)")
+        for phase in PHASES:
+            s = summary[phase]
+            print(f"{phase:<12} {s['min']:>8.1f} {s['median']:>8.1f} {s['max']:>8.1f}")
+
+        print("\nSlowest imports made by app (cumulative ms):")
+        for micros, name in slowest_imports(run(env, "-X", "importtime").stderr, args.top):
+            print(f"{micros / 1000:>8.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Checkout cost as the cart grows: per-line loop vs set-based pricing.
+
+    python benchmarks/checkout.py [--lines 1,10,100,500] [--repeat 5]
+
+For carts of N distinct products it times the old per-line flow (one
+product SELECT and one order_items INSERT per line) against the current
+one (price_cart() + executemany in a BEGIN IMMEDIATE transaction), counting
+the execute calls each makes, and the full POST /checkout request.
+Runs against a throwaway database, never the real database.db.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_PATH"] = os.path.join(_tmp.name, "bench.db")
+os.environ.setdefault("FLASK_SECRET_KEY", "bench")
+
+import app as shop_app  # noqa: E402
+
+
+class CountingConnection(shop_app.sqlite3.Connection):
+    calls = 0
+
+    def execute(self, *args):
+        self.calls += 1
+        return super().execute(*args)
+
+    def executemany(self, *args):
+        self.calls += 1
+        return super().executemany(*args)
+
+
+def populate(conn, count):
+    conn.executemany(
+        "INSERT INTO products (name, description, price, image, category) VALUES (?, ?, ?, ?, ?)",
+        ((f"Book {i}", "Bench", 10 + i % 90 + 0.99, "book.jpg", "Books") for i in range(count))
+    )
+    conn.commit()
+    return [row[0] for row in conn.execute("SELECT id FROM products ORDER BY id LIMIT ?", (count,))]
+
+
+def legacy_checkout(conn, cart):
+    """The per-line validation and insert loop checkout() used before."""
+    subtotal = 0
+    items = []
+    for item in cart:
+        product = conn.execute("SELECT * FROM products WHERE id = ?", (item["id"],)).fetchone()
+        if not product:
+            continue
+        subtotal += float(product["price"]) * item["quantity"]
+        items.append((product["id"], item["quantity"], float(product["price"])))
+    order_id = conn.execute(
+        "INSERT INTO orders (subtotal, total_amount, status) VALUES (?, ?, 'pending')",
+        (subtotal, round(subtotal, 2))
+    ).lastrowid
+    for product_id, quantity, price in items:
+        conn.execute(
+            "INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)",
+            (order_id, product_id, quantity, price)
+        )
+    conn.commit()
+
+
+def bulk_checkout(conn, cart):
+    """The same work the way checkout() does it now."""
+    conn.execute("BEGIN IMMEDIATE")
+    lines, subtotal = shop_app.price_cart(conn, cart)
+    shop_app.revenue_split(subtotal)
+    order_id = conn.execute(
+        "INSERT INTO orders (subtotal, total_amount, status) VALUES (?, ?, 'pending')",
+        (float(subtotal), float(subtotal))
+    ).lastrowid
+    conn.executemany(
+        "INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)",
+        [(order_id, pid, quantity, float(price)) for pid, quantity, price in lines]
+    )
+    conn.commit()
+
+
+def measure(conn, fn, cart, repeat):
+    timings = []
+    for _ in range(repeat):
+        conn.calls = 0
+        started = time.perf_counter()
+        fn(conn, cart)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000, conn.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", default="1,10,100,500")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.lines.split(",")]
+    conn = shop_app.open_connection(factory=CountingConnection)
+    ids = populate(conn, max(sizes))
+    client = shop_app.app.test_client()
+
+    print(f"{'lines':>6} {'per-line ms':>12} {'calls':>6} {'set-based ms':>13} {'calls':>6} {'POST /checkout ms':>18}")
+    for size in sizes:
+        cart = [{"id": pid, "quantity": 2} for pid in ids[:size]]
+        legacy_ms, legacy_calls = measure(conn, legacy_checkout, cart, args.repeat)
+        bulk_ms, bulk_calls = measure(conn, bulk_checkout, cart, args.repeat)
+
+        cart_id = f"bench-{size}"
+        state = shop_app.write_cart(conn, cart_id, {item["id"]: item["quantity"] for item in cart})
+        with client.session_transaction() as s:
+            s["cart_id"] = cart_id
+            s["cart_rev"] = state.revision
+
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            response = client.post("/checkout", data={"name": "Bench Buyer", "phone": "0820000000"})
+            timings.append(time.perf_counter() - started)
+            assert response.status_code == 302 and "payfast" in response.headers["Location"]
+
+        print(f"{size:>6} {legacy_ms:>12.2f} {legacy_calls:>6} {bulk_ms:>13.2f} {bulk_calls:>6} "
+              f"{statistics.median(timings) * 1000:>18.2f}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""Multi-process HTTP load against the app running under gunicorn.
+
+    python benchmarks/load_driver.py [--scale 1k] [--database PATH] [--workers 4]
+                                     [--clients 8] [--admin-clients 1] [--duration 20]
+                                     [--warmup 3] [--json results.json]
+                                     [--save-baseline FILE] [--baseline FILE] [--tolerance 0.15]
+
+Builds (or reuses) a synthetic database, starts gunicorn on a free local
+port with the repo's gunicorn.conf.py and PayFast validation pointed at a
+local stub, then runs --clients processes that each loop over a weighted
+mix of shop, search, news, product, cart, checkout and ITN requests over
+keep-alive connections, plus --admin-clients processes that log in and
+browse the admin pages. Requests made during the first --warmup seconds
+are not counted.
+
+Reports requests/s, p50/p95/p99 latency and error counts per route and in
+total, and the peak RSS of every gunicorn worker. SQL counts are only
+measured by route_suite.py, which runs the app in-process. Baselines work
+as they do there.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import re
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlencode
+
+import benchlib
+import stub_payfast
+from synthetic_data import parse_scale
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_USERNAME = "bench-admin"
+ADMIN_PASSWORD = "bench-password"
+SEARCH_TERMS = ["maths", "calc", "uniform", "grade revision", "blazer", "zzz-no-match"]
+ADMIN_NAMES = ["thandi", "sipho", "mokoena", "jane"]
+COLUMNS = [
+    ("requests", "reqs", 8),
+    ("errors", "errors", 8),
+    ("throughput", "req/s", 9),
+    ("p50_ms", "p50 ms", 9),
+    ("p95_ms", "p95 ms", 9),
+    ("p99_ms", "p99 ms", 9),
+]
+
+
+class Client:
+    """One keep-alive connection with a cookie jar of one: the session."""
+
+    def __init__(self, port):
+        self.port = port
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        self.cookie = None
+        self.cart = 0
+
+    def request(self, method, path, form=None, json_body=None):
+        headers = {}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        elif json_body is not None:
+            body = json.dumps(json_body)
+            headers["Content-Type"] = "application/json"
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            return None
+        for header in response.headers.get_all("Set-Cookie") or []:
+            match = re.match(r"(session=[^;]*)", header)
+            if match:
+                self.cookie = match.group(1)
+        if response.will_close:
+            self.conn.close()
+        return response.status
+
+
+# ---------------- MIX ----------------
+# name -> (weight, setup, run). setup(client, rnd, ctx) runs untimed before
+# run(client, rnd, ctx), which returns the status of the timed request.
+
+def fill_cart(client, rnd, ctx):
+    if client.cart == 0:
+        client.request("POST", f"/api/cart/add/{rnd.randint(1, ctx['products'])}")
+        client.cart = 1
+
+
+def checkout(client, rnd, ctx):
+    client.cart = 0
+    return client.request("POST", "/checkout", form={"name": "Load Buyer", "phone": "0820000000"})
+
+
+def itn(client, rnd, ctx):
+    order_id, total = rnd.choice(ctx["pending"]) if ctx["pending"] else (1, 0)
+    return client.request("POST", "/payment/itn", form={
+        "merchant_id": "10000100", "m_payment_id": str(order_id),
+        "payment_status": "COMPLETE", "amount_gross": str(total),
+    })
+
+
+def cart_add(client, rnd, ctx):
+    client.cart += 1
+    return client.request("POST", f"/api/cart/add/{rnd.randint(1, ctx['products'])}")
+
+
+PUBLIC_MIX = {
+    "shop": (20, None, lambda c, r, ctx: c.request("GET", "/shop")),
+    "shop_search": (15, None, lambda c, r, ctx: c.request(
+        "GET", "/shop?" + urlencode({"q": r.choice(SEARCH_TERMS)}))),
+    "news": (10, None, lambda c, r, ctx: c.request("GET", "/news")),
+    "product_detail": (20, None, lambda c, r, ctx: c.request(
+        "GET", f"/product/{r.randint(1, ctx['products'])}")),
+    "cart_add": (12, None, cart_add),
+    "cart_view": (6, None, lambda c, r, ctx: c.request("GET", "/cart")),
+    "checkout": (4, fill_cart, checkout),
+    "itn": (3, None, itn),
+}
+ADMIN_MIX = {
+    "admin_dashboard": (4, None, lambda c, r, ctx: c.request("GET", "/admin/dashboard")),
+    "admin_book_orders": (3, None, lambda c, r, ctx: c.request("GET", "/admin/book-orders")),
+    "admin_order_search": (2, None, lambda c, r, ctx: c.request(
+        "GET", "/admin/book-orders?" + urlencode({"name": r.choice(ADMIN_NAMES)}))),
+    "admin_admissions": (2, None, lambda c, r, ctx: c.request("GET", "/admin/admissions")),
+}
+
+
+def client_loop(port, admin, ctx, seed, counting_from, deadline, results):
+    rnd = random.Random(seed)
+    client = Client(port)
+    mix = ADMIN_MIX if admin else PUBLIC_MIX
+    if admin:
+        status = client.request("POST", "/admin/login", form={
+            "username": ADMIN_USERNAME, "password": ADMIN_PASSWORD
+        })
+        if status != 302:
+            # Counted as one error; the admin pages would only redirect
+            results.put(({}, {"admin_login": 1}))
+            return
+    names = list(mix)
+    weights = [mix[name][0] for name in names]
+
+    samples = defaultdict(list)
+    errors = Counter()
+    while time.time() < deadline:
+        name = rnd.choices(names, weights)[0]
+        _, setup, run = mix[name]
+        if setup:
+            setup(client, rnd, ctx)
+        started = time.perf_counter()
+        status = run(client, rnd, ctx)
+        took = time.perf_counter() - started
+        if time.time() < counting_from:
+            continue
+        samples[name].append(took)
+        if status is None or status >= 400:
+            errors[name] += 1
+    results.put((dict(samples), dict(errors)))
+
+
+# ---------------- SERVER ----------------
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def workers_of(master):
+    """PIDs of the processes whose parent is `master`."""
+    children = []
+    for entry in os.listdir("/proc") if os.path.isdir("/proc") else []:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; fields resume after ")"
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == master:
+            children.append(int(entry))
+    return children
+
+
+def wait_until_up(port, server, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            return False
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/history")
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def prepare_database(path, scale):
+    conn = sqlite3.connect(path)
+    try:
+        populated = conn.execute("SELECT 1 FROM orders LIMIT 1").fetchone()
+    except sqlite3.OperationalError:
+        populated = None
+    conn.close()
+    if not populated:
+        print(f"Generating {scale} rows ...", flush=True)
+        subprocess.run([
+            sys.executable, os.path.join(ROOT, "benchmarks", "synthetic_data.py"),
+            "--database", path, "--scale", str(scale)
+        ], check=True)
+
+    conn = sqlite3.connect(path)
+    ctx = {
+        "products": conn.execute("SELECT MAX(id) FROM products").fetchone()[0],
+        "pending": conn.execute(
+            "SELECT id, total_amount FROM orders WHERE status = 'pending' ORDER BY id DESC LIMIT 5000"
+        ).fetchall(),
+    }
+    conn.close()
+    return ctx
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=parse_scale, default="1k")
+    parser.add_argument("--database", help="reuse (or create) this database instead of a throwaway one")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument("--clients", type=int, default=8, help="shopper processes")
+    parser.add_argument("--admin-clients", type=int, default=1, help="admin processes")
+    parser.add_argument("--duration", type=float, default=20, help="seconds counted")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds run before counting")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--baseline", metavar="FILE")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    database = os.path.abspath(args.database) if args.database else os.path.join(tmp.name, "bench.db")
+    ctx = prepare_database(database, args.scale)
+
+    from argon2 import PasswordHasher
+
+    _, validation_url = stub_payfast.serve()
+    port = free_port()
+    env = dict(
+        os.environ,
+        DATABASE_PATH=database,
+        FLASK_SECRET_KEY="bench",
+        PAYFAST_ITN_VALIDATION_URL=validation_url,
+        ADMIN_USERNAME=ADMIN_USERNAME,
+        ADMIN_PASSWORD_HASH=PasswordHasher().hash(ADMIN_PASSWORD),
+    )
+    log_path = os.path.join(tmp.name, "gunicorn.log")
+    with open(log_path, "w") as log:
+        server = subprocess.Popen([
+            sys.executable, "-m", "gunicorn",
+            "--workers", str(args.workers),
+            "--bind", f"127.0.0.1:{port}",
+            "app:app"
+        ], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    try:
+        if not wait_until_up(port, server):
+            with open(log_path) as log:
+                sys.exit("gunicorn did not come up:\n" + log.read())
+
+        results = multiprocessing.Queue()
+        counting_from = time.time() + args.warmup
+        deadline = counting_from + args.duration
+        clients = [
+            multiprocessing.Process(
+                target=client_loop,
+                args=(port, index >= args.clients, ctx, index, counting_from, deadline, results)
+            )
+            for index in range(args.clients + args.admin_clients)
+        ]
+        for process in clients:
+            process.start()
+        print(f"{args.clients} shoppers and {args.admin_clients} admin(s) against "
+              f"{args.workers} workers for {args.warmup:g}s + {args.duration:g}s ...", flush=True)
+
+        peak_rss = {}
+        while time.time() < deadline:
+            for pid in workers_of(server.pid):
+                rss = benchlib.rss_mb(pid)
+                if rss is not None:
+                    peak_rss[pid] = max(peak_rss.get(pid, 0), rss)
+            time.sleep(1)
+
+        samples = defaultdict(list)
+        errors = Counter()
+        for _ in clients:
+            client_samples, client_errors = results.get(timeout=60)
+            for name, latencies in client_samples.items():
+                samples[name].extend(latencies)
+            errors.update(client_errors)
+        for process in clients:
+            process.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    report = {
+        name: benchlib.summarize(samples[name], args.duration, errors=errors[name])
+        for name in list(PUBLIC_MIX) + list(ADMIN_MIX) if samples[name]
+    }
+    report["total"] = benchlib.summarize(
+        [took for latencies in samples.values() for took in latencies],
+        args.duration, errors=sum(errors.values())
+    )
+
+    print()
+    benchlib.print_table(report, COLUMNS)
+    if peak_rss:
+        print(f"\nPeak worker RSS: {', '.join(f'{rss:g}' for rss in sorted(peak_rss.values()))} MB "
+              f"(total {sum(peak_rss.values()):.1f} MB)")
+        report["total"]["worker_rss_mb"] = round(sum(peak_rss.values()), 1)
+
+    meta = dict(
+        benchlib.environment(), scale=args.scale, mode="gunicorn", workers=args.workers,
+        clients=args.clients, admin_clients=args.admin_clients, duration=args.duration
+    )
+    if args.json:
+        benchlib.save_baseline(args.json, meta, report)
+    if args.save_baseline:
+        benchlib.save_baseline(args.save_baseline, meta, report)
+        print(f"\nBaseline saved to {args.save_baseline}")
+    regressions = []
+    if args.baseline:
+        regressions = benchlib.compare(report, args.baseline, args.tolerance, meta)
+    tmp.cleanup()
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
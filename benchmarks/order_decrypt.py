@@ -0,0 +1,70 @@
+"""Decrypting order names/phones: per-row decrypt_text() vs decrypt_orders().
+
+    python benchmarks/order_decrypt.py [--orders 20000]
+
+Times one admin page (cold and warm cache) and a whole-table batch.
+Runs against a throwaway database, never the real database.db.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_PATH"] = os.path.join(_tmp.name, "bench.db")
+os.environ.setdefault("FLASK_SECRET_KEY", "bench")
+
+import app as shop_app  # noqa: E402
+
+
+def per_row(orders):
+    return [
+        dict(order,
+             customer_name=shop_app.decrypt_text(order["customer_name"]),
+             customer_phone=shop_app.decrypt_text(order["customer_phone"]))
+        for order in orders
+    ]
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=20000)
+    args = parser.parse_args()
+
+    conn = shop_app.open_connection()
+    conn.executemany(
+        "INSERT INTO orders (customer_name, customer_phone, status) VALUES (?, ?, 'pending')",
+        (
+            (shop_app.encrypt_text(f"Customer {i}"), shop_app.encrypt_text(f"082{i:07d}"))
+            for i in range(args.orders)
+        )
+    )
+    conn.commit()
+    orders = conn.execute("SELECT * FROM orders ORDER BY id DESC").fetchall()
+    page = orders[:shop_app.app.config["ADMIN_PAGE_SIZE"]]
+
+    with shop_app.app.test_request_context():
+        shop_app.session["admin_logged_in"] = True
+        print(f"{'case':<28} {'ms':>9}")
+        print(f"{'page, per row':<28} {timed(per_row, page):>9.2f}")
+        print(f"{'page, batch (cold)':<28} {timed(shop_app.decrypt_orders, page):>9.2f}")
+        print(f"{'page, batch (cached)':<28} {timed(shop_app.decrypt_orders, page):>9.2f}")
+        shop_app.drop_pii_cache()
+        shop_app.session.pop("admin_logged_in")
+        print(f"{'all, per row':<28} {timed(per_row, orders):>9.2f}")
+        print(f"{'all, batch':<28} {timed(shop_app.decrypt_orders, orders):>9.2f}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Query count and latency of the news feed loader as the post count grows.
+
+    python benchmarks/post_feed.py [--sizes 100,1000,10000,50000]
+
+Runs against a throwaway database, never the real database.db.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_PATH"] = os.path.join(_tmp.name, "bench.db")
+
+import app as shop_app  # noqa: E402
+
+
+def populate(conn, count, media_per_post=3):
+    conn.execute("DELETE FROM post_media")
+    conn.execute("DELETE FROM posts")
+    conn.executemany(
+        "INSERT INTO posts (id, title, description) VALUES (?, ?, ?)",
+        ((i, f"Post {i}", "Lorem ipsum " * 10) for i in range(1, count + 1))
+    )
+    conn.executemany(
+        "INSERT INTO post_media (post_id, file_path, media_type) VALUES (?, ?, ?)",
+        (
+            (i, f"uploads/{i}_{n}.jpg", "image")
+            for i in range(1, count + 1)
+            for n in range(media_per_post)
+        )
+    )
+    conn.commit()
+
+
+def legacy_feed(conn):
+    """The per-post loop news()/admin_dashboard() used before the loader."""
+    posts = []
+    for p in conn.execute("SELECT * FROM posts ORDER BY created_at DESC").fetchall():
+        media = conn.execute(
+            "SELECT file_path, media_type FROM post_media WHERE post_id=?",
+            (p["id"],)
+        ).fetchall()
+        posts.append({"id": p["id"], "media": [dict(m) for m in media]})
+    return posts
+
+
+def measure(conn, loader):
+    queries = []
+    conn.set_trace_callback(queries.append)
+    started = time.perf_counter()
+    posts = loader(conn)
+    elapsed = time.perf_counter() - started
+    conn.set_trace_callback(None)
+    return len(posts), len(queries), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,1000,10000,50000")
+    parser.add_argument("--skip-legacy-above", type=int, default=10000)
+    args = parser.parse_args()
+
+    conn = shop_app.open_connection()
+    print(f"{'posts':>8} {'loader':>8} {'queries':>8} {'ms':>10}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        populate(conn, size)
+        loaders = [("batched", shop_app.load_post_feed)]
+        if size <= args.skip_legacy_above:
+            loaders.append(("n+1", legacy_feed))
+        for name, loader in loaders:
+            count, queries, elapsed = measure(conn, loader)
+            assert count == size
+            print(f"{size:>8} {name:>8} {queries:>8} {elapsed * 1000:>10.1f}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""Per-route latency, SQL query counts and memory through the test client.
+
+    python benchmarks/route_suite.py [--scale 1k] [--database PATH] [--requests 200]
+                                     [--only shop,news] [--json results.json]
+                                     [--save-baseline FILE] [--baseline FILE] [--tolerance 0.15]
+
+Fills a throwaway database with synthetic_data.populate() (or reuses the
+one given with --database if it already has orders), then runs each
+scenario in turn in this process: the shop with and without a search,
+the news feed, product pages, the cart API and cart page, checkout, both
+ITN handlers validated against a local stub PayFast, and the admin pages.
+Reports requests/s, p50/p95/p99 latency, SQL statements per request and
+this process's RSS after each scenario.
+
+--save-baseline stores the results as JSON; --baseline compares a run
+against such a file and exits 1 when a latency or throughput is worse by
+more than --tolerance, or a scenario runs more queries than before.
+Baselines only mean something on the machine and scale they came from.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import benchlib  # noqa: E402
+import stub_payfast  # noqa: E402
+from synthetic_data import parse_scale, populate  # noqa: E402
+
+COLUMNS = [
+    ("requests", "reqs", 7),
+    ("throughput", "req/s", 9),
+    ("p50_ms", "p50 ms", 9),
+    ("p95_ms", "p95 ms", 9),
+    ("p99_ms", "p99 ms", 9),
+    ("queries", "sql/req", 9),
+    ("rss_mb", "rss MB", 9),
+]
+SEARCH_TERMS = ["maths", "calc", "uniform", "grade revision", "blazer", "zzz-no-match"]
+ADMIN_NAMES = ["thandi", "sipho", "mokoena", "jane"]
+
+
+class Context:
+    """What scenarios need to know about the data they run against."""
+
+    def __init__(self, conn):
+        self.products = [row[0] for row in conn.execute("SELECT id FROM products")]
+        self.pending = [
+            (row[0], row[1]) for row in conn.execute(
+                "SELECT id, total_amount FROM orders WHERE status = 'pending' ORDER BY id DESC LIMIT 5000"
+            )
+        ]
+        self.rnd = random.Random(7)
+
+    def product(self):
+        return self.rnd.choice(self.products)
+
+    def pending_order(self):
+        # Every ITN pays one order; cycle once they have all been paid
+        order = self.pending.pop()
+        self.pending.insert(0, order)
+        return order
+
+
+def check(response, *statuses):
+    response.get_data()
+    if response.status_code not in statuses:
+        raise AssertionError(f"{response.request.path}: {response.status_code}")
+    return response
+
+
+# ---------------- SCENARIOS ----------------
+# name -> (setup, run, request cap). setup(client, ctx) runs untimed before
+# every run(client, ctx); the cap keeps whole-table work such as exports
+# from dominating the suite.
+
+def shop(client, ctx):
+    check(client.get("/shop"), 200)
+
+
+def shop_search(client, ctx):
+    check(client.get("/shop", query_string={"q": ctx.rnd.choice(SEARCH_TERMS)}), 200)
+
+
+def news(client, ctx):
+    check(client.get("/news"), 200)
+
+
+def product_detail(client, ctx):
+    check(client.get(f"/product/{ctx.product()}"), 200)
+
+
+def cart_flow(client, ctx):
+    first, second = ctx.product(), ctx.product()
+    check(client.post(f"/api/cart/add/{first}", json={"quantity": 2}), 200)
+    check(client.post(f"/api/cart/add/{second}"), 200)
+    check(client.post("/api/cart/update", json={"lines": {str(first): 1}}), 200)
+    check(client.get("/cart"), 200)
+    check(client.post(f"/api/cart/remove/{second}"), 200)
+
+
+def fill_cart(client, ctx):
+    client.post("/clear-cart")
+    check(client.post("/api/cart/update", json={
+        "lines": {str(ctx.product()): ctx.rnd.randint(1, 3) for _ in range(3)}
+    }), 200)
+
+
+def checkout(client, ctx):
+    check(client.get("/checkout"), 200)
+    response = check(client.post("/checkout", data={"name": "Bench Buyer", "phone": "0820000000"}), 302)
+    assert "/payfast/checkout/" in response.headers["Location"], response.headers["Location"]
+
+
+def itn(client, ctx):
+    import app as shop_app
+
+    # Alternates between the two order ITN endpoints
+    order_id, total = ctx.pending_order()
+    url = "/payment/itn" if order_id % 2 else "/payfast/itn"
+    check(client.post(url, data={
+        "merchant_id": shop_app.MERCHANT_ID, "m_payment_id": str(order_id),
+        "payment_status": "COMPLETE", "amount_gross": str(total),
+    }), 200)
+    shop_app.process_itn_inbox()
+
+
+def admin_login(client, ctx):
+    with client.session_transaction() as s:
+        s["admin_logged_in"] = True
+
+
+def admin_dashboard(client, ctx):
+    check(client.get("/admin/dashboard"), 200)
+
+
+def admin_admissions(client, ctx):
+    check(client.get("/admin/admissions"), 200)
+
+
+def admin_book_orders(client, ctx):
+    check(client.get("/admin/book-orders"), 200)
+
+
+def admin_order_search(client, ctx):
+    check(client.get("/admin/book-orders", query_string={"name": ctx.rnd.choice(ADMIN_NAMES)}), 200)
+
+
+def admin_export(client, ctx):
+    # The last 30 days, so the cost grows with order volume, not history
+    since = (date.today() - timedelta(days=30)).isoformat()
+    check(client.get("/admin/export/orders.csv", query_string={"since": since}), 200)
+
+
+SCENARIOS = {
+    "shop": (None, shop, None),
+    "shop_search": (None, shop_search, None),
+    "news": (None, news, None),
+    "product_detail": (None, product_detail, None),
+    "cart_flow": (None, cart_flow, None),
+    "checkout": (fill_cart, checkout, None),
+    "itn": (None, itn, None),
+    "admin_dashboard": (admin_login, admin_dashboard, None),
+    "admin_admissions": (admin_login, admin_admissions, None),
+    "admin_book_orders": (admin_login, admin_book_orders, None),
+    "admin_order_search": (admin_login, admin_order_search, None),
+    "admin_export": (admin_login, admin_export, 10),
+}
+
+
+def run_scenario(client, ctx, setup, run, requests, warmup, counter):
+    for _ in range(warmup):
+        if setup:
+            setup(client, ctx)
+        run(client, ctx)
+
+    latencies = []
+    queries = 0
+    elapsed = 0.0
+    for _ in range(requests):
+        if setup:
+            setup(client, ctx)
+        counter[0] = 0
+        started = time.perf_counter()
+        run(client, ctx)
+        took = time.perf_counter() - started
+        queries += counter[0]
+        latencies.append(took)
+        elapsed += took
+    return benchlib.summarize(latencies, elapsed, queries=queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=parse_scale, default="1k")
+    parser.add_argument("--database", help="reuse (or create) this database instead of a throwaway one")
+    parser.add_argument("--requests", type=int, default=200, help="timed runs per scenario")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed runs per scenario first")
+    parser.add_argument("--only", help="comma-separated scenario names")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--baseline", metavar="FILE")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else list(SCENARIOS)
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    tmp = None
+    if args.database:
+        database = os.path.abspath(args.database)
+    else:
+        tmp = tempfile.TemporaryDirectory()
+        database = os.path.join(tmp.name, "bench.db")
+
+    _, validation_url = stub_payfast.serve()
+    os.environ["DATABASE_PATH"] = database
+    os.environ["PAYFAST_ITN_VALIDATION_URL"] = validation_url
+    os.environ["ITN_INLINE_WORKER"] = "0"
+    os.environ.setdefault("FLASK_SECRET_KEY", "bench")
+
+    import app as shop_app
+
+    conn = shop_app.open_connection()
+    if not conn.execute("SELECT 1 FROM orders LIMIT 1").fetchone():
+        print(f"Generating {args.scale} rows ...", flush=True)
+        populate(conn, args.scale, progress=lambda message: print("  " + message, flush=True))
+    ctx = Context(conn)
+    conn.close()
+
+    # Count the statements every request connection runs (trigger bodies
+    # are reported too and are left out)
+    counter = [0]
+    open_connection = shop_app.open_connection
+
+    def counting_connection(factory=shop_app.sqlite3.Connection):
+        conn = open_connection(factory=factory)
+        conn.set_trace_callback(
+            lambda sql: None if sql.startswith("--") else counter.__setitem__(0, counter[0] + 1)
+        )
+        return conn
+
+    shop_app.open_connection = counting_connection
+
+    meta = dict(benchlib.environment(), scale=args.scale, requests=args.requests, mode="test_client")
+    results = {}
+    client = shop_app.app.test_client()
+    for name in names:
+        setup, run, cap = SCENARIOS[name]
+        requests = min(args.requests, cap) if cap else args.requests
+        row = run_scenario(client, ctx, setup, run, requests, args.warmup, counter)
+        row["rss_mb"] = benchlib.rss_mb()
+        results[name] = row
+        print(f"  {name}: {row['p50_ms']} ms p50", flush=True)
+
+    print()
+    benchlib.print_table(results, COLUMNS)
+
+    if args.json:
+        benchlib.save_baseline(args.json, meta, results)
+    if args.save_baseline:
+        benchlib.save_baseline(args.save_baseline, meta, results)
+        print(f"\nBaseline saved to {args.save_baseline}")
+    regressions = []
+    if args.baseline:
+        regressions = benchlib.compare(results, args.baseline, args.tolerance, meta)
+    if tmp:
+        tmp.cleanup()
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""LIKE scan vs FTS5 search for the shop search box.
+
+    python benchmarks/shop_search.py [--products 100000] [--repeat 20]
+
+Runs against a throwaway database, never the real database.db.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_PATH"] = os.path.join(_tmp.name, "bench.db")
+
+import app as shop_app  # noqa: E402
+
+WORDS = (
+    "maths physics biology english history geography calculator guide grade "
+    "school official workbook revision exam practice scientific dictionary "
+    "atlas blazer tie trousers shirt uniform pencil ruler notebook stationery"
+).split()
+CATEGORIES = ["Books", "Stationery", "Uniform", "Sport", "Electronics"]
+TERMS = ["maths", "calc", "uniform", "grade revision", "zzz-no-match"]
+
+
+def vocabulary(rnd, size=5000):
+    """Catalog words plus filler, so real terms match a realistic slice."""
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    filler = {"".join(rnd.choices(letters, k=rnd.randint(4, 9))) for _ in range(size)}
+    return WORDS + sorted(filler)
+
+
+def populate(conn, count, seed=1):
+    rnd = random.Random(seed)
+    words = vocabulary(rnd)
+    conn.execute("DELETE FROM products")
+    conn.executemany(
+        "INSERT INTO products (name, description, price, image, category) VALUES (?, ?, ?, ?, ?)",
+        (
+            (
+                " ".join(rnd.sample(words, 3)).title(),
+                " ".join(rnd.choices(words, k=20)),
+                rnd.randint(20, 500),
+                "books.jpg",
+                rnd.choice(CATEGORIES)
+            )
+            for _ in range(count)
+        )
+    )
+    conn.commit()
+
+
+def like_search(conn, q, page_size=None):
+    """shop()'s old query; page_size=None is the unpaginated original."""
+    like = f"%{q}%"
+    sql = """
+        SELECT * FROM products
+        WHERE name LIKE ? OR description LIKE ? OR category LIKE ?
+        ORDER BY id DESC
+    """
+    if page_size is None:
+        return conn.execute(sql, (like, like, like)).fetchall()
+    return conn.execute(sql + " LIMIT ?", (like, like, like, page_size)).fetchall()
+
+
+def fts_search(conn, q, page_size):
+    with shop_app.app.app_context():
+        page, _ = shop_app.search_products(conn, q)
+    return page.rows
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return samples[len(samples) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    conn = shop_app.open_connection()
+    started = time.perf_counter()
+    populate(conn, args.products)
+    print(f"populated {args.products} products in {time.perf_counter() - started:.1f}s")
+
+    page_size = shop_app.app.config["PAGE_SIZE"]
+    print(f"{'query':<16} {'matches':>8} {'like all':>10} {'like page':>10} {'fts page':>10}")
+    for q in TERMS:
+        matches = len(like_search(conn, q))
+        like_all = timed(lambda: like_search(conn, q), args.repeat)
+        like_page = timed(lambda: like_search(conn, q, page_size), args.repeat)
+        fts_page = timed(lambda: fts_search(conn, q, page_size), args.repeat)
+        print(f"{q:<16} {matches:>8} {like_all:>10.2f} {like_page:>10.2f} {fts_page:>10.2f}")
+    print("(median ms; 'like all' is the pre-pagination query, FTS is ranked by bm25)")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Local stand-in for PayFast's ITN validation endpoint.
+
+    python benchmarks/stub_payfast.py [--port 8765] [--delay 0.2] [--fail-rate 0.1]
+
+Point the app at it with
+PAYFAST_ITN_VALIDATION_URL=http://127.0.0.1:8765/eng/query/validate.
+Answers VALID (or INVALID when the posted signature field is "bad"),
+optionally after a delay or with random 503s to exercise retries.
+"""
+import argparse
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+def make_handler(delay=0.0, fail_rate=0.0):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            form = parse_qs(self.rfile.read(length).decode())
+            if delay:
+                time.sleep(delay)
+            if random.random() < fail_rate:
+                self._reply(503, "Service Unavailable")
+                return
+            valid = form.get("signature", [""])[0] != "bad"
+            self._reply(200, "VALID" if valid else "INVALID")
+
+        def _reply(self, status, body):
+            payload = body.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port=0, delay=0.0, fail_rate=0.0):
+    """Start the stub on a background thread; returns (server, url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(delay, fail_rate))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/eng/query/validate"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", args.port), make_handler(args.delay, args.fail_rate)
+    )
+    print(f"stub validator on http://127.0.0.1:{args.port}/eng/query/validate")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
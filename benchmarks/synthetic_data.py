@@ -0,0 +1,227 @@
+"""Fill a database with synthetic shop, news, order and admission data.
+
+    python benchmarks/synthetic_data.py --database /tmp/bench-100k.db --scale 100k [--seed 1]
+
+--scale is 1k, 10k, 100k, 1m or a plain row count. That many products and
+orders are written (with 1-4 items each), plus a tenth as many posts
+(two media rows each) and admissions. Orders are encrypted and blind
+indexed the way checkout() stores them and the dashboard counters are
+kept by their triggers, so every admin page sees consistent data.
+
+The route suite and load driver call populate() on their own databases;
+run this directly to build a large one once and reuse it with their
+--database option. Refuses to touch a database that already has orders.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+WORDS = (
+    "maths physics biology english history geography calculator guide grade "
+    "school official workbook revision exam practice scientific dictionary "
+    "atlas blazer tie trousers shirt uniform pencil ruler notebook stationery"
+).split()
+CATEGORIES = ["Books", "Stationery", "Uniform", "Sport", "Electronics"]
+FIRST_NAMES = (
+    "Thandi Sipho Lerato Themba Naledi Bongani Zanele Ayanda Kagiso Lindiwe "
+    "Jane John Pieter Anele Nomsa Mpho Karabo Palesa Sibusiso Refilwe"
+).split()
+LAST_NAMES = (
+    "Mokoena Dlamini Nkosi Khumalo Ndlovu Mahlangu Botha Naidoo Smith Zulu "
+    "Mthembu Sithole Venter Molefe Pillay Radebe"
+).split()
+# (status, weight) for generated orders
+ORDER_STATUSES = (("paid", 60), ("pending", 35), ("failed", 5))
+MEDIA_FILES = ("uploads/books.jpg", "uploads/uniform.jpg", "uploads/shopping.jpg")
+BATCH = 10_000
+DAYS = 365
+
+
+def parse_scale(value):
+    value = str(value).lower().replace("_", "")
+    if value in SCALES:
+        return SCALES[value]
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"unknown scale {value!r}")
+
+
+def sizes(rows):
+    return {
+        "products": rows,
+        "orders": rows,
+        "posts": max(rows // 10, 10),
+        "admissions": max(rows // 10, 10),
+    }
+
+
+def batches(rows, make, batch=BATCH):
+    chunk = []
+    for index in range(rows):
+        chunk.append(make(index))
+        if len(chunk) == batch:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def timestamp(rnd, now):
+    moment = now - timedelta(seconds=rnd.randrange(DAYS * 86400))
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def populate(conn, rows, seed=1, progress=None):
+    """Write sizes(rows) worth of data through `conn`; returns the sizes."""
+    import app as shop_app
+
+    rnd = random.Random(seed)
+    now = datetime.now()
+    counts = sizes(rows)
+    say = progress or (lambda message: None)
+
+    def insert(table, sql, make, total):
+        started = time.perf_counter()
+        for chunk in batches(total, make):
+            conn.executemany(sql, chunk)
+            conn.commit()
+        say(f"{table}: {total} rows in {time.perf_counter() - started:.1f}s")
+
+    def next_id(table):
+        return conn.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}").fetchone()[0]
+
+    # ---------------- PRODUCTS ----------------
+    first_product = next_id("products")
+    prices = [rnd.randint(20, 500) + rnd.choice((0, 0.5, 0.99)) for _ in range(counts["products"])]
+    insert("products", """
+        INSERT INTO products (id, name, description, price, image, category)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, lambda i: (
+        first_product + i,
+        " ".join(rnd.sample(WORDS, 3)).title(),
+        " ".join(rnd.choices(WORDS, k=20)),
+        prices[i],
+        "books.jpg",
+        rnd.choice(CATEGORIES)
+    ), counts["products"])
+
+    # ---------------- POSTS ----------------
+    first_post = next_id("posts")
+    insert("posts", """
+        INSERT INTO posts (id, title, description, created_at) VALUES (?, ?, ?, ?)
+    """, lambda i: (
+        first_post + i,
+        " ".join(rnd.sample(WORDS, 4)).capitalize(),
+        " ".join(rnd.choices(WORDS, k=60)),
+        timestamp(rnd, now)
+    ), counts["posts"])
+    insert("post_media", """
+        INSERT INTO post_media (post_id, file_path, media_type) VALUES (?, ?, 'image')
+    """, lambda i: (first_post + i // 2, MEDIA_FILES[i % len(MEDIA_FILES)]), counts["posts"] * 2)
+
+    # ---------------- ORDERS ----------------
+    # A pool of customers, each encrypted per order like checkout() does;
+    # their blind-index terms only depend on the plaintext, so hash once
+    customers = []
+    for _ in range(min(rows, 5000)):
+        name = f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}"
+        phone = "0" + "".join(rnd.choices("0123456789", k=9))
+        customers.append((name, phone, sorted(shop_app.order_index_terms(name, phone))))
+
+    statuses = [status for status, _ in ORDER_STATUSES]
+    weights = [weight for _, weight in ORDER_STATUSES]
+    first_order = next_id("orders")
+    started = time.perf_counter()
+    item_rows = 0
+    for chunk_start in range(0, counts["orders"], BATCH):
+        orders, items, terms = [], [], []
+        for order_id in range(first_order + chunk_start,
+                              first_order + min(chunk_start + BATCH, counts["orders"])):
+            name, phone, index_terms = rnd.choice(customers)
+            subtotal = 0.0
+            for product in rnd.sample(range(counts["products"]), min(rnd.randint(1, 4), counts["products"])):
+                quantity = rnd.randint(1, 3)
+                subtotal += prices[product] * quantity
+                items.append((order_id, first_product + product, quantity, prices[product]))
+            subtotal = round(subtotal, 2)
+            school = round(subtotal * 0.20, 2)
+            supplier = round(subtotal * 0.70, 2)
+            orders.append((
+                order_id,
+                shop_app.encrypt_text(name),
+                shop_app.encrypt_text(phone),
+                subtotal, 0.0, school, supplier, round(subtotal - school - supplier, 2), subtotal,
+                rnd.choices(statuses, weights)[0],
+                timestamp(rnd, now)
+            ))
+            terms.extend((kind, digest, order_id) for kind, digest in index_terms)
+        conn.executemany("""
+            INSERT INTO orders (
+                id, customer_name, customer_phone, subtotal, delivery_fee,
+                school_amount, supplier_amount, courier_amount, total_amount,
+                status, created_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, orders)
+        conn.executemany(
+            "INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)",
+            items
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO order_blind_index (kind, digest, order_id) VALUES (?, ?, ?)",
+            terms
+        )
+        conn.commit()
+        item_rows += len(items)
+    say(f"orders: {counts['orders']} rows, {item_rows} items "
+        f"in {time.perf_counter() - started:.1f}s")
+
+    # ---------------- ADMISSIONS ----------------
+    insert("admissions", """
+        INSERT INTO admissions (
+            learner_name, parent_name, phone, email, grade,
+            payment_status, amount_paid, created_at
+        ) VALUES (?, ?, ?, ?, ?, 'paid', '150', ?)
+    """, lambda i: (
+        f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}",
+        f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}",
+        "0" + "".join(rnd.choices("0123456789", k=9)),
+        f"parent{i}@example.com",
+        str(rnd.randint(8, 12)),
+        timestamp(rnd, now)
+    ), counts["admissions"])
+
+    conn.execute("PRAGMA optimize")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", required=True)
+    parser.add_argument("--scale", type=parse_scale, default="1k")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_PATH"] = os.path.abspath(args.database)
+    os.environ.setdefault("FLASK_SECRET_KEY", "bench")
+    sys.path.insert(0, ROOT)
+    import app as shop_app
+
+    conn = shop_app.open_connection()
+    if conn.execute("SELECT 1 FROM orders LIMIT 1").fetchone():
+        sys.exit(f"{args.database} already has orders; use a new file.")
+    started = time.perf_counter()
+    populate(conn, args.scale, args.seed, progress=print)
+    conn.close()
+    print(f"Done in {time.perf_counter() - started:.1f}s: {args.database}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Gunicorn settings, picked up automatically from the working directory.
+
+The master prepares the database and fingerprints the static files once,
+running `flask init-db` and `flask assets-build` in child processes so it
+never imports the app itself (workers are still forked clean and HUP
+reloads pick up new code); a HUP reload builds the static files again.
+Workers only read the asset manifest, and one that finds none fails to
+boot instead of serving unversioned URLs. Each worker logs how long it
+took to boot.
+"""
+import subprocess
+import sys
+import time
+
+
+def on_starting(server):
+    server.log.info("Preparing database")
+    subprocess.run([sys.executable, "-m", "flask", "--app", "app", "init-db"], check=True)
+    build_assets(server)
+
+
+def on_reload(server):
+    build_assets(server)
+
+
+def build_assets(server):
+    server.log.info("Fingerprinting static files")
+    subprocess.run(
+        [sys.executable, "-m", "flask", "--app", "app", "assets-build"],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def post_fork(server, worker):
+    # Before the worker imports the app, so the boot time includes imports
+    worker.boot_started = time.perf_counter()
+
+
+def post_worker_init(worker):
+    from app import ASSET_MANIFEST, BOOT_REPORT
+
+    if BOOT_REPORT["assets"] is None:
+        raise RuntimeError(f"{ASSET_MANIFEST} is missing; run `flask --app app assets-build`")
+
+    worker.log.info(
+        "Worker %s booted in %.1f ms (app setup %.1f ms, database check %.1f ms%s)",
+        worker.pid,
+        (time.perf_counter() - worker.boot_started) * 1000,
+        BOOT_REPORT["setup_ms"],
+        BOOT_REPORT["database_ms"],
+        ", prepared it" if BOOT_REPORT["prepared_database"] else "",
+    )
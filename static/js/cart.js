@@ -0,0 +1,133 @@
+document.addEventListener("DOMContentLoaded", () => {
+
+    // Every change goes to the JSON cart API; the plain forms and links
+    // underneath still work when this script does not run
+    const send = (url, body) =>
+        fetch(url, {
+            method: "POST",
+            headers: {"Content-Type": "application/json", "Accept": "application/json"},
+            body: JSON.stringify(body || {})
+        }).then(response =>
+            response.json().then(data => {
+                if (!response.ok) throw new Error(data.error || "The cart could not be updated.");
+                return data;
+            })
+        );
+
+    const setBadge = count => {
+        const icon = document.querySelector(".cart-icon");
+        if (!icon) return;
+        let badge = icon.querySelector(".cart-badge");
+        if (count > 0 && !badge) {
+            badge = document.createElement("span");
+            badge.className = "cart-badge";
+            icon.appendChild(badge);
+        }
+        if (badge) {
+            badge.textContent = count;
+            badge.hidden = count === 0;
+        }
+    };
+
+    // SHOP: ADD TO CART
+    document.querySelectorAll("[data-add-url]").forEach(btn => {
+        btn.addEventListener("click", event => {
+            event.preventDefault();
+            if (btn.classList.contains("busy")) return;
+            btn.classList.add("busy");
+
+            const label = btn.textContent;
+            send(btn.dataset.addUrl)
+                .then(data => {
+                    setBadge(data.count);
+                    btn.textContent = "Added";
+                })
+                .catch(error => {
+                    btn.textContent = error.message;
+                })
+                .finally(() => {
+                    setTimeout(() => {
+                        btn.textContent = label;
+                        btn.classList.remove("busy");
+                    }, 1200);
+                });
+        });
+    });
+
+    // CART PAGE
+    const form = document.getElementById("cart-form");
+    if (!form) return;
+
+    const errorBox = form.querySelector(".cart-error");
+
+    const showError = message => {
+        errorBox.textContent = message;
+        errorBox.hidden = !message;
+    };
+
+    const apply = data => {
+        data.lines.forEach(line => {
+            const row = form.querySelector(`.cart-item[data-product-id="${line.id}"]`);
+            if (!row) return;
+            if (line.quantity === 0) {
+                row.remove();
+                return;
+            }
+            row.querySelector(".qty-input").value = line.quantity;
+            row.querySelector(".line-total-value").textContent = line.line_total;
+        });
+        document.getElementById("cart-subtotal").textContent = data.subtotal;
+        document.getElementById("cart-total").textContent = data.total;
+        setBadge(data.count);
+        showError("");
+
+        if (data.count === 0) {
+            const button = form.querySelector(".update-btn");
+            if (button) button.remove();
+        }
+    };
+
+    // Quantities typed in quick succession go out as one batch
+    const pending = {};
+    let timer = null;
+
+    const flush = () => {
+        timer = null;
+        const lines = Object.assign({}, pending);
+        Object.keys(pending).forEach(id => delete pending[id]);
+        if (!Object.keys(lines).length) return;
+        send(form.dataset.updateUrl, {lines: lines})
+            .then(apply)
+            .catch(error => showError(error.message));
+    };
+
+    form.querySelectorAll(".qty-input").forEach(input => {
+        input.addEventListener("change", () => {
+            const row = input.closest(".cart-item");
+            pending[row.dataset.productId] = input.value;
+            clearTimeout(timer);
+            timer = setTimeout(flush, 300);
+        });
+    });
+
+    form.querySelectorAll("[data-remove-url]").forEach(btn => {
+        btn.addEventListener("click", event => {
+            event.preventDefault();
+            delete pending[btn.closest(".cart-item").dataset.productId];
+            send(btn.dataset.removeUrl)
+                .then(apply)
+                .catch(error => showError(error.message));
+        });
+    });
+
+    // "Update cart" sends every quantity on the page at once
+    form.addEventListener("submit", event => {
+        event.preventDefault();
+        form.querySelectorAll(".qty-input").forEach(input => {
+            pending[input.closest(".cart-item").dataset.productId] = input.value;
+        });
+        clearTimeout(timer);
+        flush();
+    });
+
+});
@@ -3,7 +3,7 @@ document.addEventListener("DOMContentLoaded", () => {
     // SEE MORE / LESS
     document.querySelectorAll(".see-more").forEach(btn => {
         btn.addEventListener("click", () => {
-            const id = btn.dataset.post;
+            const id = btn.dataset.id;
             const text = document.getElementById("text-" + id);
 
             text.classList.toggle("collapsed");
@@ -15,29 +15,37 @@ document.addEventListener("DOMContentLoaded", () => {
 
     // IMAGE SLIDER
     document.querySelectorAll(".slider").forEach(slider => {
-        const postId = slider.dataset.post;
+        const postId = slider.dataset.id;
         const imgEl = slider.querySelector(".slider-img");
         const data = document.getElementById("images-" + postId);
+        const srcsetData = document.getElementById("srcsets-" + postId);
 
         if (!data) return;
 
         const images = JSON.parse(data.textContent);
+        const srcsets = srcsetData ? JSON.parse(srcsetData.textContent) : [];
         let index = 0;
 
+        // srcset wins over src, so both have to move together
+        const show = () => {
+            imgEl.srcset = srcsets[index] || "";
+            imgEl.src = "/static/" + images[index];
+        };
+
         const left = slider.querySelector(".left");
         const right = slider.querySelector(".right");
 
         if (left) {
             left.addEventListener("click", () => {
                 index = (index - 1 + images.length) % images.length;
-                imgEl.src = "/static/" + images[index];
+                show();
             });
         }
 
         if (right) {
             right.addEventListener("click", () => {
                 index = (index + 1) % images.length;
-                imgEl.src = "/static/" + images[index];
+                show();
             });
         }
     });
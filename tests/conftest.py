@@ -0,0 +1,70 @@
+"""Every test runs against one throwaway database and app instance.
+
+The app reads its configuration from the environment when it is first
+imported, so that is set up here before any test module imports it.
+"""
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp = tempfile.mkdtemp(prefix="school-tests-")
+os.environ.update({
+    "DATABASE_PATH": os.path.join(_tmp, "test.db"),
+    "FLASK_SECRET_KEY": "test",
+    "PAYFAST_MERCHANT_ID": "10000100",
+    # Nothing listens here, so validation fails fast unless a test points
+    # the client at payfast_stub
+    "PAYFAST_ITN_VALIDATION_URL": "http://127.0.0.1:9/eng/query/validate",
+    "ITN_INLINE_WORKER": "0",
+    "METRICS_DIR": os.path.join(_tmp, "metrics"),
+    "SLOW_QUERY_LOG": "",
+    "PROFILE_DIR": os.path.join(_tmp, "profiles"),
+    "STATIC_FINGERPRINT": "0",
+})
+
+import app as shop_app  # noqa: E402
+
+
+@pytest.fixture
+def app_module():
+    return shop_app
+
+
+@pytest.fixture
+def client():
+    return shop_app.app.test_client()
+
+
+@pytest.fixture
+def conn():
+    conn = shop_app.open_connection()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def payfast_stub():
+    """A local PayFast validation endpoint that answers VALID; yields its URL."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.send_response(200)
+            self.send_header("Content-Length", "5")
+            self.end_headers()
+            self.wfile.write(b"VALID")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/eng/query/validate"
+    server.shutdown()
+    server.server_close()
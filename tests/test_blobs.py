@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def store(app_module, monkeypatch, tmp_path):
+    monkeypatch.setattr(app_module, "STATIC_FOLDER", str(tmp_path))
+    return tmp_path
+
+
+def test_add_blob_leaves_the_callers_transaction_alone(app_module, conn, store, tmp_path):
+    source = tmp_path / "upload.png"
+    source.write_bytes(b"\x89PNG test")
+    conn.execute("INSERT INTO blobs (digest, path, size, refcount) VALUES ('ef56', 'uploads/cas/ef/ef56.png', 9, 1)")
+
+    with pytest.raises(app_module.sqlite3.ProgrammingError):
+        app_module.add_blob(conn, str(source), "ab12", 9, "png")
+
+    # Nothing was committed for the caller and nothing was placed
+    assert conn.in_transaction
+    conn.rollback()
+    assert conn.execute("SELECT COUNT(*) FROM blobs WHERE digest IN ('ab12', 'ef56')").fetchone()[0] == 0
+    assert source.exists()
+
+
+def test_add_and_release_blob(app_module, conn, store, tmp_path):
+    source = tmp_path / "upload.png"
+    source.write_bytes(b"\x89PNG test")
+
+    path = app_module.add_blob(conn, str(source), "cd34", 9, "png")
+    assert not conn.in_transaction
+    assert os.path.exists(os.path.join(store, path))
+
+    assert app_module.release_blob(conn, path) is True
+    assert not os.path.exists(os.path.join(store, path))
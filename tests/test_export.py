@@ -0,0 +1,20 @@
+def admin(client):
+    with client.session_transaction() as s:
+        s["admin_logged_in"] = True
+    return client
+
+
+def test_empty_csv_export_has_header(client):
+    response = admin(client).get("/admin/export/orders.csv", query_string={"since": "2999-01-01"})
+    assert response.status_code == 200
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines == [
+        "id,created_at,status,customer_name,customer_phone,subtotal,delivery_fee,"
+        "school_amount,supplier_amount,courier_amount,total_amount"
+    ]
+
+
+def test_empty_ndjson_export_is_empty(client):
+    response = admin(client).get("/admin/export/items.ndjson", query_string={"since": "2999-01-01"})
+    assert response.status_code == 200
+    assert response.get_data() == b""
@@ -0,0 +1,92 @@
+import json
+
+
+def enqueue_order_itn(conn, total):
+    order_id = conn.execute(
+        "INSERT INTO orders (customer_name, subtotal, delivery_fee, total_amount, status) "
+        "VALUES ('x', ?, 0, ?, 'pending')",
+        (total, total)
+    ).lastrowid
+    itn_id = conn.execute(
+        "INSERT INTO itn_inbox (source, payload) VALUES ('payment_itn', ?)",
+        (json.dumps({
+            "merchant_id": "10000100", "m_payment_id": str(order_id),
+            "payment_status": "COMPLETE", "amount_gross": str(total),
+        }),)
+    ).lastrowid
+    conn.commit()
+    return order_id, itn_id
+
+
+def make_due(conn, itn_id):
+    conn.execute("UPDATE itn_inbox SET next_attempt_at = 0 WHERE id = ?", (itn_id,))
+    conn.commit()
+
+
+def test_payfast_outage_does_not_use_up_attempts(app_module, conn, monkeypatch, payfast_stub):
+    client = app_module.payfast_client
+    monkeypatch.setattr(client, "breaker", app_module.CircuitBreaker(2, 3600))
+    order_id, itn_id = enqueue_order_itn(conn, 120.0)
+
+    # Connection errors trip the breaker, then it refuses calls outright;
+    # far more rounds than ITN_MAX_ATTEMPTS either way
+    for _ in range(app_module.ITN_MAX_ATTEMPTS * 2):
+        make_due(conn, itn_id)
+        app_module.process_itn_inbox()
+    assert client.breaker.state == "open"
+
+    row = conn.execute("SELECT * FROM itn_inbox WHERE id = ?", (itn_id,)).fetchone()
+    assert row["status"] == "pending"
+    assert row["attempts"] == 0
+    assert "circuit is open" in row["last_error"]
+
+    # Once PayFast answers again the same row goes through
+    monkeypatch.setattr(client, "url", payfast_stub)
+    monkeypatch.setattr(client, "breaker", app_module.CircuitBreaker(2, 3600))
+    make_due(conn, itn_id)
+    app_module.process_itn_inbox()
+    row = conn.execute("SELECT * FROM itn_inbox WHERE id = ?", (itn_id,)).fetchone()
+    assert row["status"] == "done"
+    order = conn.execute("SELECT status FROM orders WHERE id = ?", (order_id,)).fetchone()
+    assert order["status"] == "paid"
+
+
+def test_requeue_puts_failed_itns_back(app_module, conn):
+    _, failed_id = enqueue_order_itn(conn, 10.0)
+    _, done_id = enqueue_order_itn(conn, 20.0)
+    conn.execute(
+        "UPDATE itn_inbox SET status = 'failed', attempts = 8, processed_at = CURRENT_TIMESTAMP WHERE id = ?",
+        (failed_id,)
+    )
+    conn.execute("UPDATE itn_inbox SET status = 'done' WHERE id = ?", (done_id,))
+    conn.commit()
+    assert app_module.itn_health(conn)["failed"] >= 1
+
+    result = app_module.app.test_cli_runner().invoke(
+        args=["itn-requeue", str(failed_id), str(done_id)]
+    )
+    assert result.exit_code == 0, result.output
+
+    rows = {row["id"]: row for row in conn.execute(
+        "SELECT * FROM itn_inbox WHERE id IN (?, ?)", (failed_id, done_id)
+    )}
+    assert rows[failed_id]["status"] == "pending"
+    assert rows[failed_id]["attempts"] == 0
+    assert rows[failed_id]["next_attempt_at"] == 0
+    assert rows[done_id]["status"] == "done"
+
+
+def test_itn_that_kills_its_worker_runs_out_of_attempts(app_module, conn, monkeypatch):
+    # Every lease has run out by the next claim, as if each worker died
+    monkeypatch.setattr(app_module, "ITN_LEASE", -1)
+    _, itn_id = enqueue_order_itn(conn, 30.0)
+
+    for attempt in range(1, app_module.ITN_MAX_ATTEMPTS + 1):
+        claimed = {row["id"]: row for row in app_module.claim_itns(conn, 100)}
+        assert claimed[itn_id]["attempts"] == attempt
+
+    assert itn_id not in {row["id"] for row in app_module.claim_itns(conn, 100)}
+    row = conn.execute("SELECT * FROM itn_inbox WHERE id = ?", (itn_id,)).fetchone()
+    assert row["status"] == "failed"
+    assert row["attempts"] == app_module.ITN_MAX_ATTEMPTS
+    assert "worker died" in row["last_error"]
@@ -0,0 +1,21 @@
+import pytest
+
+
+@pytest.mark.parametrize("name, phone", [("z", ""), ("J. K.", ""), ("", "n/a")])
+def test_filter_with_nothing_to_look_up_is_rejected(app_module, client, name, phone):
+    with pytest.raises(app_module.OrderFilterRejected):
+        app_module.order_filters(name, phone)
+
+    with client.session_transaction() as s:
+        s["admin_logged_in"] = True
+    response = client.get("/admin/book-orders", query_string={"name": name, "phone": phone})
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert 'class="filter-error"' in page
+    assert 'class="order-card"' not in page
+
+
+def test_initials_are_left_out_of_a_name_filter(app_module):
+    filters, params = app_module.order_filters("J Smith")
+    assert len(filters) == 1
+    assert params[1] == app_module.blind_index("name_prefix", "smith")
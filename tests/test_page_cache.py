@@ -0,0 +1,16 @@
+def test_public_page_never_depends_on_the_session(app_module, client):
+    app_module.page_cache.clear()
+    with client.session_transaction() as s:
+        # A pre-database cart gets moved on first read, rewriting the cookie
+        s["cart"] = {"1": 2}
+
+    for _ in range(2):  # a cache miss, then a hit
+        response = client.get("/")
+        assert response.status_code == 200
+        assert response.cache_control.public
+        assert "Set-Cookie" not in response.headers
+        assert "Cookie" not in response.vary
+
+
+def test_page_cache_is_bounded(app_module):
+    assert app_module.page_cache.maxsize == app_module.app.config["PAGE_CACHE_SIZE"]
@@ -0,0 +1,29 @@
+import base64
+import json
+
+import pytest
+
+
+def cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("values", [
+    [{"a": 1}],
+    [[1]],
+    [None],
+    [True],
+    [1, 2, 3],
+    {"id": 1},
+])
+def test_malformed_cursor_is_ignored(app_module, client, values):
+    assert app_module.decode_cursor(cursor(values), 1) is None
+    assert client.get("/shop", query_string={"after": cursor(values)}).status_code == 200
+    assert client.get("/shop", query_string={"before": cursor(values), "q": "maths"}).status_code == 200
+
+
+def test_cursor_round_trip(app_module):
+    token = app_module.encode_cursor(["2026-01-01 10:00:00", 7])
+    assert app_module.decode_cursor(token, 2) == ["2026-01-01 10:00:00", 7]
+    assert app_module.decode_cursor(token, 1) is None
+    assert app_module.decode_cursor("not base64!", 1) is None
@@ -0,0 +1,38 @@
+import time
+
+
+def test_idle_plaintexts_are_zeroed_after_ttl(app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, "PII_CACHE_TTL", 0.2)
+    monkeypatch.setattr(app_module.pii_caches, "ttl", 0.2)
+    monkeypatch.setattr(app_module, "PII_SWEEP_INTERVAL", 0.05)
+    token = app_module.encrypt_text("Thandi Mokoena")
+
+    with app_module.app.test_request_context("/admin/book-orders"):
+        app_module.session["admin_logged_in"] = True
+        assert app_module.decrypt_batch([token])[token] == "Thandi Mokoena"
+        cache_id = app_module.session["pii_cache_id"]
+        cache = app_module.pii_caches.get(cache_id)
+        buffer = cache.get(token)
+        assert bytes(buffer) == b"Thandi Mokoena"
+
+    # Nobody reads the session's cache again; the sweeper still clears it
+    deadline = time.monotonic() + 5
+    while any(buffer) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not any(buffer)
+    assert all(other is not cache for other in app_module.pii_caches.values())
+    assert cache.stats()["size"] == 0
+
+
+def test_lru_cache_sweeps_expired_entries_on_set(app_module, monkeypatch):
+    evicted = []
+    cache = app_module.LRUCache(10, 0.05, on_evict=evicted.append)
+    cache.set("idle", "value")
+    time.sleep(0.1)
+    cache.purge_expired()
+    assert evicted == ["value"]
+
+    cache.set("a", 1)
+    time.sleep(1.1)
+    cache.set("b", 2)
+    assert evicted == ["value", 1]
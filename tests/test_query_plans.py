@@ -0,0 +1,150 @@
+"""No statement the routes run may fall back to a full table scan.
+
+Drives the public, cart, checkout, ITN and admin routes through the test
+client, records every statement and checks its EXPLAIN QUERY PLAN. A
+"SCAN t" step passes only when it walks an index (or the rowid, which is
+the table's own index) in the requested order and the statement stops at
+a LIMIT (keyset pages), when `t` is one of the fixed-size tables in
+SMALL_TABLES, or when the statement is listed in ALLOWED_SCANS.
+"""
+import re
+
+import pytest
+
+# sqlite_master is the schema itself; products_fts_config is FTS5's
+# handful of settings rows, read when the index is opened
+SMALL_TABLES = {"stats", "catalog_version", "sqlite_master", "products_fts_config"}
+# Statements allowed to scan, with the reason
+ALLOWED_SCANS = {
+    "SELECT status, COUNT(*) FROM itn_inbox GROUP BY status": "db-stats diagnostics, covering index",
+}
+SCAN_RE = re.compile(r"^SCAN (?:\w+\.)?(\w+)(.*)$")
+ROWS = 200
+
+
+def populate(conn):
+    conn.executemany(
+        "INSERT INTO posts (title, description) VALUES (?, ?)",
+        ((f"Post {i}", "Body") for i in range(ROWS))
+    )
+    first_post = conn.execute("SELECT MIN(id) FROM posts").fetchone()[0]
+    conn.executemany(
+        "INSERT INTO post_media (post_id, file_path, media_type) VALUES (?, ?, 'image')",
+        ((first_post + i % ROWS, f"uploads/{i}.jpg") for i in range(ROWS * 2))
+    )
+    conn.executemany(
+        "INSERT INTO admissions (learner_name, parent_name, phone, grade) VALUES (?, ?, ?, ?)",
+        ((f"Learner {i}", "Parent", "0820000000", "8") for i in range(ROWS))
+    )
+    conn.commit()
+    return first_post
+
+
+def expect(response, status):
+    # A failing or redirected route runs fewer queries and would pass
+    # the plan check without really being checked
+    response.get_data()
+    assert response.status_code == status, (
+        f"{response.request.method} {response.request.full_path}: "
+        f"expected {status}, got {response.status_code}"
+    )
+    return response
+
+
+def drive(app_module, client, conn, first_post):
+    for url in ("/", "/news", "/shop", "/shop?q=math", "/product/1", "/cart", "/admissions"):
+        expect(client.get(url), 200)
+    expect(client.get("/add-to-cart/1"), 302)
+    expect(client.get("/add-to-cart/2"), 302)
+    expect(client.post("/api/cart/add/3", json={"quantity": 2}), 200)
+    expect(client.post("/api/cart/update", json={"lines": {"3": 1, "2": 2}}), 200)
+    expect(client.post("/api/cart/remove/3"), 200)
+    expect(client.get("/api/cart"), 200)
+    expect(client.get("/checkout"), 200)
+    response = expect(client.post("/checkout", data={"name": "Jane Doe", "phone": "0821234567"}), 302)
+    order_id = int(response.headers["Location"].rsplit("/", 1)[1])
+    expect(client.get(f"/payfast/checkout/{order_id}"), 200)
+
+    total = conn.execute("SELECT total_amount FROM orders WHERE id = ?", (order_id,)).fetchone()[0]
+    expect(client.post("/payment/itn", data={
+        "merchant_id": "10000100", "m_payment_id": str(order_id),
+        "payment_status": "COMPLETE", "amount_gross": str(total),
+    }), 200)
+    app_module.process_itn_inbox()
+
+    with client.session_transaction() as s:
+        s["admin_logged_in"] = True
+    for url in (
+        "/admin/dashboard",
+        "/admin/admissions",
+        "/admin/book-orders",
+        "/admin/book-orders?name=jane&phone=4567",
+        "/admin/db-stats",
+        "/admin/export/orders.csv?since=2000-01-01",
+        "/admin/export/items.ndjson",
+        "/admin/export/admissions.csv",
+    ):
+        expect(client.get(url), 200)
+    admission_id = conn.execute("SELECT MAX(id) FROM admissions").fetchone()[0]
+    expect(client.post(f"/admin/mark_paid/{admission_id}"), 302)
+    expect(client.post(f"/admin/delete-post/{first_post}"), 302)
+
+
+def full_scans(conn, sql):
+    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+    if " ".join(sql.split()) in ALLOWED_SCANS:
+        return []
+    ordered = not any("TEMP B-TREE" in step for step in plan)
+    limited = re.search(r"\bLIMIT\b", sql, re.IGNORECASE) is not None
+    bad = []
+    for step in plan:
+        match = SCAN_RE.match(step)
+        if not match:
+            continue
+        table, rest = match.groups()
+        if table in SMALL_TABLES or "VIRTUAL TABLE" in rest:
+            continue
+        if ordered and limited:
+            continue
+        bad.append(step)
+    return bad
+
+
+@pytest.fixture
+def statements(app_module, monkeypatch):
+    """Every statement run on a connection opened while the test runs."""
+    recorded = []
+    open_connection = app_module.open_connection
+
+    def traced_connection(factory=app_module.sqlite3.Connection):
+        conn = open_connection(factory=factory)
+        own = getattr(conn, "_traced", None)
+
+        def trace(sql):
+            recorded.append(sql)
+            if own is not None:
+                own(sql)
+
+        conn.set_trace_callback(trace)
+        return conn
+
+    monkeypatch.setattr(app_module, "open_connection", traced_connection)
+    # A pool of its own, so every request connection is traced
+    monkeypatch.setattr(app_module, "_pool", None)
+    return recorded
+
+
+def test_routes_use_indexes(app_module, client, conn, statements, monkeypatch):
+    monkeypatch.setattr(app_module, "validate_itn", lambda data: True)
+    drive(app_module, client, conn, populate(conn))
+
+    checked = {}
+    for sql in statements:
+        sql = sql.strip()
+        if sql in checked or not re.match(r"(SELECT|UPDATE|DELETE|WITH)\b", sql, re.IGNORECASE):
+            continue
+        checked[sql] = full_scans(conn, sql)
+
+    assert len(checked) > 30, "the routes ran fewer statements than expected"
+    failures = {" ".join(sql.split())[:160]: bad for sql, bad in checked.items() if bad}
+    assert not failures, failures